@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -49,6 +50,14 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'alx_travel_app.urls'
+# Serve the async variants of the payment and listing read views; asgi.py turns this
+# on unless ASYNC_VIEWS is set, WSGI deployments keep the sync views
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Prometheus-style metrics at /metrics (listings/metrics.py); with METRICS_TOKEN set,
+# scrapers must send "Authorization: Bearer <token>"
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
 
 TEMPLATES = [
     {
@@ -84,6 +93,39 @@ DATABASES = {
         },
     }
 }
+# DATABASE_URL / REPLICA_DATABASE_URL (e.g. sqlite:////tmp/primary.sqlite3) replace the
+# MySQL settings above; two SQLite files are enough to exercise replica routing locally
+if env('DATABASE_URL', default=''):
+    DATABASES['default'] = env.db('DATABASE_URL')
+if env('REPLICA_DATABASE_URL', default=''):
+    DATABASES['replica'] = env.db('REPLICA_DATABASE_URL')
+elif env('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': env('DB_REPLICA_HOST'),
+        'PORT': env('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        # Tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+# Persistent connections, checked before reuse at the start of each request
+for _database in DATABASES.values():
+    _database.setdefault('CONN_MAX_AGE', env.int('DB_CONN_MAX_AGE', default=60))
+    _database.setdefault('CONN_HEALTH_CHECKS', True)
+# ListingViewSet reads go to the 'replica' alias when it exists (see listings/routers.py)
+DATABASE_ROUTERS = ['listings.routers.ReplicaRouter']
+
+
+# Cache (locmem by default; set CACHE_URL=rediscache://... to share across processes)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Listing reads: Cache-Control max-age in seconds (0 = always revalidate with the ETag),
+# and how long serialized responses stay in the cache above (0 disables the response cache)
+LISTING_CACHE_MAX_AGE = env.int('LISTING_CACHE_MAX_AGE', default=0)
+LISTING_RESPONSE_CACHE_TIMEOUT = env.int('LISTING_RESPONSE_CACHE_TIMEOUT', default=0)
+# With a replica, responses read from it are not cached for this long after a write,
+# so data the replica has not caught up with is never cached under the new version
+LISTING_REPLICA_LAG_SECONDS = env.int('LISTING_REPLICA_LAG_SECONDS', default=5)
 
 
 # Password validation
@@ -134,7 +176,19 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # Token buckets on the payment endpoints (listings/throttling.py): "<burst>/<period>",
+    # refilled at burst per period, per client IP and per booking / tx_ref
+    'DEFAULT_THROTTLE_RATES': {
+        'payments': env('PAYMENT_THROTTLE_RATE', default='30/min'),
+        'payment-target': env('PAYMENT_TARGET_THROTTLE_RATE', default='10/min'),
+    },
 }
+# Render JSON with orjson (same bytes as DRF's JSONRenderer; needs `pip install orjson`)
+if env.bool('ORJSON_RENDERER', default=False):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'listings.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
 
 # CORS
 CORS_ALLOWED_ORIGINS = [
@@ -147,6 +201,32 @@ CORS_ALLOW_CREDENTIALS = True
 CHAPA_SECRET_KEY = env("CHAPA_SECRET_KEY", default="")
 CHAPA_API_URL = env("CHAPA_API_URL", default="https://api.chapa.co/v1")
 CHAPA_WEBHOOK_CALLBACK_URL = env("CHAPA_WEBHOOK_CALLBACK_URL", default="")
+# Initiate Chapa payments in a Celery task and return 202 instead of blocking the request
+CHAPA_ASYNC_INITIATION = env.bool("CHAPA_ASYNC_INITIATION", default=False)
+# Pooled HTTP client: timeouts in seconds, retries apply to verification only
+CHAPA_CONNECT_TIMEOUT = env.float("CHAPA_CONNECT_TIMEOUT", default=3.05)
+CHAPA_READ_TIMEOUT = env.float("CHAPA_READ_TIMEOUT", default=15.0)
+CHAPA_POOL_MAXSIZE = env.int("CHAPA_POOL_MAXSIZE", default=20)
+CHAPA_VERIFY_RETRIES = env.int("CHAPA_VERIFY_RETRIES", default=2)
+CHAPA_RETRY_BACKOFF = env.float("CHAPA_RETRY_BACKOFF", default=0.5)
+CHAPA_BREAKER_FAILURE_THRESHOLD = env.int("CHAPA_BREAKER_FAILURE_THRESHOLD", default=5)
+CHAPA_BREAKER_RESET_TIMEOUT = env.float("CHAPA_BREAKER_RESET_TIMEOUT", default=30.0)
+# Admission control: most Chapa calls in flight per process, seconds to wait for a free
+# slot, and the Retry-After (seconds) of the 503 returned when none frees up
+CHAPA_MAX_IN_FLIGHT = env.int("CHAPA_MAX_IN_FLIGHT", default=CHAPA_POOL_MAXSIZE)
+CHAPA_ADMISSION_WAIT = env.float("CHAPA_ADMISSION_WAIT", default=0.25)
+CHAPA_BUSY_RETRY_AFTER = env.int("CHAPA_BUSY_RETRY_AFTER", default=1)
+# Async views (listings/async_views.py) hold Chapa calls on the event loop rather than
+# threads, so their cap, per event loop (ASGI worker), can be much higher
+CHAPA_ASYNC_MAX_IN_FLIGHT = env.int("CHAPA_ASYNC_MAX_IN_FLIGHT", default=500)
+# POST /api/bookings/bulk/: most bookings per request, and concurrent Chapa initiations
+BULK_BOOKING_MAX_ITEMS = env.int("BULK_BOOKING_MAX_ITEMS", default=100)
+CHAPA_BULK_CONCURRENCY = env.int("CHAPA_BULK_CONCURRENCY", default=8)
+# Verification dedupe, in seconds: final result cache TTL, per-tx_ref lock timeout,
+# and how long callers that waited on the lock can read a non-final result
+CHAPA_VERIFY_CACHE_TTL = env.int("CHAPA_VERIFY_CACHE_TTL", default=10)
+CHAPA_VERIFY_LOCK_TIMEOUT = env.int("CHAPA_VERIFY_LOCK_TIMEOUT", default=30)
+CHAPA_VERIFY_PENDING_TTL = env.int("CHAPA_VERIFY_PENDING_TTL", default=5)
 
 # Email Configuration
 EMAIL_BACKEND = env("EMAIL_BACKEND", default="django.core.mail.backends.console.EmailBackend")
@@ -156,6 +236,16 @@ EMAIL_USE_TLS = env.bool("EMAIL_USE_TLS", default=True)
 EMAIL_HOST_USER = env("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="noreply@alxtravelapp.local")
+# Confirmation emails are sent this long after the payment completes, so confirmations
+# within the window go out in one task over one connection; the sweep below is the fallback
+CONFIRMATION_EMAIL_BATCH_WINDOW_MS = env.int("CONFIRMATION_EMAIL_BATCH_WINDOW_MS", default=250)
+CONFIRMATION_EMAIL_BATCH_SIZE = env.int("CONFIRMATION_EMAIL_BATCH_SIZE", default=100)
+# Daily stats rollups: booking changes within this window (ms) are refreshed by one task,
+# spans per transaction; the sweep below picks up spans whose task was lost
+LISTING_STATS_REFRESH_WINDOW_MS = env.int("LISTING_STATS_REFRESH_WINDOW_MS", default=1000)
+LISTING_STATS_REFRESH_BATCH_SIZE = env.int("LISTING_STATS_REFRESH_BATCH_SIZE", default=500)
+# Nights ahead of today covered by each listing's compiled rate calendar (listings/pricing.py)
+PRICING_CALENDAR_DAYS = env.int("PRICING_CALENDAR_DAYS", default=730)
 
 # Celery Configuration
 CELERY_BROKER_URL = env("CELERY_BROKER_URL", default="redis://localhost:6379/0")
@@ -163,4 +253,34 @@ CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND", default="redis://localhost:
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
-CELERY_TIMEZONE = TIME_ZONE
\ No newline at end of file
+CELERY_TIMEZONE = TIME_ZONE
+
+# Stale PENDING payments are re-verified against Chapa by the reconcile_payments task
+PAYMENT_RECONCILE_AFTER_MINUTES = env.int("PAYMENT_RECONCILE_AFTER_MINUTES", default=30)
+PAYMENT_RECONCILE_CONCURRENCY = env.int("PAYMENT_RECONCILE_CONCURRENCY", default=8)
+# Unpaid PENDING bookings release their nights this long after creation (0 keeps them
+# forever); longer than the reconcile threshold so late payments are verified first
+BOOKING_HOLD_MINUTES = env.int("BOOKING_HOLD_MINUTES", default=60)
+BOOKING_HOLD_BATCH_SIZE = env.int("BOOKING_HOLD_BATCH_SIZE", default=1000)
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-pending-payments": {
+        "task": "listings.tasks.reconcile_payments",
+        "schedule": env.int("PAYMENT_RECONCILE_INTERVAL_SECONDS", default=900),
+    },
+    "expire-booking-holds": {
+        "task": "listings.tasks.expire_booking_holds",
+        "schedule": env.int("BOOKING_HOLD_SWEEP_INTERVAL_SECONDS", default=60),
+    },
+    "send-due-confirmation-emails": {
+        "task": "listings.tasks.send_due_confirmation_emails",
+        "schedule": env.int("CONFIRMATION_EMAIL_SWEEP_INTERVAL_SECONDS", default=60),
+    },
+    "refresh-listing-stats": {
+        "task": "listings.tasks.refresh_listing_stats",
+        "schedule": env.int("LISTING_STATS_SWEEP_INTERVAL_SECONDS", default=60),
+    },
+    "roll-rate-calendars": {
+        "task": "listings.tasks.roll_rate_calendars",
+        "schedule": 24 * 60 * 60,
+    },
+}
@@ -1,13 +1,23 @@
 from django.contrib import admin
-from .models import Listing, Booking, Review, Payment
+from .models import Listing, Booking, PricingRule, Review, Payment
+
+
+class PricingRuleInline(admin.TabularInline):
+    model = PricingRule
+    extra = 0
+    fields = ['kind', 'multiplier', 'start_date', 'end_date', 'min_nights']
 
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ['id', 'title', 'location', 'price_per_night', 'max_guests', 'created_at']
+    list_display = [
+        'id', 'title', 'location', 'price_per_night', 'max_guests', 'avg_rating', 'review_count',
+        'created_at',
+    ]
     list_filter = ['created_at', 'location']
     search_fields = ['title', 'location', 'description']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [PricingRuleInline]
 
 
 @admin.register(Booking)
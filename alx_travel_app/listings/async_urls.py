@@ -0,0 +1,11 @@
+"""
+Root URLconf serving the async views whatever ASYNC_VIEWS says, so tests
+and the gateway-load benchmark can drive both stacks in one process.
+"""
+from django.urls import include, path
+
+from alx_travel_app.urls import urlpatterns as project_urlpatterns
+
+from .urls import async_urlpatterns
+
+urlpatterns = [path('api/', include(async_urlpatterns))] + project_urlpatterns
@@ -0,0 +1,357 @@
+"""
+Async variants of the payment and listing read views, for ASGI deployments.
+
+Under ASGI a sync view holds a thread for its whole run, Chapa round-trip
+included, so a worker serves at most as many payment calls as it has
+threads. These views await Chapa on the event loop (the a-prefixed
+functions of listings.payment_utils) and the database through Django's
+async ORM interface, so one worker can hold hundreds of gateway calls in
+flight. They answer like their counterparts in listings.views: same
+status codes, bodies, throttles and cache headers.
+
+Work with no async form (the row-locking transaction of
+Payment.mark_completed, throttle buckets, queueing emails and Celery
+tasks) runs through sync_to_async. listings.urls routes to these views
+when ASYNC_VIEWS is set, which asgi.py does by default; write methods on
+the listing URLs still go to ListingViewSet.
+"""
+import logging
+import uuid
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, Throttled
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .email_batching import queue_confirmation_email
+from .filtering import filter_listings
+from .http_cache import acached_read, object_validators, page_validators
+from .models import Booking, Listing, Payment
+from .pagination import OptInKeysetPagination
+from .payment_utils import FAILED_STATUSES, ainitiate_booking_payment, averify_chapa_payment_cached
+from .routers import replica_reads
+from .serializers import ListingSerializer, listing_rows
+from .throttling import PaymentRateThrottle, PaymentTargetThrottle
+from .views import (
+    ListingViewSet, _gateway_unavailable_response, _payment_session, _payment_verified_response,
+    _queue_payment_initiation,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def async_api_view(methods, fallback=None):
+    """
+    Serve ``methods`` with an async view, as @api_view does for sync ones.
+
+    The view gets a DRF Request and its response is content-negotiated,
+    finalized and rendered by an APIView, as DRF would; DRF exceptions (and
+    Http404) become the responses DRF would send, and like every DRF view
+    it is CSRF-exempt. Other methods go to the sync view ``fallback`` on a
+    thread, or get OPTIONS metadata or a 405.
+    """
+    def decorator(view):
+        served = {method.lower() for method in methods} | {"options"}
+        if fallback is not None:
+            served |= {*fallback.actions, "head"}
+        # Supplies negotiation, exception handling and the renderer context
+        allowed = [method.upper() for method in APIView.http_method_names if method in served]
+        view_class = type(view.__name__, (APIView,), {"allowed_methods": allowed})
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods and fallback is not None:
+                return await sync_to_async(fallback)(request, *args, **kwargs)
+            api_view = view_class(args=args, kwargs=kwargs)
+            request = Request(
+                request,
+                parsers=api_view.get_parsers(),
+                negotiator=api_view.get_content_negotiator(),
+                parser_context=api_view.get_parser_context(request),
+            )
+            api_view.request = request
+            api_view.headers = api_view.default_response_headers
+            api_view.format_kwarg = api_view.get_format_suffix(**kwargs)
+            try:
+                negotiated = api_view.perform_content_negotiation(request)
+                request.accepted_renderer, request.accepted_media_type = negotiated
+                if request.method in methods:
+                    response = await view(request, *args, **kwargs)
+                elif request.method == "OPTIONS":
+                    response = api_view.options(request, *args, **kwargs)
+                else:
+                    raise MethodNotAllowed(request.method)
+            except (APIException, Http404) as exc:
+                response = api_view.handle_exception(exc)
+            response = api_view.finalize_response(request, response, *args, **kwargs)
+            if isinstance(response, Response):
+                response.render()
+            return response
+
+        # Django 4.2's csrf_exempt() wraps views in a sync function
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def _check_payment_throttles(request, **kwargs):
+    """Take tokens from the payment throttles, raising Throttled like APIView.check_throttles."""
+    view = SimpleNamespace(kwargs=kwargs)
+
+    def waits():
+        throttles = (PaymentRateThrottle(), PaymentTargetThrottle())
+        return [
+            throttle.wait() for throttle in throttles if not throttle.allow_request(request, view)
+        ]
+
+    waits = await sync_to_async(waits)()
+    if waits:
+        raise Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+
+_listing_list = ListingViewSet.as_view(
+    {"get": "list", "post": "create"}, basename="listing", detail=False
+)
+_listing_detail = ListingViewSet.as_view(
+    {"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"},
+    basename="listing",
+    detail=True,
+)
+
+
+@async_api_view(["GET", "HEAD"], fallback=_listing_list)
+async def listing_list(request):
+    """
+    ListingViewSet.list with async queries.
+    GET /api/listings/
+    """
+    paginator = OptInKeysetPagination()
+    try:
+        queryset = filter_listings(
+            Listing.objects.all(), request.query_params, keyset=paginator.wants_keyset(request)
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    queryset = queryset.values(*listing_rows.columns)
+    page = None
+
+    async def validators():
+        nonlocal page
+        page = await paginator.apaginate_queryset(queryset, request)
+        envelope = paginator.get_paginated_response([]).data
+        return page_validators(request, page, sorted(envelope.items()))
+
+    async def render():
+        return paginator.get_paginated_response(listing_rows.serialize(page))
+
+    with replica_reads():
+        return await acached_read(request, "list", validators, render)
+
+
+@async_api_view(["GET", "HEAD"], fallback=_listing_detail)
+async def listing_detail(request, pk):
+    """
+    ListingViewSet.retrieve with async queries.
+    GET /api/listings/{id}/
+    """
+    instance = None
+
+    async def validators():
+        nonlocal instance
+        instance = await Listing.objects.filter(pk=pk).afirst()
+        if instance is None:
+            raise Http404("No Listing matches the given query.")
+        return object_validators(request, instance)
+
+    async def render():
+        return Response(ListingSerializer(instance).data)
+
+    with replica_reads():
+        return await acached_read(request, "retrieve", validators, render)
+
+
+@async_api_view(["GET", "POST"])
+async def verify_payment(request):
+    """
+    views.verify_payment, awaiting Chapa and the database.
+
+    GET /api/payments/verify/?tx_ref=<transaction_reference>
+    POST /api/payments/verify/ (for webhook callbacks)
+    """
+    await _check_payment_throttles(request)
+    tx_ref = request.GET.get('tx_ref') or request.data.get('tx_ref')
+
+    if not tx_ref:
+        return Response(
+            {"error": "tx_ref parameter is required"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        payment = await Payment.objects.aget(booking_reference=tx_ref)
+    except Payment.DoesNotExist:
+        logger.error(f"Payment not found for tx_ref: {tx_ref}")
+        return Response(
+            {"error": "Payment not found"},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    if payment.status == Payment.Status.COMPLETED:
+        return _payment_verified_response(payment)
+
+    verification_result = await averify_chapa_payment_cached(tx_ref)
+
+    if verification_result.get("success"):
+        payment_status = verification_result.get("status", "").lower()
+
+        if payment_status == "success":
+            transaction_id = verification_result.get("data", {}).get("id", tx_ref)
+
+            # Only the caller that performs the transition queues the email
+            if await sync_to_async(payment.mark_completed)(transaction_id):
+                try:
+                    await sync_to_async(queue_confirmation_email)(payment.booking_id)
+                    logger.info(
+                        f"Booking confirmation email queued for booking {payment.booking_id}"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to queue confirmation email: {e}")
+            else:
+                await payment.arefresh_from_db(fields=["status", "transaction_id"])
+
+            return _payment_verified_response(payment)
+        elif payment_status in FAILED_STATUSES:
+            await sync_to_async(payment.mark_failed)()
+            await payment.arefresh_from_db(fields=["status"])
+
+            return Response(
+                {
+                    "status": "failed",
+                    "payment_status": payment.status,
+                    "message": "Payment verification failed",
+                },
+                status=status.HTTP_200_OK,
+            )
+        else:
+            # Not paid yet; the payment stays PENDING for a later callback or poll
+            return Response(
+                {
+                    "status": "pending",
+                    "payment_status": payment.status,
+                    "message": "Payment not completed yet",
+                },
+                status=status.HTTP_200_OK,
+            )
+    else:
+        error_msg = verification_result.get("error", "Payment verification failed")
+        logger.error(f"Payment verification error for tx_ref {tx_ref}: {error_msg}")
+
+        if verification_result.get("retry_after"):
+            return _gateway_unavailable_response(error_msg, verification_result["retry_after"])
+
+        return Response(
+            {
+                "status": "error",
+                "error": error_msg,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@async_api_view(["POST"])
+async def initiate_payment(request, booking_id):
+    """
+    views.initiate_payment, awaiting Chapa and the database.
+
+    POST /api/bookings/{booking_id}/initiate-payment/
+    """
+    await _check_payment_throttles(request, booking_id=booking_id)
+    booking = await Booking.objects.filter(id=booking_id).afirst()
+    if booking is None:
+        raise Http404("No Booking matches the given query.")
+
+    if booking.status == Booking.Status.CANCELLED:
+        return Response(
+            {"error": "Booking is cancelled"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    payment, created = await Payment.objects.aget_or_create(
+        booking=booking,
+        defaults={
+            "booking_reference": f"BK-{booking.id}-{uuid.uuid4().hex[:8].upper()}",
+            "amount": booking.total_price,
+            "status": Payment.Status.PENDING,
+        },
+    )
+    # Read for the guest's details; lazy loading isn't allowed here
+    payment.booking = booking
+
+    if not created and payment.status == Payment.Status.COMPLETED:
+        return Response(
+            {"error": "Payment already completed for this booking"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    callback_url = request.build_absolute_uri("/api/payments/verify/")
+
+    if settings.CHAPA_ASYNC_INITIATION:
+        payment.status = Payment.Status.PENDING
+        payment.checkout_url = None
+        await payment.asave(update_fields=["status", "checkout_url", "updated_at"])
+        await sync_to_async(_queue_payment_initiation)(payment, callback_url)
+        session = _payment_session(request, payment)
+        return Response(
+            {
+                "status": "accepted",
+                "payment": session,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": session["session_url"]},
+        )
+
+    payment_result = await ainitiate_booking_payment(payment, callback_url)
+
+    if payment_result.get("success"):
+        checkout_url = payment_result.get("checkout_url")
+        logger.info(f"Payment initiated for booking {booking.id}, checkout URL: {checkout_url}")
+
+        payment.status = Payment.Status.PENDING
+        payment.checkout_url = checkout_url
+        await payment.asave(update_fields=["status", "checkout_url", "updated_at"])
+
+        return Response(
+            {
+                "status": "success",
+                "payment": {
+                    "booking_reference": payment.booking_reference,
+                    "amount": str(payment.amount),
+                    "checkout_url": checkout_url,
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
+    else:
+        error_msg = payment_result.get("error", "Failed to initiate payment")
+        logger.error(f"Payment initiation failed for booking {booking.id}: {error_msg}")
+
+        if payment_result.get("retry_after"):
+            # Never reached Chapa: nothing failed, the client should just retry
+            return _gateway_unavailable_response(error_msg, payment_result["retry_after"])
+
+        payment.status = Payment.Status.FAILED
+        await payment.asave()
+
+        return Response(
+            {
+                "status": "error",
+                "error": error_msg,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
@@ -0,0 +1,904 @@
+"""
+Benchmark scenarios for the listings app.
+
+Each scenario is a callable that takes keyword options, runs against the
+configured database and returns a dict of measurements. Run them with
+``python manage.py benchmark <scenario>``.
+"""
+import asyncio
+import gc
+import json
+import logging
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connection, reset_queries, transaction
+from django.db.models import Max, Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from .exports import stream_export
+from .models import Listing, Booking, Payment, PricingRule
+from .pagination import KeysetPagination, OptInKeysetPagination
+from .pricing import CENT, nightly_rate, quote, stay_multiplier, stay_tiers
+from .renderers import ORJSONRenderer, orjson
+from .serializers import BookingSerializer, ListingSerializer, booking_rows, listing_rows
+from .views import ListingViewSet, BookingViewSet
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark scenario under ``name``."""
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def run_concurrently(workers, target):
+    """
+    Run ``target(worker_index)`` on ``workers`` threads released together.
+
+    Every thread closes its own database connection when done. Returns the
+    per-worker results and the wall-clock time from release to last finish.
+    """
+    barrier = threading.Barrier(workers + 1)
+    results = [None] * workers
+
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = target(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def time_calls(func, rounds):
+    """Call ``func`` ``rounds`` times and return the median latency in ms."""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of samples."""
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def write_baseline(path, scenario_name, result):
+    """Store ``result`` under ``scenario_name`` in the JSON baseline at ``path``."""
+    try:
+        baseline = load_baseline(path)
+    except FileNotFoundError:
+        baseline = {}
+    baseline[scenario_name] = result
+    with open(path, "w") as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+def compare_to_baseline(result, baseline, tolerance=1.0, path=""):
+    """
+    List regressions of ``result`` against ``baseline``.
+
+    Keys ending in ``queries`` must not grow at all; keys ending in ``_ms``
+    or ``_kb`` may grow by ``tolerance`` (a fraction) before they count.
+    Tail latencies (``p95_ms``) are too noisy on shared runners to gate on
+    and, like other keys and keys missing on either side, are ignored.
+    """
+    regressions = []
+    for key, expected in baseline.items():
+        actual = result.get(key)
+        where = f"{path}.{key}" if path else key
+        if isinstance(expected, dict) and isinstance(actual, dict):
+            regressions.extend(compare_to_baseline(actual, expected, tolerance, where))
+        elif not isinstance(expected, (int, float)) or not isinstance(actual, (int, float)):
+            continue
+        elif key.startswith("p95"):
+            continue
+        elif key.endswith("queries") and actual > expected:
+            regressions.append(f"{where}: {actual} > {expected}")
+        elif key.endswith(("_ms", "_kb")) and actual > expected * (1 + tolerance):
+            regressions.append(f"{where}: {actual} > {expected} (+{tolerance:.0%} allowed)")
+    return regressions
+
+
+@scenario("booking-contention")
+def booking_contention(workers=16, rounds=5, **options):
+    """
+    Fire ``workers`` simultaneous creates for the same listing and dates.
+
+    Each round must produce exactly one winner; everything else should be
+    rejected as a conflict rather than stored as a double booking.
+    """
+    start = date.today() + timedelta(days=30)
+    end = start + timedelta(days=3)
+    winners_per_round = []
+    conflicts = errors = double_bookings = 0
+    elapsed = 0.0
+
+    for round_no in range(rounds):
+        listing = Listing.objects.create(
+            title=f"Benchmark contention #{round_no}",
+            description="Created by the booking-contention benchmark.",
+            location="Benchmark",
+            price_per_night=Decimal("100.00"),
+            max_guests=2,
+        )
+
+        def attempt(index):
+            serializer = BookingSerializer(
+                data={
+                    "listing": listing.id,
+                    "guest_name": f"Bench Guest {index}",
+                    "guest_email": f"bench{index}@example.com",
+                    "start_date": start,
+                    "end_date": end,
+                    "total_price": "300.00",
+                }
+            )
+            try:
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                return "won"
+            except ValidationError:
+                return "conflict"
+            except Exception:
+                return "error"
+
+        try:
+            outcomes, round_elapsed = run_concurrently(workers, attempt)
+            elapsed += round_elapsed
+            winners_per_round.append(outcomes.count("won"))
+            conflicts += outcomes.count("conflict")
+            errors += outcomes.count("error")
+            double_bookings += max(Booking.objects.filter(listing=listing).count() - 1, 0)
+        finally:
+            listing.delete()
+
+    attempts = workers * rounds
+    return {
+        "workers": workers,
+        "rounds": rounds,
+        "winners_per_round": winners_per_round,
+        "exactly_one_winner": all(w == 1 for w in winners_per_round),
+        "conflicts": conflicts,
+        "errors": errors,
+        "double_bookings": double_bookings,
+        "attempts_per_sec": round(attempts / elapsed, 1) if elapsed else None,
+        "mean_round_ms": round(elapsed / rounds * 1000, 2) if rounds else None,
+    }
+
+
+@scenario("pagination-depth")
+def pagination_depth(page=10000, rounds=5, **options):
+    """
+    Compare page 1 and page ``page`` latency for offset and keyset pagination.
+
+    Requests go through the list views, so timings include serialization.
+    The deep page is clamped to the last full page of the seeded data;
+    seed at least ``page * PAGE_SIZE`` rows for a like-for-like run.
+    """
+    factory = APIRequestFactory()
+    page_size = OptInKeysetPagination.page_size
+    results = {}
+
+    endpoints = (("listings", ListingViewSet, Listing), ("bookings", BookingViewSet, Booking))
+    for name, viewset, model in endpoints:
+        view = viewset.as_view({"get": "list"})
+        rows = model.objects.count()
+        deep = max(min(page, rows // page_size), 1)
+        deep_cursor = {"pagination": "cursor"}
+        if deep > 1:
+            # The last row of the page before the deep one
+            cursor_row = model.objects.order_by("-created_at", "-id")[(deep - 1) * page_size - 1]
+            deep_cursor = {"cursor": KeysetPagination().encode_cursor(cursor_row)}
+
+        def fetch(params):
+            request = factory.get(f"/api/{name}/", params, SERVER_NAME="localhost")
+            return lambda: view(request).render()
+
+        results[name] = {
+            "rows": rows,
+            "deep_page": deep,
+            "offset_page_1_ms": time_calls(fetch({"page": 1}), rounds),
+            "offset_deep_page_ms": time_calls(fetch({"page": deep}), rounds),
+            "keyset_page_1_ms": time_calls(fetch({"pagination": "cursor"}), rounds),
+            "keyset_deep_page_ms": time_calls(fetch(deep_cursor), rounds),
+        }
+    return results
+
+
+def seed_dataset(listings, bookings_per_listing=0, reviews_per_listing=0, batch_size=1000):
+    """
+    Bulk-seed ``listings`` listings after the existing rows.
+
+    Meant to run inside a transaction the caller rolls back. Returns a
+    queryset of the new listings.
+    """
+    from .management.commands.seed import seed_bulk_range
+
+    listing_base = Listing.objects.aggregate(m=Max("id"))["m"] or 0
+    plan = {
+        "listing_base": listing_base,
+        "booking_base": Booking.objects.aggregate(m=Max("id"))["m"] or 0,
+        "bookings_per_listing": bookings_per_listing,
+        "reviews_per_listing": reviews_per_listing,
+        "batch_size": batch_size,
+        "per_chunk_commit": False,
+        "today": date.today(),
+    }
+    seed_bulk_range(1, listings, plan)
+    return Listing.objects.filter(pk__gt=listing_base)
+
+
+@scenario("search")
+def search_latency(rounds=5, dataset_listings=100000, **options):
+    """
+    Full-text search latency over ``dataset_listings`` seeded listings.
+
+    The dataset is seeded (and indexed) inside a transaction that is rolled
+    back afterwards. Each query goes through the search view, so timings
+    include ranking, pagination and serialization; ``icontains_ms`` is the
+    old ad-hoc scan for the rare query, for comparison.
+    """
+    factory = APIRequestFactory()
+    view = ListingViewSet.as_view({"get": "search"})
+    results = {}
+    with transaction.atomic():
+        started = time.perf_counter()
+        seeded = seed_dataset(dataset_listings)
+        results["seed_and_index_s"] = round(time.perf_counter() - started, 2)
+        results["listings"] = seeded.count()
+        rare = seeded.order_by("pk")[dataset_listings // 2].location
+
+        def fetch(q):
+            request = factory.get("/api/listings/search/", {"q": q}, SERVER_NAME="localhost")
+            return lambda: view(request).render()
+
+        queries = {
+            "rare_term": rare,
+            "common_term": "cozy",
+            "common_terms": "comfortable vacations near attractions",
+            "no_match": "zzzzzz",
+        }
+        for name, q in queries.items():
+            samples = []
+            for _ in range(rounds):
+                call = fetch(q)
+                call_started = time.perf_counter()
+                call()
+                samples.append((time.perf_counter() - call_started) * 1000)
+            results[name] = {
+                "q": q,
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+            }
+
+        word = rare.split()[-1]
+        icontains = Listing.objects.filter(
+            Q(title__icontains=word) | Q(location__icontains=word) | Q(description__icontains=word)
+        )
+        results["icontains_ms"] = time_calls(lambda: list(icontains[:10]), rounds)
+        transaction.set_rollback(True)
+    return results
+
+
+@scenario("serializer-throughput")
+def serializer_throughput(rounds=5, dataset_listings=2000, **options):
+    """
+    Rows/sec serializing list pages, ModelSerializer vs the .values() fast path.
+
+    Seeds ``dataset_listings`` listings with 5 bookings each inside a
+    transaction that is rolled back afterwards. ``fetch_and_serialize``
+    includes the query and row construction (model instances vs value
+    dicts); ``serialize`` times the serializer alone on rows already in
+    memory. The rendering figures compare JSONRenderer and ORJSONRenderer
+    on the serialized data (null when orjson isn't installed).
+    """
+    results = {}
+    with transaction.atomic():
+        seed_dataset(dataset_listings, bookings_per_listing=5)
+        cases = (
+            ("listings", Listing, ListingSerializer, listing_rows),
+            ("bookings", Booking, BookingSerializer, booking_rows),
+        )
+        for name, model, serializer_class, fast in cases:
+            queryset = model.objects.order_by("pk")
+            instances = list(queryset)
+            values = list(queryset.values(*fast.columns))
+            data = fast.serialize(values)
+            if serializer_class(instances, many=True).data != data:
+                raise AssertionError(
+                    f"{name}: fast path output differs from {serializer_class.__name__}"
+                )
+
+            def rate(func, rows=len(instances)):
+                return round(rows / (time_calls(func, rounds) / 1000))
+
+            results[name] = {
+                "rows": len(instances),
+                "fetch_and_serialize_rows_per_s": {
+                    "model_serializer": rate(
+                        lambda: serializer_class(list(queryset), many=True).data
+                    ),
+                    "values": rate(lambda: fast.serialize(list(queryset.values(*fast.columns)))),
+                },
+                "serialize_rows_per_s": {
+                    "model_serializer": rate(lambda: serializer_class(instances, many=True).data),
+                    "values": rate(lambda: fast.serialize(values)),
+                },
+                "render_rows_per_s": {
+                    "json": rate(lambda: JSONRenderer().render(data)),
+                    "orjson": (
+                        rate(lambda: ORJSONRenderer().render(data)) if orjson is not None else None
+                    ),
+                },
+            }
+        transaction.set_rollback(True)
+    return results
+
+
+@scenario("quote")
+def quote_latency(rounds=20, seasons=24, **options):
+    """
+    Quote latency from the compiled rate calendar vs evaluating the rules per night.
+
+    A listing gets ``seasons`` two-week seasons, a weekend rule and three
+    length-of-stay tiers, inside a transaction that is rolled back
+    afterwards. ``calendar_ms`` is pricing.quote (one range aggregate);
+    ``per_night_ms`` loads the rules and evaluates them for every night.
+    """
+    results = {}
+    with transaction.atomic():
+        listing = Listing.objects.create(
+            title="Benchmark pricing", description="Created by the quote benchmark.",
+            location="Benchmark", price_per_night=Decimal("100.00"), max_guests=2,
+        )
+        first = date.today()
+        rules = [
+            PricingRule(
+                listing=listing, kind=PricingRule.Kind.SEASON, multiplier=Decimal("1.250"),
+                start_date=first + timedelta(days=30 * n),
+                end_date=first + timedelta(days=30 * n + 14),
+            )
+            for n in range(seasons)
+        ]
+        rules.append(
+            PricingRule(listing=listing, kind=PricingRule.Kind.WEEKEND, multiplier=Decimal("1.100"))
+        )
+        rules += [
+            PricingRule(
+                listing=listing, kind=PricingRule.Kind.LENGTH_OF_STAY, multiplier=m, min_nights=n
+            )
+            for n, m in ((7, Decimal("0.950")), (30, Decimal("0.850")), (90, Decimal("0.800")))
+        ]
+        for rule in rules:
+            rule.save()  # each save recompiles the calendar, as an admin edit would
+        listing.refresh_from_db()
+
+        def per_night(start, end):
+            listing_rules = list(listing.pricing_rules.all())
+            nights = (end - start).days
+            subtotal = sum(
+                (
+                    nightly_rate(listing.price_per_night, listing_rules, start + timedelta(days=n))
+                    for n in range(nights)
+                ),
+                Decimal("0"),
+            )
+            total = subtotal * stay_multiplier(stay_tiers(listing_rules), nights)
+            return total.quantize(CENT, rounding=ROUND_HALF_UP)
+
+        for nights in (7, 30, 365):
+            start = first + timedelta(days=3)
+            end = start + timedelta(days=nights)
+            assert quote(listing, start, end)["total_price"] == per_night(start, end)
+            results[f"{nights}_nights"] = {
+                "calendar_ms": time_calls(lambda: quote(listing, start, end), rounds),
+                "per_night_ms": time_calls(lambda: per_night(start, end), rounds),
+            }
+        transaction.set_rollback(True)
+    return results
+
+
+@scenario("hold-expiry")
+def hold_expiry_throughput(
+    dataset_bookings=1000000, dataset_listings=1000, per_row_sample=2000, **options
+):
+    """
+    Rows/sec cancelling a backlog of expired holds, per row vs in batches.
+
+    Seeds ``dataset_bookings`` one-night PENDING bookings, each with a
+    PENDING payment and its night claim, over ``dataset_listings``
+    listings inside a transaction that is rolled back afterwards. Holds
+    are expired by running as of a moment past every seeded hold.
+    ``per_row`` cancels ``per_row_sample`` of them one by one through the
+    model (save, mark_failed); the batched figures split the rest evenly
+    between expire_holds runs at each batch size. ``batch_queries`` are
+    the statements of one such run's first batch, which don't grow with
+    the batch size.
+    """
+    from .holds import expire_holds
+    from .management.commands.seed import _bulk_insert, listing_fields
+    from .models import BookingNight
+
+    results = {}
+    with transaction.atomic():
+        listing_base = Listing.objects.aggregate(m=Max("id"))["m"] or 0
+        booking_base = Booking.objects.aggregate(m=Max("id"))["m"] or 0
+        first_night = date.today() + timedelta(days=1)
+
+        def stays():
+            for n in range(dataset_bookings):
+                yield (
+                    booking_base + n + 1,
+                    listing_base + n % dataset_listings + 1,
+                    first_night + timedelta(days=n // dataset_listings),
+                )
+
+        _bulk_insert(Listing, (
+            Listing(id=listing_base + i, **listing_fields(i))
+            for i in range(1, dataset_listings + 1)
+        ), 1000, False)
+        _bulk_insert(Booking, (
+            Booking(
+                id=pk, listing_id=listing_id,
+                guest_name=f"Held {pk}", guest_email=f"held{pk}@example.com",
+                start_date=night, end_date=night + timedelta(days=1),
+                total_price=Decimal("100.00"),
+            )
+            for pk, listing_id, night in stays()
+        ), 1000, False)
+        _bulk_insert(BookingNight, (
+            BookingNight(booking_id=pk, listing_id=listing_id, night=night)
+            for pk, listing_id, night in stays()
+        ), 1000, False)
+        _bulk_insert(Payment, (
+            Payment(booking_id=pk, booking_reference=f"HOLD-{pk}", amount=Decimal("100.00"))
+            for pk, _, _ in stays()
+        ), 1000, False)
+        later = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES + 1)
+
+        sample = list(
+            Booking.objects.filter(pk__gt=booking_base)
+            .select_related("payment")
+            .order_by("pk")[:per_row_sample]
+        )
+        started = time.perf_counter()
+        for booking in sample:
+            booking.status = Booking.Status.CANCELLED
+            booking.save(update_fields=["status"])
+            booking.payment.mark_failed()
+        elapsed = time.perf_counter() - started
+        results["per_row"] = {"rows": len(sample), "rows_per_s": round(len(sample) / elapsed)}
+
+        batch_sizes = (100, 1000, 5000)
+        share = (dataset_bookings - len(sample)) // len(batch_sizes)
+        for batch_size in batch_sizes:
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                expire_holds(now=later, batch_size=batch_size, limit=batch_size)
+            started = time.perf_counter()
+            totals = expire_holds(now=later, batch_size=batch_size, limit=share - batch_size)
+            elapsed = time.perf_counter() - started
+            results[f"batch_{batch_size}"] = {
+                "rows": batch_size + totals["expired"],
+                "rows_per_s": round(totals["expired"] / elapsed) if elapsed else None,
+                "batch_queries": len(queries),
+            }
+        transaction.set_rollback(True)
+    return results
+
+
+@scenario("export")
+def export_memory(rounds=5, dataset_listings=2000, chunk_size=500, **options):
+    """
+    Throughput and peak memory of the streamed booking export as it grows.
+
+    Seeds ``dataset_listings`` listings with 5 bookings each in a rolled
+    back transaction, then exports a fifth of the bookings and all of
+    them in each format, ``chunk_size`` rows per query. Peak allocations
+    should stay about the same between the two sizes: only one chunk is
+    held at a time.
+    """
+    results = {}
+    with transaction.atomic():
+        seed_dataset(dataset_listings, bookings_per_listing=5)
+        bookings = Booking.objects.order_by("created_at", "id")
+        total = bookings.count()
+        sizes = {"fifth": bookings[total - total // 5].created_at, "all": None}
+        for export_format in ("ndjson", "csv"):
+            for label, since in sizes.items():
+                rows = total if since is None else bookings.filter(created_at__gte=since).count()
+
+                def drain():
+                    chunks = stream_export(export_format, since, chunk_size)
+                    return sum(len(chunk) for chunk in chunks)
+
+                tracemalloc.start()
+                written = drain()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results[f"{export_format}_{label}"] = {
+                    "rows": rows,
+                    "bytes": written,
+                    "rows_per_s": round(rows / (time_calls(drain, rounds) / 1000)),
+                    "alloc_peak_kb": round(peak / 1024, 1),
+                }
+        transaction.set_rollback(True)
+    return results
+
+
+def api_routes(ctx):
+    """
+    One request per route in listings/urls.py: name -> callable returning
+    (method, path, json body or None). Callables may create throwaway rows
+    for write routes; that setup is not timed.
+    """
+    listing, booking, payment = ctx["listing"], ctx["booking"], ctx["payment"]
+    counter = iter(range(10 ** 9))
+
+    def fresh_booking():
+        n = next(counter)
+        start = date(2100, 1, 1) + timedelta(days=3 * n)
+        return Booking.objects.create(
+            listing=listing, guest_name=f"Perf Guest {n}", guest_email=f"perf{n}@example.com",
+            start_date=start, end_date=start + timedelta(days=2), total_price=Decimal("200.00"),
+        )
+
+    def new_booking_body():
+        n = next(counter)
+        start = date(2200, 1, 1) + timedelta(days=3 * n)
+        return {
+            "listing": listing.id,
+            "guest_name": f"Perf Guest {n}",
+            "guest_email": f"perf{n}@example.com",
+            "start_date": start.isoformat(), "end_date": (start + timedelta(days=2)).isoformat(),
+            "total_price": "200.00",
+        }
+
+    listing_body = {
+        "title": "Perf listing",
+        "description": "Created by api-regression",
+        "location": "Perf City",
+        "price_per_night": "80.00", "max_guests": 2,
+    }
+    return {
+        "listing-list": lambda: ("get", reverse("listing-list"), None),
+        "listing-list-cursor": lambda: (
+            "get", reverse("listing-list") + "?pagination=cursor", None
+        ),
+        "listing-list-filtered": lambda: (
+            "get",
+            reverse("listing-list") + "?" + urlencode(
+                {"location": listing.location, "max_price": 500, "guests": 2, "ordering": "-rating"}
+            ),
+            None,
+        ),
+        "listing-create": lambda: ("post", reverse("listing-list"), listing_body),
+        "listing-detail": lambda: ("get", reverse("listing-detail", args=[listing.id]), None),
+        "listing-update": lambda: (
+            "put", reverse("listing-detail", args=[listing.id]), listing_body
+        ),
+        "listing-partial-update": lambda: (
+            "patch", reverse("listing-detail", args=[listing.id]), {"max_guests": 3}
+        ),
+        "listing-destroy": lambda: (
+            "delete",
+            reverse("listing-detail", args=[Listing.objects.create(**listing_body).id]),
+            None,
+        ),
+        "listing-search": lambda: ("get", reverse("listing-search") + "?q=cozy+city", None),
+        "listing-nearby": lambda: (
+            "get",
+            reverse("listing-nearby")
+            + f"?lat={listing.latitude}&lng={listing.longitude}&radius_km=500",
+            None,
+        ),
+        "listing-bookings": lambda: ("get", reverse("listing-bookings", args=[listing.id]), None),
+        "listing-quote": lambda: (
+            "get",
+            reverse("listing-quote", args=[listing.id])
+            + f"?start={date.today().isoformat()}"
+            + f"&end={(date.today() + timedelta(days=7)).isoformat()}",
+            None,
+        ),
+        "listing-stats": lambda: (
+            "get",
+            reverse("listing-stats", args=[listing.id])
+            + f"?from={date.today().isoformat()}"
+            + f"&to={(date.today() + timedelta(days=365)).isoformat()}",
+            None,
+        ),
+        "listing-available": lambda: (
+            "get", reverse("listing-available") + "?start=2030-01-01&end=2030-01-05&guests=2", None
+        ),
+        "booking-list": lambda: ("get", reverse("booking-list"), None),
+        "booking-list-cursor": lambda: (
+            "get", reverse("booking-list") + "?pagination=cursor", None
+        ),
+        "booking-bulk": lambda: (
+            "post", reverse("booking-bulk"), [new_booking_body() for _ in range(10)]
+        ),
+        "booking-export": lambda: (
+            "get", reverse("booking-export") + f"?since={date.today().isoformat()}", None
+        ),
+        "booking-create": lambda: ("post", reverse("booking-list"), new_booking_body()),
+        "booking-detail": lambda: ("get", reverse("booking-detail", args=[booking.id]), None),
+        "booking-partial-update": lambda: (
+            "patch", reverse("booking-detail", args=[booking.id]), {"guest_name": "Perf Renamed"}
+        ),
+        "booking-destroy": lambda: (
+            "delete", reverse("booking-detail", args=[fresh_booking().id]), None
+        ),
+        "initiate-payment": lambda: (
+            "post", reverse("initiate-payment", args=[fresh_booking().id]), None
+        ),
+        "verify-payment": lambda: (
+            "get", reverse("verify-payment") + f"?tx_ref={payment.booking_reference}", None
+        ),
+        "payment-session": lambda: (
+            "get", reverse("payment-session", args=[payment.booking_reference]), None
+        ),
+    }
+
+
+@scenario("api-regression")
+def api_regression(rounds=20, dataset_listings=200, **options):
+    """
+    Per-route SQL query counts, p50/p95 latency and peak allocations.
+
+    Seeds ``dataset_listings`` listings (5 bookings and 3 reviews each)
+    inside a transaction that is rolled back afterwards, then drives every
+    route through the Django test client. Payment routes run with async
+    initiation, whose Celery hand-off never fires because nothing commits,
+    and verification hits an already completed payment, so no gateway
+    calls are made. Payment throttles are switched off, since every round
+    comes from the same client.
+    """
+    client = Client()
+    results = {}
+    unthrottled = {
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": dict.fromkeys(settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]),
+    }
+    with transaction.atomic(), override_settings(
+        ALLOWED_HOSTS=["*"], CHAPA_ASYNC_INITIATION=True, REST_FRAMEWORK=unthrottled
+    ):
+        seeded = seed_dataset(dataset_listings, bookings_per_listing=5, reviews_per_listing=3)
+        listing = seeded.order_by("pk").first()
+        booking = listing.bookings.order_by("pk").first()
+        payment = Payment.objects.create(
+            booking=booking, booking_reference=f"BK-PERF-{booking.id}", amount=booking.total_price,
+            status=Payment.Status.COMPLETED,
+        )
+        routes = api_routes({"listing": listing, "booking": booking, "payment": payment})
+
+        for name, build in routes.items():
+            def request(method, path, body):
+                response = getattr(client, method)(path, body, content_type="application/json")
+                if response.streaming:
+                    b"".join(response.streaming_content)  # the queries run as the body is read
+                if response.status_code >= 400:
+                    raise AssertionError(
+                        f"{name}: {method.upper()} {path} returned {response.status_code}"
+                    )
+
+            request(*build())  # warm-up
+            args = build()
+            # The client's request_started signal clears the query log, so start from empty
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                request(*args)
+            # Lowest of a few peaks, so a one-off allocation (a cache cull,
+            # a lazy import) doesn't register as a regression
+            peaks = []
+            for _ in range(3):
+                args = build()
+                tracemalloc.start()
+                request(*args)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            peak = min(peaks)
+
+            samples = []
+            gc.collect()
+            gc.disable()  # as timeit does, so collector pauses don't land in one route's p95
+            try:
+                for _ in range(rounds):
+                    args = build()
+                    started = time.perf_counter()
+                    request(*args)
+                    samples.append((time.perf_counter() - started) * 1000)
+            finally:
+                gc.enable()
+            results[name] = {
+                "queries": len(queries),
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "alloc_peak_kb": round(peak / 1024, 1),
+            }
+        transaction.set_rollback(True)
+    return results
+
+
+class _SlowGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # Chapa's answer for an unknown transaction: the view writes nothing
+        # and caches nothing, so every request goes upstream
+        time.sleep(self.server.delay)
+        body = json.dumps(
+            {"status": "failed", "message": "Invalid transaction or Transaction not found"}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _SlowGateway(ThreadingHTTPServer):
+    """Local Chapa stand-in answering verify calls after ``delay`` seconds."""
+
+    daemon_threads = True
+
+    def __init__(self, delay, backlog):
+        self.delay = delay
+        self.request_queue_size = backlog
+        super().__init__(("127.0.0.1", 0), _SlowGatewayHandler)
+
+
+@scenario("gateway-load")
+def gateway_load(workers=16, concurrency=200, requests=400, gateway_delay_ms=500, **options):
+    """
+    Requests/sec of payment verification against a slow gateway, WSGI vs ASGI.
+
+    A local fake Chapa answers every verify call after
+    ``gateway_delay_ms``. The WSGI deployment is ``workers`` threads
+    driving the sync views through the test client; the ASGI one is a
+    single event loop running ``concurrency`` requests at a time through
+    the async views (listings.async_urls). Each sends ``requests``
+    verifications, every one a gateway call: concurrent requests use
+    distinct tx_refs, so the verify cache doesn't collapse them. Rows are
+    committed, since the workers use their own connections, and deleted
+    afterwards. Payment throttles are off and the in-flight limits are
+    raised to the concurrency, so neither side is refused at the door.
+    WSGI throughput is capped at ``workers`` over the delay; the ASGI
+    figure is bound by the CPU cost of each request instead.
+    """
+    from django.test import AsyncClient
+
+    from .payment_utils import gateway_stats, reset_gateway_client
+
+    slots = max(workers, concurrency)
+    gateway = _SlowGateway(gateway_delay_ms / 1000, backlog=slots)
+    threading.Thread(target=gateway.serve_forever, daemon=True).start()
+    listing = Listing.objects.create(
+        title="Benchmark gateway load",
+        description="Created by the gateway-load benchmark.",
+        location="Benchmark",
+        price_per_night=Decimal("100.00"),
+        max_guests=2,
+    )
+    start = date.today() + timedelta(days=30)
+    bookings = Booking.objects.bulk_create(
+        Booking(
+            listing=listing, guest_name=f"Load Guest {n}", guest_email=f"load{n}@example.com",
+            start_date=start + timedelta(days=2 * n), end_date=start + timedelta(days=2 * n + 1),
+            total_price=Decimal("100.00"),
+        )
+        for n in range(slots)
+    )
+    tx_refs = [f"BK-LOAD-{booking.id}" for booking in bookings]
+    Payment.objects.bulk_create(
+        Payment(booking=booking, booking_reference=tx_ref, amount=booking.total_price)
+        for booking, tx_ref in zip(bookings, tx_refs)
+    )
+    unthrottled = {
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": dict.fromkeys(settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]),
+    }
+    overrides = override_settings(
+        ALLOWED_HOSTS=["*"], REST_FRAMEWORK=unthrottled,
+        CHAPA_API_URL=f"http://127.0.0.1:{gateway.server_port}", CHAPA_RETRY_BACKOFF=0,
+        CHAPA_POOL_MAXSIZE=max(settings.CHAPA_POOL_MAXSIZE, workers),
+        CHAPA_MAX_IN_FLIGHT=max(settings.CHAPA_MAX_IN_FLIGHT, workers),
+        CHAPA_ASYNC_MAX_IN_FLIGHT=max(settings.CHAPA_ASYNC_MAX_IN_FLIGHT, concurrency),
+    )
+    url = reverse("verify-payment")
+
+    def summary(clients, statuses, elapsed, peak):
+        return {
+            "clients": clients,
+            "requests": len(statuses),
+            "errors": sum(code != 400 for code in statuses),
+            "requests_per_s": round(len(statuses) / elapsed, 1),
+            "peak_gateway_calls_in_flight": peak,
+        }
+
+    def wsgi():
+        client = Client()
+
+        def worker(index):
+            return [
+                client.get(url, {"tx_ref": tx_refs[index]}).status_code
+                for _ in range(index, requests, workers)
+            ]
+
+        outcomes, elapsed = run_concurrently(workers, worker)
+        peak = gateway_stats()["admission"]["peak_in_flight"]
+        return summary(workers, [code for codes in outcomes for code in codes], elapsed, peak)
+
+    async def asgi():
+        client = AsyncClient()
+
+        async def task(index):
+            codes = []
+            for _ in range(index, requests, concurrency):
+                codes.append((await client.get(url, {"tx_ref": tx_refs[index]})).status_code)
+            return codes
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(task(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        # Read while the loop, and so its gateway client, is still alive
+        peak = gateway_stats()["async_admission"]["peak_in_flight"]
+        return summary(concurrency, [code for codes in outcomes for code in codes], elapsed, peak)
+
+    # Each verification logs its failure
+    logging.disable(logging.ERROR)
+    try:
+        with overrides:
+            reset_gateway_client()
+            results = {"gateway_delay_ms": gateway_delay_ms, "wsgi": wsgi()}
+            reset_gateway_client()
+            with override_settings(ROOT_URLCONF="listings.async_urls"):
+                results["asgi"] = asyncio.run(asgi())
+    finally:
+        logging.disable(logging.NOTSET)
+        reset_gateway_client()
+        gateway.shutdown()
+        gateway.server_close()
+        listing.delete()
+    return results
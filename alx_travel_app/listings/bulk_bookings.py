@@ -0,0 +1,186 @@
+"""
+Creation of many bookings in one request.
+
+Validation, the double-booking check and the inserts are batched: a whole
+request costs a fixed handful of queries however many bookings it carries,
+and Chapa sessions are initiated concurrently on a bounded thread pool.
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .http_cache import invalidate_listing_responses
+from .models import Booking, BookingConflict, BookingNight, Listing, Payment
+from .payment_utils import initiate_booking_payment
+from .pricing import quote_many
+from .serializers import BOOKING_CONFLICT_MESSAGE, BookingSerializer
+from .stats import queue_stats_refreshes
+
+logger = logging.getLogger(__name__)
+
+
+def _listing_ids(items: List) -> List[int]:
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item["listing"]))
+        except (KeyError, TypeError, ValueError):
+            pass  # reported by the serializer
+    return list(ids)
+
+
+def validate_bookings(items: List) -> Tuple[Dict[int, Booking], Dict[int, dict]]:
+    """
+    Validate booking payloads, check them for double bookings and price them.
+
+    Listings are fetched with one query and existing night claims with
+    another; bookings in the same batch are also checked against each
+    other, first come first served. Bookings at listings with pricing
+    rules are priced with two more queries (see pricing.quote_many).
+    Returns unsaved bookings and validation errors, both keyed by
+    position in ``items``.
+    """
+    context = {"listings": Listing.objects.in_bulk(_listing_ids(items)), "bulk": True}
+    bookings, errors = {}, {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {"non_field_errors": ["Expected an object."]}
+            continue
+        serializer = BookingSerializer(data=item, context=context)
+        if serializer.is_valid():
+            bookings[index] = Booking(**serializer.validated_data)
+        else:
+            errors[index] = serializer.errors
+
+    active = {i: b for i, b in bookings.items() if b.status != Booking.Status.CANCELLED}
+    if active:
+        claimed = set(
+            BookingNight.objects.filter(
+                listing_id__in={b.listing_id for b in active.values()},
+                night__gte=min(b.start_date for b in active.values()),
+                night__lt=max(b.end_date for b in active.values()),
+            ).values_list("listing_id", "night")
+        )
+        for index, booking in active.items():
+            nights = {(booking.listing_id, night) for night in booking.nights()}
+            if nights & claimed:
+                del bookings[index]
+                errors[index] = {"non_field_errors": [BOOKING_CONFLICT_MESSAGE]}
+            else:
+                claimed |= nights
+
+    quotes = quote_many([(b.listing, b.start_date, b.end_date) for b in bookings.values()])
+    for booking, booking_quote in zip(bookings.values(), quotes):
+        booking.total_price = booking_quote["total_price"]
+    return bookings, errors
+
+
+def _new_payment(booking: Booking) -> Payment:
+    return Payment(
+        booking=booking,
+        booking_reference=f"BK-{booking.id}-{uuid.uuid4().hex[:8].upper()}",
+        amount=booking.total_price,
+        status=Payment.Status.PENDING,
+    )
+
+
+def _insert_batch(bookings: List[Booking]) -> List[Payment]:
+    """Insert bookings, their night claims and payments with bulk_create."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        Booking.objects.bulk_create(bookings)
+    else:
+        # MySQL doesn't report the ids of a multi-row insert; plain
+        # single-row inserts do, and the claims below are still one batch
+        for booking in bookings:
+            super(Booking, booking).save()
+    BookingNight.objects.bulk_create(
+        BookingNight(booking=booking, listing_id=booking.listing_id, night=night)
+        for booking in bookings
+        if booking.status != Booking.Status.CANCELLED
+        for night in booking.nights()
+    )
+    payments = Payment.objects.bulk_create([_new_payment(booking) for booking in bookings])
+    if any(payment.pk is None for payment in payments):
+        ids = dict(
+            Payment.objects.filter(booking__in=bookings).values_list("booking_reference", "id")
+        )
+        for payment in payments:
+            payment.pk = ids[payment.booking_reference]
+    return payments
+
+
+def insert_bookings(bookings: Dict[int, Booking]) -> Tuple[Dict[int, Payment], Dict[int, dict]]:
+    """
+    Save validated bookings and create a PENDING payment for each.
+
+    Everything is inserted in a single transaction. If a concurrent
+    request claimed some of the same nights since validation, the batch
+    is retried one booking at a time so the others still go through.
+    Returns payments and conflict errors keyed like ``bookings``.
+    """
+    payments, errors = {}, {}
+    if not bookings:
+        return payments, errors
+    try:
+        with transaction.atomic():
+            payments = dict(zip(bookings, _insert_batch(list(bookings.values()))))
+            # bulk_create sends no signals
+            queue_stats_refreshes(
+                (booking.listing_id, booking.start_date, booking.end_date)
+                for booking in bookings.values()
+            )
+    except IntegrityError:
+        logger.info(
+            f"Bulk booking insert hit a concurrent booking, retrying {len(bookings)} one by one"
+        )
+        for booking in bookings.values():
+            booking.pk = None
+            booking._state.adding = True
+        for index, booking in bookings.items():
+            try:
+                with transaction.atomic():
+                    booking.save()
+                    payment = _new_payment(booking)
+                    payment.save()
+                payments[index] = payment
+            except BookingConflict:
+                errors[index] = {"non_field_errors": [BOOKING_CONFLICT_MESSAGE]}
+    invalidate_listing_responses()
+    return payments, errors
+
+
+def initiate_payments(payments: List[Payment], callback_url: str, concurrency: int) -> List[dict]:
+    """
+    Initiate Chapa sessions for ``payments`` on ``concurrency`` threads.
+
+    The pool shares the pooled Chapa session. Checkout URLs and failures
+    are written back with one bulk_update. Returns the Chapa results in
+    the order of ``payments``.
+    """
+    if not payments:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(payments)))) as pool:
+        results = list(
+            pool.map(lambda payment: initiate_booking_payment(payment, callback_url), payments)
+        )
+
+    now = timezone.now()
+    for payment, result in zip(payments, results):
+        payment.updated_at = now
+        if result.get("success"):
+            payment.checkout_url = result.get("checkout_url")
+        else:
+            logger.error(
+                f"Payment initiation failed for booking {payment.booking_id}: "
+                f"{result.get('error', 'Failed to initiate payment')}"
+            )
+            # Turned away before reaching Chapa (busy or circuit open): left
+            # PENDING so initiation can be retried
+            if not result.get("retry_after"):
+                payment.status = Payment.Status.FAILED
+    Payment.objects.bulk_update(payments, ["checkout_url", "status", "updated_at"])
+    return results
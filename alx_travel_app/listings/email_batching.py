@@ -0,0 +1,22 @@
+"""
+Batching of booking confirmation emails.
+"""
+from django.conf import settings
+
+
+def queue_confirmation_email(booking_id: int) -> None:
+    """
+    Queue the confirmation email of a booking that was just confirmed.
+
+    Payment.mark_completed has already flagged the booking
+    confirmation_email_due; this enqueues a send_due_confirmation_emails
+    task to run CONFIRMATION_EMAIL_BATCH_WINDOW_MS later. The first of
+    those tasks sends every flagged booking over one mail connection and
+    the others find nothing left, so confirmations close together share a
+    batch. Nothing is held in this process: if the enqueue is lost, the
+    periodic sweep sends the email.
+    """
+    from .tasks import send_due_confirmation_emails
+
+    window = settings.CONFIRMATION_EMAIL_BATCH_WINDOW_MS / 1000
+    send_due_confirmation_emails.apply_async(countdown=window)
@@ -0,0 +1,89 @@
+"""
+Server-side filtering and sorting of the listing list endpoint.
+
+Filters are ``location`` (exact match), ``min_price``/``max_price`` (an
+inclusive price_per_night range) and ``guests`` (listings with at least
+that max_guests). ``ordering`` sorts by price, rating or recency, each
+with id as tie-break; a leading ``-`` sorts descending.
+
+Every combination is served from an index (see Listing.Meta.indexes):
+a location filter seeks into the (location, <sort column>, id) index of
+the requested sort, which also covers a price range when sorting by
+price; without one, a price range seeks into (price_per_night, id).
+Otherwise the (<sort column>, id) index is walked in order, stopping at
+the end of the page; a guest count is checked along the way, or seeks
+into (max_guests) where the planner judges it selective.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Mapping, Optional
+
+from django.db.models import QuerySet
+
+# ordering value -> column sorted on, ties broken by id
+SORT_COLUMNS = {
+    "price": "price_per_night",
+    "rating": "avg_rating",
+    "created": "created_at",
+}
+
+DEFAULT_ORDERING = "-created"
+
+
+def _price(params: Mapping, name: str) -> Optional[Decimal]:
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price < 0:
+        raise ValueError(f"{name} must be a non-negative number")
+    return price
+
+
+def parse_ordering(params: Mapping) -> str:
+    """The requested ordering, DEFAULT_ORDERING when absent; raises ValueError for unknown ones."""
+    ordering = params.get("ordering") or DEFAULT_ORDERING
+    if ordering.lstrip("-") not in SORT_COLUMNS:
+        choices = ", ".join(sorted(SORT_COLUMNS))
+        raise ValueError(f"ordering must be one of {choices}, optionally prefixed with -")
+    return ordering
+
+
+def filter_listings(queryset: QuerySet, params: Mapping, keyset: bool = False) -> QuerySet:
+    """
+    Apply the filter and ordering query parameters to a listing queryset.
+
+    Keyset pages always walk (created_at, id), newest first, so with
+    ``keyset`` any other ordering is refused. Raises ValueError, with a
+    message for the client, on malformed values.
+    """
+    location = params.get("location")
+    if location:
+        queryset = queryset.filter(location=location)
+
+    min_price, max_price = _price(params, "min_price"), _price(params, "max_price")
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError("min_price must not be greater than max_price")
+    if min_price is not None:
+        queryset = queryset.filter(price_per_night__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price_per_night__lte=max_price)
+
+    guests = params.get("guests")
+    if guests not in (None, ""):
+        try:
+            guests = int(guests)
+        except ValueError:
+            guests = 0
+        if guests < 1:
+            raise ValueError("guests must be a positive integer")
+        queryset = queryset.filter(max_guests__gte=guests)
+
+    ordering = parse_ordering(params)
+    if keyset and ordering != DEFAULT_ORDERING:
+        raise ValueError(f"pagination=cursor only supports ordering={DEFAULT_ORDERING}")
+    descending = "-" if ordering.startswith("-") else ""
+    column = SORT_COLUMNS[ordering.lstrip("-")]
+    return queryset.order_by(f"{descending}{column}", f"{descending}id")
@@ -0,0 +1,175 @@
+"""
+Radius search over listing coordinates without a spatial database.
+
+Listings with coordinates carry their geohash (Listing.geohash), a base32
+string whose prefixes name ever smaller grid cells, indexed like any other
+text column. A search picks the longest prefix length whose cells are at
+least as large as the radius in both directions, so the circle always
+fits in the 3x3 block of cells around its centre. Those cells become
+nine range conditions on the geohash index, and only the listings in
+them are read. Their exact haversine distances are then computed in one
+pass over the candidates, with numpy when it is installed.
+"""
+import math
+from functools import reduce
+from operator import or_
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.db.models import Q, QuerySet
+
+try:
+    import numpy
+except ImportError:  # optional dependency
+    numpy = None
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+GEOHASH_LENGTH = 12
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Largest radius the nearby endpoint accepts; the cells of wider searches
+# cover so much ground that pruning by them no longer pays
+MAX_RADIUS_KM = 500
+
+
+def encode(latitude: float, longitude: float, length: int = GEOHASH_LENGTH) -> str:
+    """Geohash of a point, ``length`` characters long."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < length:
+        # Bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def cell_size(length: int) -> Tuple[float, float]:
+    """Height and width in degrees of the cells named by ``length``-character geohashes."""
+    lng_bits = (5 * length + 1) // 2
+    lat_bits = 5 * length // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lng_bits
+
+
+def prefix_length(latitude: float, radius_km: float) -> int:
+    """
+    Longest geohash prefix whose cells are at least as high and as wide
+    as the circle's reach from its centre; 0 when even single characters
+    are too small or the circle reaches a pole.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    reach_lat = math.degrees(angle)
+    if abs(latitude) + reach_lat >= 90:
+        return 0
+    # Half the longitude span of a spherical cap
+    reach_lng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    for length in range(GEOHASH_LENGTH, 0, -1):
+        height, width = cell_size(length)
+        if height >= reach_lat and width >= reach_lng:
+            return length
+    return 0
+
+
+def covering_cells(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Geohash prefixes of the cells that together cover the circle; empty means everywhere."""
+    length = prefix_length(latitude, radius_km)
+    if not length:
+        return []
+    height, width = cell_size(length)
+    # Centre of the cell holding the point, stepped one cell in each direction
+    centre_lat = (math.floor((latitude + 90) / height) + 0.5) * height - 90
+    centre_lng = (math.floor((longitude + 180) / width) + 0.5) * width - 180
+    cells = set()
+    for dlat in (-height, 0, height):
+        lat = centre_lat + dlat
+        if not -90 < lat < 90:
+            continue
+        for dlng in (-width, 0, width):
+            lng = (centre_lng + dlng + 180) % 360 - 180
+            cells.add(encode(lat, lng, length))
+    return sorted(cells)
+
+
+def _next_prefix(prefix: str) -> Optional[str]:
+    """Smallest string after every geohash starting with ``prefix``; None past the last cell."""
+    while prefix and prefix[-1] == BASE32[-1]:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def in_cells(cells: Sequence[str]) -> Q:
+    """
+    Condition matching geohashes in any of ``cells``.
+
+    Written as ranges rather than startswith: LIKE can't use the index on
+    SQLite, and base32 digits and lower-case letters sort the same in
+    every collation.
+    """
+    conditions = []
+    for cell in cells:
+        upper = _next_prefix(cell)
+        conditions.append(
+            Q(geohash__gte=cell, geohash__lt=upper) if upper else Q(geohash__gte=cell)
+        )
+    return reduce(or_, conditions)
+
+
+def haversine_km(
+    latitude: float, longitude: float, latitudes: Sequence[float], longitudes: Sequence[float]
+) -> List[float]:
+    """Great-circle distances in km from one point to each of many."""
+    if numpy is not None:
+        lat1, lng1 = numpy.radians(latitude), numpy.radians(longitude)
+        lat2 = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        lng2 = numpy.radians(numpy.asarray(longitudes, dtype=float))
+        a = (
+            numpy.sin((lat2 - lat1) / 2) ** 2
+            + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) / 2) ** 2
+        )
+        return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    distances = []
+    for lat, lng in zip(latitudes, longitudes):
+        lat2 = radians(lat)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lng) - lng1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0))))
+    return distances
+
+
+def nearby_listings(
+    latitude: float, longitude: float, radius_km: float, queryset: QuerySet
+) -> List[Dict]:
+    """
+    Listings of ``queryset`` within ``radius_km`` of a point, nearest first.
+
+    Returns ``{"listing_id", "distance_km"}`` rows; ties are broken by id.
+    Costs one query, reading only the listings in the covering cells.
+    """
+    candidates = queryset.filter(geohash__isnull=False)
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells:
+        candidates = candidates.filter(in_cells(cells))
+    rows = list(candidates.order_by().values_list("pk", "latitude", "longitude"))
+    if not rows:
+        return []
+    ids, latitudes, longitudes = zip(*rows)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    nearby = sorted((distance, pk) for pk, distance in zip(ids, distances) if distance <= radius_km)
+    return [{"listing_id": pk, "distance_km": round(distance, 3)} for distance, pk in nearby]
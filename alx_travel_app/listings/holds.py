@@ -0,0 +1,127 @@
+"""
+Expiry of the hold an unpaid PENDING booking keeps on its nights.
+
+A booking holds its nights for BOOKING_HOLD_MINUTES from creation (see
+Booking.hold_expires_at). Once that passes without its payment
+completing, the expire_booking_holds task cancels it, fails its pending
+payment and deletes its night claims, so the dates can be booked again
+and availability queries stop scanning it as active.
+
+Expired bookings are walked oldest first on the (status, created_at)
+index, ``batch_size`` at a time, and each batch is written with a fixed
+handful of statements however large it is.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .http_cache import invalidate_listing_responses
+from .models import Booking, BookingNight, Payment
+from .stats import queue_stats_refreshes
+
+logger = logging.getLogger(__name__)
+
+
+def hold_cutoff(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Bookings created before this have outlived their hold; None when holds are disabled."""
+    if not settings.BOOKING_HOLD_MINUTES:
+        return None
+    return (now or timezone.now()) - timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+
+def _expire_batch(booking_ids: List[int], now: datetime) -> List[int]:
+    """
+    Cancel the bookings of one batch that are still PENDING and unpaid.
+
+    Payments are locked before bookings, in the same order as
+    Payment.mark_completed, so a payment completing concurrently either
+    commits first (and its booking is skipped) or waits and then confirms
+    the cancelled booking if its nights are still free. Returns the ids
+    of the bookings cancelled.
+    """
+    # Rows are looked up by key only and their status checked here: a status
+    # condition tempts the planner into scanning the whole PENDING range of
+    # the status indexes instead
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(booking_id__in=booking_ids)
+            .values_list("pk", "booking_id", "status")
+        )
+        paid = {
+            booking_id
+            for _, booking_id, status in payments
+            if status == Payment.Status.COMPLETED
+        }
+        expired = [
+            (pk, listing_id, start_date, end_date)
+            for pk, listing_id, start_date, end_date, status in Booking.objects.select_for_update()
+            .filter(pk__in=booking_ids)
+            .values_list("pk", "listing_id", "start_date", "end_date", "status")
+            if status == Booking.Status.PENDING and pk not in paid
+        ]
+        if not expired:
+            return []
+        expired_ids = [pk for pk, _, _, _ in expired]
+        expired_set = set(expired_ids)
+        # Every row gets the same values, so one UPDATE ... WHERE id IN covers the batch
+        Booking.objects.filter(pk__in=expired_ids).update(status=Booking.Status.CANCELLED)
+        Payment.objects.filter(pk__in=[
+            pk
+            for pk, booking_id, status in payments
+            if booking_id in expired_set and status == Payment.Status.PENDING
+        ]).update(status=Payment.Status.FAILED, updated_at=now)
+        BookingNight.objects.filter(booking_id__in=expired_ids).delete()
+        # Queryset updates send no signals
+        queue_stats_refreshes(
+            (listing_id, start_date, end_date) for _, listing_id, start_date, end_date in expired
+        )
+    return expired_ids
+
+
+def expire_holds(
+    now: Optional[datetime] = None,
+    batch_size: int = 1000,
+    limit: Optional[int] = None,
+) -> Dict:
+    """
+    Cancel PENDING bookings whose hold expired before ``now``.
+
+    Candidates are read ``batch_size`` at a time, oldest first; each
+    batch is cancelled in its own transaction, so a large backlog never
+    holds locks for long. At most ``limit`` candidates are looked at.
+    Returns counts: scanned, expired and batches.
+    """
+    totals = {"scanned": 0, "expired": 0, "batches": 0}
+    cutoff = hold_cutoff(now)
+    if cutoff is None:
+        return totals
+    now = now or timezone.now()
+    stale = Booking.objects.filter(
+        status=Booking.Status.PENDING, created_at__lt=cutoff
+    ).order_by("created_at", "pk")
+
+    # Cancelled bookings leave the PENDING range of the index, so each batch
+    # starts at its head; only the few skipped because their payment just
+    # completed need excluding
+    skipped = set()
+    while limit is None or totals["scanned"] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals["scanned"])
+        chunk = list(stale.exclude(pk__in=skipped).values_list("pk", flat=True)[:size])
+        if not chunk:
+            break
+        expired = _expire_batch(chunk, now)
+        skipped.update(set(chunk) - set(expired))
+        totals["scanned"] += len(chunk)
+        totals["batches"] += 1
+        totals["expired"] += len(expired)
+
+    if totals["expired"]:
+        # Listing bookings responses embed the status
+        invalidate_listing_responses()
+    logger.info(f"Booking hold expiry finished: {totals}")
+    return totals
@@ -0,0 +1,204 @@
+"""
+HTTP caching for listing reads: validators, conditional GET and an
+optional response cache.
+
+Responses carry a strong ETag (and Last-Modified where there is a
+timestamp), so clients can revalidate with If-None-Match and get a 304
+before anything is serialized. With LISTING_RESPONSE_CACHE_TIMEOUT set,
+serialized response data is also kept in the Django cache. Cache keys
+embed a version number that every listing, booking or review write bumps,
+so one increment invalidates every cached listing response at once. Run
+the response cache on a shared backend (Redis) when serving from several
+processes; with locmem a write only invalidates its own process.
+
+The version moves as soon as the primary is written, but a replica may
+still return the old rows for a while; responses read from the replica
+are therefore not cached for LISTING_REPLICA_LAG_SECONDS after a write,
+or they would be kept under the new version.
+"""
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .routers import reading_from_replica, replica_configured
+
+VERSION_CACHE_KEY = "listings:response-version"
+# Present for LISTING_REPLICA_LAG_SECONDS after each version bump
+RECENT_WRITE_CACHE_KEY = "listings:response-recent-write"
+
+Validators = Tuple[Optional[str], Optional[float]]
+
+
+def make_etag(request, *parts) -> str:
+    """Strong ETag over the request path, its negotiated format and ``parts``."""
+    digest = hashlib.sha1()
+    for part in (request.get_full_path(), request.META.get("HTTP_ACCEPT", ""), *parts):
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return quote_etag(digest.hexdigest())
+
+
+def object_validators(request, obj) -> Validators:
+    """Validators for a single listing, from its id and updated_at."""
+    return make_etag(request, obj.pk, obj.updated_at.isoformat()), obj.updated_at.timestamp()
+
+
+def page_validators(request, rows, envelope) -> Validators:
+    """
+    Validators for one page of listings, given as instances or ``.values()`` rows.
+
+    The ETag covers the (id, updated_at) of each row plus the pagination
+    envelope (count, next and previous links), i.e. exactly what the page
+    shows, so it costs no queries beyond the ones that fetch the page.
+    There is no Last-Modified: a delete elsewhere changes the count
+    without making any row newer.
+    """
+    keys = (
+        (row["id"], row["updated_at"]) if isinstance(row, dict) else (row.pk, row.updated_at)
+        for row in rows
+    )
+    parts = ((pk, updated_at.isoformat()) for pk, updated_at in keys)
+    return make_etag(request, envelope, *parts), None
+
+
+def _initial_version() -> int:
+    # Clock-based, so a version key lost to eviction never restarts at a
+    # number whose entries may still be cached
+    return time.time_ns()
+
+
+def invalidate_listing_responses() -> None:
+    """Drop every cached listing response by moving to a new key version."""
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.add(VERSION_CACHE_KEY, _initial_version(), timeout=None)
+        cache.incr(VERSION_CACHE_KEY)
+    if replica_configured() and settings.LISTING_REPLICA_LAG_SECONDS > 0:
+        cache.set(RECENT_WRITE_CACHE_KEY, True, timeout=settings.LISTING_REPLICA_LAG_SECONDS)
+
+
+def _response_cache_key(request, scope: str, version: int) -> str:
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f"listings:response:{version}:{scope}:{path}"
+
+
+def response_cache_key(request, scope: str) -> Optional[str]:
+    """Cache key for this request, or None when the response cache is off."""
+    if settings.LISTING_RESPONSE_CACHE_TIMEOUT <= 0:
+        return None
+    version = cache.get_or_set(VERSION_CACHE_KEY, _initial_version, timeout=None)
+    return _response_cache_key(request, scope, version)
+
+
+async def aresponse_cache_key(request, scope: str) -> Optional[str]:
+    """response_cache_key() through the cache's async interface."""
+    if settings.LISTING_RESPONSE_CACHE_TIMEOUT <= 0:
+        return None
+    version = await cache.aget_or_set(VERSION_CACHE_KEY, _initial_version, timeout=None)
+    return _response_cache_key(request, scope, version)
+
+
+def _may_predate_version() -> bool:
+    """Whether data read here may be older than the current cache version."""
+    return reading_from_replica() and cache.get(RECENT_WRITE_CACHE_KEY) is not None
+
+
+async def _amay_predate_version() -> bool:
+    return reading_from_replica() and await cache.aget(RECENT_WRITE_CACHE_KEY) is not None
+
+
+def _with_validators(response, etag, last_modified, private):
+    if etag:
+        response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    # A False value would be rendered as "public=False", not left out
+    patch_cache_control(
+        response,
+        **({"private": True} if private else {"public": True}),
+        max_age=settings.LISTING_CACHE_MAX_AGE,
+        must_revalidate=True,
+    )
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+def cached_read(
+    request,
+    scope: str,
+    validators: Callable[[], Validators],
+    render: Callable[[], Response],
+    private: bool = False,
+):
+    """
+    Serve a GET with conditional request support and the optional response cache.
+
+    Args:
+        request: The incoming request
+        scope: Name of the view, part of the cache key
+        validators: Returns (etag, last_modified timestamp); either may be None
+        render: Builds the full response; only called on a cache miss that
+            is not answered with 304
+        private: Mark the response as not cacheable by shared caches
+
+    Returns:
+        The response, a 304 Not Modified, or a 412 Precondition Failed
+    """
+    key = response_cache_key(request, scope)
+    hit = cache.get(key) if key else None
+    if hit is not None:
+        etag, last_modified, data = hit
+    else:
+        etag, last_modified = validators()
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if hit is not None:
+            response = Response(data)
+        else:
+            response = render()
+            if key and response.status_code == 200 and not _may_predate_version():
+                entry = (etag, last_modified, response.data)
+                cache.set(key, entry, settings.LISTING_RESPONSE_CACHE_TIMEOUT)
+    return _with_validators(response, etag, last_modified, private)
+
+
+async def acached_read(
+    request,
+    scope: str,
+    validators: Callable[[], Awaitable[Validators]],
+    render: Callable[[], Awaitable[Response]],
+    private: bool = False,
+):
+    """
+    cached_read() for async views: ``validators`` and ``render`` are
+    coroutine functions, and the response cache, which shares its keys
+    with cached_read(), is used through the cache's async interface.
+    """
+    key = await aresponse_cache_key(request, scope)
+    hit = await cache.aget(key) if key else None
+    if hit is not None:
+        etag, last_modified, data = hit
+    else:
+        etag, last_modified = await validators()
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if hit is not None:
+            response = Response(data)
+        else:
+            response = await render()
+            if key and response.status_code == 200 and not await _amay_predate_version():
+                await cache.aset(
+                    key,
+                    (etag, last_modified, response.data),
+                    settings.LISTING_RESPONSE_CACHE_TIMEOUT,
+                )
+    return _with_validators(response, etag, last_modified, private)
@@ -0,0 +1,103 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import SCENARIOS, compare_to_baseline, load_baseline, write_baseline
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark scenario against the configured database and print its measurements."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenario",
+            choices=sorted(SCENARIOS),
+            help="Benchmark scenario to run",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=16,
+            help="Number of concurrent workers (default: 16)",
+        )
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=5,
+            help="Number of rounds to run (default: 5)",
+        )
+        parser.add_argument(
+            "--page",
+            type=int,
+            default=10000,
+            help="Deep page number for pagination scenarios (default: 10000)",
+        )
+        parser.add_argument(
+            "--dataset-listings",
+            type=int,
+            help=(
+                "Listings seeded by scenarios that build their own dataset "
+                "(api-regression: 200, search: 100000, serializer-throughput/export: 2000)"
+            ),
+        )
+        parser.add_argument(
+            "--dataset-bookings",
+            type=int,
+            help="Bookings seeded by scenarios that build a booking backlog (hold-expiry: 1000000)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Requests in flight at once on the event loop (gateway-load: 200)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            help="Requests sent per deployment (gateway-load: 400)",
+        )
+        parser.add_argument(
+            "--gateway-delay-ms",
+            type=int,
+            help="Latency of the fake payment gateway (gateway-load: 500)",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON baseline to compare against; exits with an error on regressions",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.0,
+            help=(
+                "Allowed growth of latency and allocation figures over the baseline "
+                "(default: 1.0 = 100%%)"
+            ),
+        )
+        parser.add_argument(
+            "--write-baseline",
+            metavar="PATH",
+            help="Record this run as the scenario's baseline in PATH",
+        )
+
+    def handle(self, *args, **options):
+        name = options.pop("scenario")
+        baseline_path = options.pop("baseline")
+        tolerance = options.pop("tolerance")
+        write_path = options.pop("write_baseline")
+        # Unset options fall back to the scenario's own defaults
+        result = SCENARIOS[name](
+            **{key: value for key, value in options.items() if value is not None}
+        )
+        self.stdout.write(json.dumps({"scenario": name, **result}, indent=2, default=str))
+
+        if write_path:
+            write_baseline(write_path, name, result)
+            self.stdout.write(self.style.SUCCESS(f"Baseline for {name} written to {write_path}"))
+        if baseline_path:
+            baseline = load_baseline(baseline_path)
+            if name not in baseline:
+                raise CommandError(f"No {name} entry in {baseline_path}")
+            regressions = compare_to_baseline(result, baseline[name], tolerance)
+            if regressions:
+                raise CommandError("Regressions against baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.models import Booking, BookingConflict
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the per-night claims of active bookings that have none, e.g. bookings "
+        "made before night claims existed. Safe to run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Bookings read per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        bookings = (
+            Booking.objects.exclude(status=Booking.Status.CANCELLED)
+            .filter(claimed_nights__isnull=True)
+            .only("pk", "listing_id", "start_date", "end_date", "status")
+            .order_by("pk")
+        )
+        claimed, conflicts = 0, []
+        last_pk = 0
+        while True:
+            chunk = list(bookings.filter(pk__gt=last_pk)[:options["chunk_size"]])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            for booking in chunk:
+                # Older bookings claim first; a later overlapping one is reported, not moved
+                try:
+                    with transaction.atomic():
+                        booking.claim_nights()
+                except BookingConflict:
+                    conflicts.append(booking.pk)
+                else:
+                    claimed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Night claims created for {claimed} bookings."))
+        if conflicts:
+            self.stderr.write(
+                f"{len(conflicts)} bookings overlap nights already claimed by another booking "
+                f"and need resolving by hand: {', '.join(map(str, conflicts))}"
+            )
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.holds import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Cancel unpaid PENDING bookings whose hold has expired and release their nights."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.BOOKING_HOLD_BATCH_SIZE,
+            help=(
+                "Bookings cancelled per transaction "
+                f"(default: {settings.BOOKING_HOLD_BATCH_SIZE})"
+            ),
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of expired bookings to look at",
+        )
+
+    def handle(self, *args, **options):
+        totals = expire_holds(batch_size=options["batch_size"], limit=options["limit"])
+        summary = ", ".join(f"{key}: {value}" for key, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Hold expiry complete. {summary}"))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.exports import EXPORT_CHUNK_SIZE, RENDERERS, parse_since, stream_export
+
+
+class Command(BaseCommand):
+    help = "Export all bookings and their payments as NDJSON or CSV, streamed in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(RENDERERS),
+            default="ndjson",
+            dest="export_format",
+            help="Output format (default: ndjson)",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only bookings created on or after this date (YYYY-MM-DD) or ISO 8601 datetime",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help=f"Bookings read per query (default: {EXPORT_CHUNK_SIZE})",
+        )
+        parser.add_argument(
+            "--output",
+            help="File to write to (default: stdout)",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_since(options["since"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        chunks = stream_export(options["export_format"], since, chunk_size=options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Bookings exported to {options['output']}."))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending="")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.stats import rebuild_listing_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily occupancy and revenue rollups of listings from their bookings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listing",
+            type=int,
+            action="append",
+            dest="listing_ids",
+            help="Only rebuild this listing id (repeatable). Defaults to all listings.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Listings rebuilt per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        listings = None
+        if options["listing_ids"]:
+            listings = Listing.objects.filter(pk__in=options["listing_ids"])
+        written = rebuild_listing_stats(listings, chunk_size=options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Listing stats rebuilt: {written} daily rows written.")
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.pricing import rebuild_rate_calendars
+
+
+class Command(BaseCommand):
+    help = "Recompile listings' nightly rate calendars from their pricing rules."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listing",
+            type=int,
+            action="append",
+            dest="listing_ids",
+            help=(
+                "Only rebuild this listing id (repeatable). "
+                "Defaults to listings with pricing rules."
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100,
+            help="Listings rebuilt per batch (default: 100)",
+        )
+
+    def handle(self, *args, **options):
+        if options["listing_ids"]:
+            listings = Listing.objects.filter(pk__in=options["listing_ids"])
+        else:
+            listings = Listing.objects.filter(pricing_rules__isnull=False).distinct()
+        written = rebuild_rate_calendars(listings, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rate calendars rebuilt: {written} rows written."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for listings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listing",
+            type=int,
+            action="append",
+            dest="listing_ids",
+            help="Only re-index this listing id (repeatable). Defaults to all listings.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Listings indexed per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        listings = None
+        if options["listing_ids"]:
+            listings = Listing.objects.filter(pk__in=options["listing_ids"])
+        indexed = rebuild_search_index(listings, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {indexed} listings."))
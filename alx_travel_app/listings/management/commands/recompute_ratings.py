@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalised rating aggregates on listings from their reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listing",
+            type=int,
+            action="append",
+            dest="listing_ids",
+            help="Only recompute this listing id (repeatable). Defaults to all listings.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Listings rebuilt per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        listings = None
+        if options["listing_ids"]:
+            listings = Listing.objects.filter(pk__in=options["listing_ids"])
+        written = recompute_ratings(listings, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Ratings recomputed for {written} listings."))
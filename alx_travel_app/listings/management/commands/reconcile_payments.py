@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.reconciliation import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = "Verify payments stuck in PENDING against Chapa and update their status."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=settings.PAYMENT_RECONCILE_AFTER_MINUTES,
+            help="Only reconcile payments pending for at least this many minutes "
+                 f"(default: {settings.PAYMENT_RECONCILE_AFTER_MINUTES})",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.PAYMENT_RECONCILE_CONCURRENCY,
+            help=(
+                "Number of concurrent Chapa verifications "
+                f"(default: {settings.PAYMENT_RECONCILE_CONCURRENCY})"
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Payments verified and written per batch (default: 200)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of payments to reconcile",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Verify and report without writing any changes.",
+        )
+
+    def handle(self, *args, **options):
+        totals = reconcile_pending_payments(
+            older_than=timedelta(minutes=options["older_than"]),
+            concurrency=options["concurrency"],
+            chunk_size=options["chunk_size"],
+            limit=options["limit"],
+            dry_run=options["dry_run"],
+        )
+        summary = ", ".join(f"{key}: {value}" for key, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Reconciliation complete. {summary}"))
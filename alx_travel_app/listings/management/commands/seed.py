@@ -1,8 +1,141 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from listings.models import Listing, Booking, Review
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import date, timedelta
 from decimal import Decimal
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max
+from listings import geo
+from listings.http_cache import invalidate_listing_responses
+from listings.models import (
+    Listing, Booking, BookingNight, ListingDailyStats, ListingRate, ListingTerm, PricingRule,
+    Review,
+)
+from listings.ratings import recompute_ratings
+from listings.search import rebuild_search_index
+from listings.stats import rebuild_listing_stats
+
+
+def listing_fields(i):
+    # Low-discrepancy spread over the inhabited latitudes, so radius searches find neighbours
+    latitude = round((i * 0.6180339887) % 1 * 120 - 60, 6)
+    longitude = round((i * 0.7548776662) % 1 * 360 - 180, 6)
+    return {
+        "title": f"Cozy Stay #{i}",
+        "description": (
+            "A comfortable property perfect for short vacations. "
+            "Includes amenities and is close to local attractions."
+        ),
+        "location": f"City {i}",
+        "latitude": latitude,
+        "longitude": longitude,
+        # bulk_create skips Listing.save, which sets it otherwise
+        "geohash": geo.encode(latitude, longitude),
+        "price_per_night": Decimal("50.00") + Decimal(i * 10),
+        "max_guests": 2 + (i % 4),
+    }
+
+
+def booking_fields(i, b, today, price_per_night):
+    start = today + timedelta(days=i + (b - 1) * 3)
+    end = start + timedelta(days=2)
+    nights = (end - start).days
+    return {
+        "guest_name": f"Guest {i}-{b}",
+        "guest_email": f"guest{i}{b}@example.com",
+        "start_date": start,
+        "end_date": end,
+        "total_price": price_per_night * nights,
+        "status": Booking.Status.CONFIRMED if b % 2 else Booking.Status.PENDING,
+    }
+
+
+def review_fields(i, r):
+    return {
+        "reviewer_name": f"Reviewer {i}-{r}",
+        "rating": 3 + (r % 3),
+        "comment": "Great place. Would stay again!",
+    }
+
+
+def _bulk_insert(model, rows, batch_size, per_chunk_commit):
+    """Insert a lazy stream of unsaved instances ``batch_size`` at a time."""
+    count = 0
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return count
+        with transaction.atomic() if per_chunk_commit else nullcontext():
+            model.objects.bulk_create(chunk, batch_size=batch_size)
+        count += len(chunk)
+
+
+def seed_bulk_range(first, last, plan):
+    """
+    Seed listings ``first``..``last`` (inclusive) with explicit primary keys.
+
+    Primary keys are derived from the listing index and ``plan`` offsets, so
+    bookings and their night claims can be linked without reading ids back
+    (MySQL's bulk_create doesn't return them) and workers never collide.
+    Runs in a worker process as well as in-process; returns rows per model.
+    """
+    listing_base, booking_base = plan["listing_base"], plan["booking_base"]
+    per_listing, reviews_per_listing = plan["bookings_per_listing"], plan["reviews_per_listing"]
+    batch_size, per_chunk_commit = plan["batch_size"], plan["per_chunk_commit"]
+    today = plan["today"]
+    indices = range(first, last + 1)
+
+    def listings():
+        for i in indices:
+            yield Listing(id=listing_base + i, **listing_fields(i))
+
+    def bookings():
+        for i in indices:
+            price = listing_fields(i)["price_per_night"]
+            for b in range(1, per_listing + 1):
+                booking_id = booking_base + (i - 1) * per_listing + b
+                yield Booking(
+                    id=booking_id, listing_id=listing_base + i, **booking_fields(i, b, today, price)
+                )
+
+    def nights():
+        for booking in bookings():
+            for night in booking.nights():
+                yield BookingNight(
+                    booking_id=booking.id, listing_id=booking.listing_id, night=night
+                )
+
+    def reviews():
+        for i in indices:
+            for r in range(1, reviews_per_listing + 1):
+                yield Review(listing_id=listing_base + i, **review_fields(i, r))
+
+    with nullcontext() if per_chunk_commit else transaction.atomic():
+        counts = {
+            "listings": _bulk_insert(Listing, listings(), batch_size, per_chunk_commit),
+            "bookings": _bulk_insert(Booking, bookings(), batch_size, per_chunk_commit),
+            "booking_nights": _bulk_insert(BookingNight, nights(), batch_size, per_chunk_commit),
+            "reviews": _bulk_insert(Review, reviews(), batch_size, per_chunk_commit),
+        }
+        # bulk_create skips the model signals, so fill in the rating aggregates,
+        # the search index and the stats rollups directly
+        seeded = Listing.objects.filter(pk__gte=listing_base + first, pk__lte=listing_base + last)
+        recompute_ratings(seeded, chunk_size=batch_size)
+        rebuild_search_index(seeded, chunk_size=batch_size)
+        rebuild_listing_stats(seeded, chunk_size=batch_size)
+        return counts
+
+
+def _seed_bulk_worker(args):
+    django.setup()
+    try:
+        return seed_bulk_range(*args)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
@@ -32,61 +165,119 @@ class Command(BaseCommand):
             action="store_true",
             help="Delete all existing seeded data before seeding again.",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help=(
+                "Generate rows lazily and insert them with chunked bulk_create "
+                "(for load-test datasets)."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per bulk_create call in --bulk mode (default: 1000)",
+        )
+        parser.add_argument(
+            "--chunk-commits",
+            action="store_true",
+            help="In --bulk mode, commit after every batch instead of once per worker.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes generating and inserting rows in --bulk mode (default: 1)",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        if options["bulk"]:
+            if options["flush"]:
+                self.flush()
+            self.handle_bulk(options)
+            return
+
+        with transaction.atomic():
+            if options["flush"]:
+                self.flush()
+            self.seed(options)
+
+    def flush(self):
+        # Children first, so each delete has nothing left to cascade into
+        BookingNight.objects.all().delete()
+        ListingDailyStats.objects.all().delete()
+        PricingRule.objects.all().delete()
+        ListingRate.objects.all().delete()
+        ListingTerm.objects.all().delete()
+        Review.objects.all().delete()
+        Booking.objects.all().delete()
+        Listing.objects.all().delete()
+        self.stdout.write(self.style.WARNING("Existing data removed."))
+
+    def seed(self, options):
         num_listings = options["listings"]
         bookings_per_listing = options["bookings_per_listing"]
         reviews_per_listing = options["reviews_per_listing"]
-        do_flush = options["flush"]
-
-        if do_flush:
-            Review.objects.all().delete()
-            Booking.objects.all().delete()
-            Listing.objects.all().delete()
-            self.stdout.write(self.style.WARNING("Existing data removed."))
 
         created_count = 0
         today = date.today()
 
         for i in range(1, num_listings + 1):
-            listing = Listing.objects.create(
-                title=f"Cozy Stay #{i}",
-                description=(
-                    "A comfortable property perfect for short vacations. "
-                    "Includes amenities and is close to local attractions."
-                ),
-                location=f"City {i}",
-                price_per_night=Decimal("50.00") + Decimal(i * 10),
-                max_guests=2 + (i % 4),
-            )
+            listing = Listing.objects.create(**listing_fields(i))
             created_count += 1
 
             # Create bookings
             for b in range(1, bookings_per_listing + 1):
-                start = today + timedelta(days=i + (b - 1) * 3)
-                end = start + timedelta(days=2)
-                nights = (end - start).days
-                total = listing.price_per_night * nights
-                Booking.objects.create(
-                    listing=listing,
-                    guest_name=f"Guest {i}-{b}",
-                    guest_email=f"guest{i}{b}@example.com",
-                    start_date=start,
-                    end_date=end,
-                    total_price=total,
-                    status=Booking.Status.CONFIRMED if b % 2 else Booking.Status.PENDING,
-                )
+                fields = booking_fields(i, b, today, listing.price_per_night)
+                Booking.objects.create(listing=listing, **fields)
 
             # Create reviews
             for r in range(1, reviews_per_listing + 1):
-                Review.objects.create(
-                    listing=listing,
-                    reviewer_name=f"Reviewer {i}-{r}",
-                    rating=3 + (r % 3),
-                    comment="Great place. Would stay again!",
-                )
+                Review.objects.create(listing=listing, **review_fields(i, r))
 
         self.stdout.write(self.style.SUCCESS(f"Seed complete. Listings created: {created_count}"))
 
+    def handle_bulk(self, options):
+        num_listings = options["listings"]
+        workers = options["workers"]
+        if options["batch_size"] < 1 or workers < 1:
+            raise CommandError("--batch-size and --workers must be at least 1")
+
+        plan = {
+            "listing_base": Listing.objects.aggregate(m=Max("id"))["m"] or 0,
+            "booking_base": Booking.objects.aggregate(m=Max("id"))["m"] or 0,
+            "bookings_per_listing": options["bookings_per_listing"],
+            "reviews_per_listing": options["reviews_per_listing"],
+            "batch_size": options["batch_size"],
+            "per_chunk_commit": options["chunk_commits"],
+            "today": date.today(),
+        }
+        step = -(-num_listings // workers)
+        ranges = [
+            (first, min(first + step - 1, num_listings), plan)
+            for first in range(1, num_listings + 1, step)
+        ]
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = [seed_bulk_range(*args) for args in ranges]
+        else:
+            # Workers open their own connections; never share a socket across fork
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_seed_bulk_worker, ranges))
+        elapsed = time.perf_counter() - started
+
+        # bulk_create sends no signals, so cached listing responses are dropped here
+        invalidate_listing_responses()
 
+        totals = {}
+        if results:
+            totals = {key: sum(result[key] for result in results) for key in results[0]}
+        rows = sum(totals.values())
+        rate = rows / elapsed if elapsed else 0
+        summary = ", ".join(f"{key}: {value}" for key, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Bulk seed complete in {elapsed:.2f}s ({rate:,.0f} rows/sec). {summary}"
+        ))
@@ -0,0 +1,442 @@
+"""
+Prometheus-style metrics, served as text at /metrics.
+
+Request, database and Chapa metrics are kept in process memory, where
+recording one observation is a bisect and two additions under a lock;
+each web worker process exposes its own series, so scrape every worker
+or sum across them. Celery task metrics are
+recorded in the task's process but read by the web processes, so they
+are kept in the default cache with cache.incr; set CACHE_URL to a shared
+cache for them to show up at /metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Celery task states recorded by task_postrun
+TASK_STATES = ("SUCCESS", "FAILURE", "RETRY")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Histogram with fixed buckets; counts are stored per bucket and summed at render time."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[:-1]) if series else 0
+
+    def snapshot(self) -> List[Tuple[Tuple, List[float]]]:
+        with self._lock:
+            return sorted((labels, list(series)) for labels, series in self._series.items())
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in self.snapshot():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(float(series[-1]))}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+def _cache_incr(key: str, delta: int = 1) -> None:
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+class SharedHistogram(Histogram):
+    """
+    Histogram kept in the default cache, for observations made in other
+    processes (Celery workers).
+
+    Every series must be listed up front by ``series()``, a callable
+    returning label tuples, so rendering is a single get_many. Sums are
+    stored in microseconds to keep them integers.
+    """
+
+    def __init__(self, *args, series: Callable[[], Iterable[Tuple]], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.series = series
+
+    def _key(self, labels: Tuple, part) -> str:
+        return f"metrics:{self.name}:{':'.join(map(str, labels))}:{part}"
+
+    def observe(self, value: float, *labels) -> None:
+        _cache_incr(self._key(labels, bisect_left(self.buckets, value)))
+        _cache_incr(self._key(labels, "sum"), round(value * 1_000_000))
+
+    def count(self, *labels) -> int:
+        keys = [self._key(labels, part) for part in range(len(self.buckets) + 1)]
+        return sum(cache.get_many(keys).values())
+
+    def snapshot(self) -> List[Tuple[Tuple, List[float]]]:
+        series = sorted(self.series())
+        parts = list(range(len(self.buckets) + 1)) + ["sum"]
+        stored = cache.get_many([self._key(labels, part) for labels in series for part in parts])
+        snapshot = []
+        for labels in series:
+            values = [stored.get(self._key(labels, part), 0) for part in parts]
+            if any(values):
+                values[-1] /= 1_000_000
+                snapshot.append((labels, values))
+        return snapshot
+
+
+class SharedCounter(Counter):
+    """Counter kept in the default cache; see SharedHistogram."""
+
+    def __init__(self, *args, series: Callable[[], Iterable[Tuple]], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.series = series
+
+    def _key(self, labels: Tuple) -> str:
+        return f"metrics:{self.name}:{':'.join(map(str, labels))}"
+
+    def inc(self, *labels, amount: int = 1) -> None:
+        _cache_incr(self._key(labels), amount)
+
+    def value(self, *labels) -> float:
+        return cache.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        series = sorted(self.series())
+        stored = cache.get_many([self._key(labels) for labels in series])
+        for labels in series:
+            if self._key(labels) in stored:
+                yield f"{self.name}{_labels(self.labelnames, labels)} {stored[self._key(labels)]}"
+
+
+_metrics: List = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Iterable[str]]]]] = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    """
+    Register a callable producing (name, type, help, sample lines) at scrape
+    time, for values that are read rather than recorded, like gauges.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _task_names() -> List[str]:
+    from celery import current_app
+
+    return sorted(name for name in current_app.tasks if name.startswith("listings."))
+
+
+request_duration = register(Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route.",
+    ("route", "method", "status"),
+))
+request_queries = register(Histogram(
+    "http_request_db_queries", "Database queries per request, by route.",
+    ("route",), QUERY_COUNT_BUCKETS,
+))
+request_db_duration = register(Histogram(
+    "http_request_db_duration_seconds", "Time spent in database queries per request, by route.",
+    ("route",),
+))
+chapa_duration = register(Histogram(
+    "chapa_request_duration_seconds", "Chapa API call latency, by operation and outcome.",
+    ("operation", "outcome"),
+))
+chapa_errors = register(Counter(
+    "chapa_request_errors_total", "Failed or rejected Chapa API calls, by operation and reason.",
+    ("operation", "reason"),
+))
+task_duration = register(SharedHistogram(
+    "celery_task_duration_seconds", "Celery task run time, by task and final state.",
+    ("task", "state"), TASK_BUCKETS,
+    series=lambda: [(name, state) for name in _task_names() for state in TASK_STATES],
+))
+task_retries = register(SharedCounter(
+    "celery_task_retries_total", "Celery task retries, by task.", ("task",),
+    series=lambda: [(name,) for name in _task_names()],
+))
+
+
+@register_collector
+def gateway_metrics():
+    from .payment_utils import CircuitBreaker, gateway_stats
+
+    stats = gateway_stats()
+    breaker = stats["circuit_breaker"]
+    admission, async_admission = stats["admission"], stats["async_admission"]
+    states = (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+    yield (
+        "chapa_circuit_state", "gauge", "1 for the Chapa circuit breaker's current state.",
+        [
+            f'chapa_circuit_state{{state="{state}"}} {int(breaker["state"] == state)}'
+            for state in states
+        ],
+    )
+    yield (
+        "chapa_circuit_rejected_total", "counter",
+        "Chapa calls rejected by the open circuit breaker.",
+        [f"chapa_circuit_rejected_total {breaker['rejected_calls']}"],
+    )
+    yield (
+        "chapa_in_flight", "gauge", "Chapa calls in flight in this process.",
+        [f"chapa_in_flight {admission['in_flight'] + async_admission['in_flight']}"],
+    )
+    yield (
+        "chapa_admission_rejected_total", "counter",
+        "Chapa calls turned away by the in-flight cap.",
+        [
+            "chapa_admission_rejected_total "
+            f"{admission['rejected_calls'] + async_admission['rejected_calls']}"
+        ],
+    )
+
+
+def record_gateway_call(operation: str, outcome: str, started: Optional[float] = None) -> None:
+    """
+    Record one Chapa call attempt.
+
+    ``outcome`` is an HTTP status class ("2xx", "5xx", ...), "timeout",
+    "connection_error", or "busy"/"circuit_open" for calls turned away
+    before reaching Chapa, which have no latency (``started`` is None).
+    """
+    if started is not None:
+        chapa_duration.observe(time.perf_counter() - started, operation, outcome)
+    if outcome not in ("2xx", "3xx"):
+        chapa_errors.inc(operation, outcome)
+
+
+class _QueryTimer:
+    """execute_wrapper counting the queries of one request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+# Timer of the async request being served; sync_to_async threads run in a
+# copy of its context, so they see it too
+_request_timer: ContextVar[Optional[_QueryTimer]] = ContextVar("request_timer", default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    """execute_wrapper handing queries to the timer of the current async request, if any."""
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _route_queries_to_request():
+    """Install _timed_execute, once, on this thread's connections."""
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _timed_execute not in wrappers:
+            # First, so execute_wrapper() blocks entered later still pop their own
+            wrappers.insert(0, _timed_execute)
+
+
+class MetricsMiddleware:
+    """
+    Time every request and count its database queries, labelled by the
+    resolved URL name.
+
+    Goes first in MIDDLEWARE so the timing covers the other middleware.
+    Streaming responses are timed up to the first byte; their queries run
+    as the body is read and are not counted. Raises MiddlewareNotUsed
+    when METRICS_ENABLED is off.
+
+    Async-capable, so under ASGI requests to async views stay on the event
+    loop instead of each holding a thread for the middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        self._record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        # Connections are per thread, and the async ORM queries from the
+        # request's sync_to_async thread rather than this one
+        token = _request_timer.set(timer)
+        try:
+            await sync_to_async(_route_queries_to_request)()
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        self._record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _record(request, response, timer, elapsed):
+        match = getattr(request, "resolver_match", None)
+        # URL names, not paths, keep the label set bounded
+        route = (match.view_name or match.route) if match else "unmatched"
+        request_duration.observe(elapsed, route, request.method, response.status_code)
+        request_queries.observe(timer.count, route)
+        request_db_duration.observe(timer.duration, route)
+
+
+def metrics_view(request):
+    """
+    GET /metrics: all metrics in the Prometheus text format.
+
+    With METRICS_TOKEN set, requires ``Authorization: Bearer <token>``.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+_task_started: Dict[str, float] = {}
+
+
+@task_prerun.connect
+def _start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _record_task(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None or task is None or state not in TASK_STATES:
+        return
+    if not task.name.startswith("listings."):
+        return
+    task_duration.observe(time.perf_counter() - started, task.name, state)
+    if state == "RETRY":
+        task_retries.inc(task.name)
@@ -1,5 +1,14 @@
-from django.db import models
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator, EmailValidator
+from django.core.exceptions import ValidationError
+
+from . import geo
+
+logger = logging.getLogger(__name__)
 
 
 class Listing(models.Model):
@@ -11,20 +20,102 @@ class Listing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalised review aggregates, maintained by listings.ratings
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    # Indexed token count, maintained by listings.search for BM25 length normalisation
+    search_length = models.PositiveIntegerField(default=0, editable=False)
+
+    # Nights [rates_from, rates_until) covered by the compiled rate calendar
+    # (ListingRate) and the compiled length-of-stay rules, [min_nights,
+    # "multiplier"] pairs; maintained by listings.pricing, null/empty without
+    # pricing rules
+    rates_from = models.DateField(null=True, editable=False)
+    rates_until = models.DateField(null=True, editable=False)
+    stay_tiers = models.JSONField(default=list, editable=False)
+
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Geohash of (latitude, longitude), set on save; null without coordinates
+    geohash = models.CharField(max_length=geo.GEOHASH_LENGTH, null=True, editable=False)
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination walks (created_at, id)
+            models.Index(fields=["created_at", "id"], name="listing_created_id_idx"),
+            # Radius search reads the geohash ranges of a few cells (listings.geo)
+            models.Index(fields=["geohash"], name="listing_geohash_idx"),
+            # List filters and sorts (listings.filtering): one index per sort
+            # column, alone and behind the location filter, plus the guests filter
+            models.Index(fields=["price_per_night", "id"], name="listing_price_id_idx"),
+            models.Index(fields=["avg_rating", "id"], name="listing_rating_id_idx"),
+            models.Index(
+                fields=["location", "price_per_night", "id"], name="listing_location_price_idx"
+            ),
+            models.Index(
+                fields=["location", "avg_rating", "id"], name="listing_location_rating_idx"
+            ),
+            models.Index(
+                fields=["location", "created_at", "id"], name="listing_location_created_idx"
+            ),
+            models.Index(fields=["max_guests"], name="listing_guests_idx"),
+        ]
 
     def __str__(self) -> str:
-        return f\"{self.title} - {self.location}\"
+        return f"{self.title} - {self.location}"
+
+    def save(self, *args, **kwargs):
+        has_point = self.latitude is not None and self.longitude is not None
+        self.geohash = geo.encode(self.latitude, self.longitude) if has_point else None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, keyed "1" to "5"."""
+        return {str(stars): getattr(self, f"rating_count_{stars}") for stars in range(1, 6)}
+
+
+class BookingConflict(IntegrityError):
+    """Raised when a booking claims a night that another booking already holds."""
+
+
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        """Bookings that still hold inventory (anything not cancelled)."""
+        return self.exclude(status=Booking.Status.CANCELLED)
+
+    def overlapping(self, start_date, end_date):
+        """
+        Bookings whose stay intersects [start_date, end_date).
+
+        end_date is the check-out day, so a stay ending on start_date
+        does not overlap.
+        """
+        return self.filter(start_date__lt=end_date, end_date__gt=start_date)
 
 
 class Booking(models.Model):
     class Status(models.TextChoices):
-        PENDING = \"PENDING\", \"Pending\"
-        CONFIRMED = \"CONFIRMED\", \"Confirmed\"
-        CANCELLED = \"CANCELLED\", \"Cancelled\"
+        PENDING = "PENDING", "Pending"
+        CONFIRMED = "CONFIRMED", "Confirmed"
+        CANCELLED = "CANCELLED", "Cancelled"
 
-    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name=\"bookings\")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bookings")
     guest_name = models.CharField(max_length=150)
     guest_email = models.EmailField(validators=[EmailValidator()])
     start_date = models.DateField()
@@ -32,61 +123,339 @@ class Booking(models.Model):
     total_price = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set in the transaction that confirms the booking, cleared once the
+    # confirmation email is sent (tasks.send_due_confirmation_emails)
+    confirmation_email_due = models.BooleanField(default=False)
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
-        ordering = [\"-created_at\"]
+        ordering = ["-created_at"]
         constraints = [
             models.CheckConstraint(
-                check=models.Q(end_date__gte=models.F(\"start_date\")),
-                name=\"booking_end_after_start\",
+                check=models.Q(end_date__gte=models.F("start_date")),
+                name="booking_end_after_start",
             )
         ]
+        indexes = [
+            # Covers the availability overlap probe
+            # (listing_id = ? AND start_date < ? AND end_date > ?)
+            models.Index(
+                fields=["listing", "start_date", "end_date", "status"],
+                name="booking_availability_idx",
+            ),
+            # Keyset pagination walks (created_at, id)
+            models.Index(fields=["created_at", "id"], name="booking_created_id_idx"),
+            # Hold expiry walks PENDING bookings oldest first (listings.holds)
+            models.Index(fields=["status", "created_at"], name="booking_status_created_idx"),
+            # The confirmation email sweep reads only the few flagged rows
+            models.Index(
+                fields=["id"],
+                condition=models.Q(confirmation_email_due=True),
+                name="booking_email_due_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Booking #{self.id} for {self.listing} ({self.start_date} → {self.end_date})"
+
+    @property
+    def hold_expires_at(self):
+        """
+        When an unpaid PENDING booking stops holding its nights.
+
+        None for confirmed and cancelled bookings, and when holds are
+        disabled (BOOKING_HOLD_MINUTES = 0).
+        """
+        if not settings.BOOKING_HOLD_MINUTES:
+            return None
+        if self.status != Booking.Status.PENDING or self.created_at is None:
+            return None
+        return self.created_at + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+    def nights(self):
+        """Dates of each night of the stay (the check-out day is excluded)."""
+        stay = (self.end_date - self.start_date).days
+        return [self.start_date + timedelta(days=n) for n in range(stay)]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        claim_fields = {"listing", "listing_id", "start_date", "end_date", "status"}
+        if update_fields is not None and not claim_fields.intersection(update_fields):
+            return super().save(*args, **kwargs)
+        adding = self._state.adding
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self.claim_nights()
+        except BookingConflict:
+            if adding:
+                # The insert was rolled back; don't leave a dangling pk behind.
+                self.pk = None
+                self._state.adding = True
+            raise
+
+    def claim_nights(self):
+        """
+        Replace this booking's per-night claims.
+
+        The unique (listing, night) constraint on BookingNight makes the
+        database arbitrate concurrent bookings for the same dates: exactly
+        one insert wins and the others raise BookingConflict, with no row
+        locks held while the request is being validated.
+        """
+        self.claimed_nights.all().delete()
+        if self.status == Booking.Status.CANCELLED:
+            return
+        claims = [
+            BookingNight(booking=self, listing_id=self.listing_id, night=night)
+            for night in self.nights()
+        ]
+        try:
+            with transaction.atomic():
+                BookingNight.objects.bulk_create(claims)
+        except IntegrityError as exc:
+            raise BookingConflict(
+                f"Listing {self.listing_id} is already booked "
+                f"between {self.start_date} and {self.end_date}"
+            ) from exc
+
+
+class BookingNight(models.Model):
+    """One occupied night of a listing, owned by a non-cancelled booking."""
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name="claimed_nights")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="claimed_nights")
+    night = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "night"], name="booking_night_unique"),
+        ]
 
     def __str__(self) -> str:
-        return f\"Booking #{self.id} for {self.listing} ({self.start_date} → {self.end_date})\"
+        return f"{self.listing_id} @ {self.night} (booking #{self.booking_id})"
 
 
 class Review(models.Model):
-    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name=\"reviews\")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="reviews")
     reviewer_name = models.CharField(max_length=150)
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = [\"-created_at\"]
+        ordering = ["-created_at"]
 
     def __str__(self) -> str:
-        return f\"Review {self.rating}/5 by {self.reviewer_name} on {self.listing}\"
+        return f"Review {self.rating}/5 by {self.reviewer_name} on {self.listing}"
 
 
 class Payment(models.Model):
-    \"\"\"
+    """
     Payment model to store payment-related information.
     
     Stores booking reference, payment status, amount, and transaction ID
     from Chapa API.
-    \"\"\"
+    """
     class Status(models.TextChoices):
-        PENDING = \"PENDING\", \"Pending\"
-        COMPLETED = \"COMPLETED\", \"Completed\"
-        FAILED = \"FAILED\", \"Failed\"
+        PENDING = "PENDING", "Pending"
+        COMPLETED = "COMPLETED", "Completed"
+        FAILED = "FAILED", "Failed"
 
-    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name=\"payment\")
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name="payment")
     booking_reference = models.CharField(max_length=100, unique=True, db_index=True)
     transaction_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    checkout_url = models.URLField(max_length=500, blank=True, null=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = [\"-created_at\"]
+        ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=[\"booking_reference\"]),
-            models.Index(fields=[\"transaction_id\"]),
-            models.Index(fields=[\"status\"]),
+            models.Index(fields=["booking_reference"]),
+            models.Index(fields=["transaction_id"]),
+            models.Index(fields=["status"]),
+            models.Index(fields=["status", "created_at"], name="payment_status_created_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Payment for {self.booking_reference} - {self.status} ({self.amount})"
+
+    def mark_completed(self, transaction_id) -> bool:
+        """
+        Move the payment to COMPLETED and confirm its booking.
+
+        The transition is a conditional UPDATE, so when several callbacks
+        race only one of them performs it; that caller gets True and is
+        responsible for side effects such as queueing the confirmation
+        email. The booking is flagged confirmation_email_due in the same
+        transaction, so the email is sent even if queueing it is lost.
+
+        A payment that completes after its booking's hold expired still
+        confirms the booking if its nights are free. If they were booked
+        again meanwhile, the payment is recorded as COMPLETED for a refund,
+        the booking stays cancelled and False is returned.
+        """
+        confirmed = True
+        with transaction.atomic():
+            updated = (
+                Payment.objects.filter(pk=self.pk)
+                .exclude(status=Payment.Status.COMPLETED)
+                .update(
+                    status=Payment.Status.COMPLETED,
+                    transaction_id=transaction_id,
+                    updated_at=timezone.now(),
+                )
+            )
+            if updated:
+                booking = self.booking
+                booking.status = Booking.Status.CONFIRMED
+                booking.confirmation_email_due = True
+                try:
+                    booking.save(update_fields=["status", "confirmation_email_due"])
+                except BookingConflict:
+                    logger.error(
+                        f"Payment {self.booking_reference} completed after booking #{booking.pk} "
+                        f"lost its nights; it needs a refund"
+                    )
+                    booking.status = Booking.Status.CANCELLED
+                    booking.confirmation_email_due = False
+                    confirmed = False
+        if updated:
+            self.status = Payment.Status.COMPLETED
+            self.transaction_id = transaction_id
+        return bool(updated) and confirmed
+
+    def mark_failed(self) -> bool:
+        """Move the payment to FAILED unless it has already completed."""
+        updated = (
+            Payment.objects.filter(pk=self.pk)
+            .exclude(status__in=[Payment.Status.COMPLETED, Payment.Status.FAILED])
+            .update(status=Payment.Status.FAILED, updated_at=timezone.now())
+        )
+        if updated:
+            self.status = Payment.Status.FAILED
+        return bool(updated)
+
+
+class ListingTerm(models.Model):
+    """Posting in the listings full-text index: how often a term occurs in a listing."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="search_terms")
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # Leading on term, so a query reads only the postings of its own terms
+            models.UniqueConstraint(fields=["term", "listing"], name="listing_term_unique"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.term} in {self.listing_id} x{self.frequency}"
+
+
+class PricingRule(models.Model):
+    """
+    A price multiplier for some of a listing's nights or stays.
+
+    Season rules cover the nights from start_date up to (not including)
+    end_date, weekend rules Friday and Saturday nights, and length-of-stay
+    rules whole stays of at least min_nights. Multipliers of rules that
+    apply together are multiplied. Compiled into ListingRate rows by
+    listings.pricing.
+    """
+    class Kind(models.TextChoices):
+        SEASON = "season", "Season"
+        WEEKEND = "weekend", "Weekend"
+        LENGTH_OF_STAY = "length_of_stay", "Length of stay"
+
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="pricing_rules")
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    multiplier = models.DecimalField(
+        max_digits=5, decimal_places=3, validators=[MinValueValidator(0)]
+    )
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    min_nights = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1)]
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["listing", "kind", "start_date", "min_nights"]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} x{self.multiplier} for listing {self.listing_id}"
+
+    def clean(self):
+        valid_season = self.start_date and self.end_date and self.start_date < self.end_date
+        if self.kind == self.Kind.SEASON and not valid_season:
+            raise ValidationError("A season rule needs a start_date before its end_date.")
+        if self.kind == self.Kind.LENGTH_OF_STAY and not self.min_nights:
+            raise ValidationError("A length-of-stay rule needs min_nights.")
+
+
+class ListingRate(models.Model):
+    """
+    The nightly rate of one night of a listing, where it differs from
+    price_per_night. Compiled from PricingRule rows by listings.pricing.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="rates")
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # Also serves the per-listing date range sums of quotes
+            models.UniqueConstraint(fields=["listing", "date"], name="listing_rate_unique"),
         ]
 
     def __str__(self) -> str:
-        return f\"Payment for {self.booking_reference} - {self.status} ({self.amount})\"
+        return f"{self.listing_id} @ {self.date}: {self.rate}"
+
+
+class ListingDailyStats(models.Model):
+    """
+    One day of a listing's bookings, rolled up for reporting.
+
+    Each booked night counts towards the day it falls on, by booking
+    status; confirmed nights also carry their share of the booking's
+    total_price. Days without any booking have no row. Maintained by
+    listings.stats.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    # Nights held by pending or confirmed bookings (0 or 1 while bookings can't overlap)
+    nights_booked = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_nights = models.PositiveIntegerField(default=0)
+    confirmed_nights = models.PositiveIntegerField(default=0)
+    cancelled_nights = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves the per-listing date range scans of the stats endpoint
+            models.UniqueConstraint(fields=["listing", "date"], name="listing_daily_stats_unique"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.listing_id} @ {self.date}: {self.nights_booked} booked, {self.revenue}"
+
+
+class ListingStatsRefresh(models.Model):
+    """
+    A span of a listing's daily stats waiting to be recomputed.
+
+    Written in the same transaction as the booking change that made the
+    span stale and deleted by the refresh_listing_stats task once it has
+    recomputed it, so no refresh is lost with the process that queued it.
+    """
+    # Not a foreign key: deleting a listing queues spans for the bookings it cascades to
+    listing_id = models.BigIntegerField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    def __str__(self) -> str:
+        return f"{self.listing_id}: {self.start_date} to {self.end_date}"
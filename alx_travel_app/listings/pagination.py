@@ -0,0 +1,160 @@
+"""
+Pagination classes for the listings API.
+"""
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.core.paginator import InvalidPage
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination over (created_at, id), newest first.
+
+    Each page is a single indexed range scan starting after the last row of
+    the previous page, so deep pages cost the same as the first one and no
+    COUNT(*) is issued. The cursor is an opaque token encoding that row's
+    (created_at, id).
+    """
+    page_size = PageNumberPagination.page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def encode_cursor(self, obj):
+        # Pages are model instances or .values() rows
+        if isinstance(obj, dict):
+            created_at, pk = obj['created_at'], obj['id']
+        else:
+            created_at, pk = obj.created_at, obj.pk
+        raw = f"{created_at.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def page_rows(self, queryset, request):
+        """The query for the requested page plus one row."""
+        self.request = request
+        queryset = queryset.order_by('-created_at', '-id')
+
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            created_at, pk = self.decode_cursor(token)
+            # Written as a range plus a tie filter rather than an OR so the
+            # planner can seek straight into the (created_at, id) index
+            queryset = queryset.filter(created_at__lte=created_at).exclude(
+                created_at=created_at, id__gte=pk
+            )
+        # One extra row tells us whether there is a next page without counting
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_rows(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() through the async ORM interface."""
+        return self.set_page([row async for row in self.page_rows(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptInKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination unless the client opts into keyset pagination.
+
+    Clients opt in with ``?pagination=cursor`` and then follow the ``next``
+    links, which carry a ``cursor`` parameter. Keyset pages omit the total
+    count.
+    """
+    mode_query_param = 'pagination'
+
+    def wants_keyset(self, request):
+        params = request.query_params
+        return (
+            params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.wants_keyset(request) else None
+        if self.keyset is not None:
+            self.keyset.page_size = self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() through the async ORM interface.
+
+        Mirrors PageNumberPagination.paginate_queryset, with the count and
+        the page rows fetched by awaited queries.
+        """
+        self.keyset = KeysetPagination() if self.wants_keyset(request) else None
+        if self.keyset is not None:
+            self.keyset.page_size = self.page_size
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return [row async for row in queryset]
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property; filling it in keeps the
+        # paginator from counting synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            )
+        self.page.object_list = [row async for row in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
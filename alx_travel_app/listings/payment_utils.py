@@ -1,14 +1,585 @@
 """
 Utility functions for Chapa payment API integration.
+
+Sync callers go through a pooled requests session; async views use the
+a-prefixed variants, which await Chapa on the running event loop through
+httpx when it is installed. Both share the circuit breaker and metrics.
 """
+import asyncio
 import logging
+import math
+import random
+import threading
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager, contextmanager
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+
+from .metrics import record_gateway_call
+from django.core.cache import cache
 from typing import Dict, Optional
 
+try:
+    import httpx
+except ImportError:  # optional dependency
+    httpx = None
+
 logger = logging.getLogger(__name__)
 
 
+class GatewayUnavailable(requests.exceptions.RequestException):
+    """
+    Raised without touching the network while the circuit breaker is open.
+
+    ``retry_after`` is the number of seconds after which a call may be let
+    through again.
+    """
+    def __init__(self, *args, retry_after: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+class GatewayBusy(GatewayUnavailable):
+    """Raised when the cap on concurrent gateway calls is reached."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for calls to the payment gateway.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single trial
+    call through (half-open); success closes it again, failure re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._total_failures = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            cooled_down = time.monotonic() - self._opened_at >= self.reset_timeout
+            if self._state == self.OPEN and cooled_down:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def retry_after(self) -> int:
+        """Whole seconds until an open breaker lets a trial call through."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 1
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            return max(1, math.ceil(remaining))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """Free the trial slot of an allowed call that ended without an outcome (it raised)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._total_failures += 1
+            self._trial_in_flight = False
+            should_open = (
+                self._state == self.HALF_OPEN
+                or self._consecutive_failures >= self.failure_threshold
+            )
+            if should_open and self._state != self.OPEN:
+                self._state = self.OPEN
+                self._times_opened += 1
+                logger.warning("Chapa circuit breaker opened")
+            if should_open:
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "total_failures": self._total_failures,
+                "rejected_calls": self._rejected,
+                "times_opened": self._times_opened,
+            }
+
+
+class AdmissionLimiter:
+    """
+    Caps the number of gateway calls in flight in this process.
+
+    A caller beyond ``limit`` waits up to ``wait`` seconds for a slot and
+    then gets GatewayBusy, so a burst is turned away quickly instead of
+    piling up worker threads behind slow gateway calls.
+    """
+    def __init__(self, limit: int = 20, wait: float = 0.25, retry_after: int = 1):
+        self.limit = limit
+        self.wait = wait
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak = 0
+        self._rejected = 0
+
+    @contextmanager
+    def admit(self):
+        if not self._semaphore.acquire(timeout=self.wait):
+            with self._lock:
+                self._rejected += 1
+            raise GatewayBusy(
+                "Payment gateway busy (too many calls in flight)", retry_after=self.retry_after
+            )
+        with self._lock:
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak,
+                "rejected_calls": self._rejected,
+            }
+
+
+class AsyncAdmissionLimiter:
+    """
+    AdmissionLimiter for coroutines on one event loop.
+
+    A caller beyond ``limit`` is suspended, not blocked, for up to ``wait``
+    seconds and then gets GatewayBusy. Counters are only touched from the
+    loop's thread, so they need no lock.
+    """
+    def __init__(self, limit: int = 500, wait: float = 0.25, retry_after: int = 1):
+        self.limit = limit
+        self.wait = wait
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(limit)
+        self._in_flight = 0
+        self._peak = 0
+        self._rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise GatewayBusy(
+                "Payment gateway busy (too many calls in flight)", retry_after=self.retry_after
+            )
+        self._in_flight += 1
+        self._peak = max(self._peak, self._in_flight)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak,
+            "rejected_calls": self._rejected,
+        }
+
+
+class AsyncGateway:
+    """The httpx client and admission limiter used for Chapa calls on one event loop."""
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.CHAPA_ASYNC_MAX_IN_FLIGHT,
+                max_keepalive_connections=settings.CHAPA_POOL_MAXSIZE,
+            ),
+            timeout=httpx.Timeout(
+                settings.CHAPA_READ_TIMEOUT, connect=settings.CHAPA_CONNECT_TIMEOUT
+            ),
+        )
+        self.limiter = AsyncAdmissionLimiter(
+            limit=settings.CHAPA_ASYNC_MAX_IN_FLIGHT,
+            wait=settings.CHAPA_ADMISSION_WAIT,
+            retry_after=settings.CHAPA_BUSY_RETRY_AFTER,
+        )
+
+
+_client_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_breaker: Optional[CircuitBreaker] = None
+_limiter: Optional[AdmissionLimiter] = None
+_async_gateways: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGateway]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Exceptions meaning the call to Chapa itself failed
+REQUEST_ERRORS = (requests.exceptions.RequestException,) + (
+    (httpx.HTTPError,) if httpx is not None else ()
+)
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive session used for Chapa calls.
+
+    Created lazily so that forked workers (Celery prefork, gunicorn) each
+    build their own connection pool after the fork.
+    """
+    global _session
+    if _session is None:
+        with _client_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=2,
+                    pool_maxsize=settings.CHAPA_POOL_MAXSIZE,
+                    max_retries=0,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Return the process-wide circuit breaker guarding Chapa calls."""
+    global _breaker
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=settings.CHAPA_BREAKER_FAILURE_THRESHOLD,
+                    reset_timeout=settings.CHAPA_BREAKER_RESET_TIMEOUT,
+                )
+    return _breaker
+
+
+def get_admission_limiter() -> AdmissionLimiter:
+    """Return the process-wide cap on concurrent Chapa calls."""
+    global _limiter
+    if _limiter is None:
+        with _client_lock:
+            if _limiter is None:
+                _limiter = AdmissionLimiter(
+                    limit=settings.CHAPA_MAX_IN_FLIGHT,
+                    wait=settings.CHAPA_ADMISSION_WAIT,
+                    retry_after=settings.CHAPA_BUSY_RETRY_AFTER,
+                )
+    return _limiter
+
+
+def get_async_gateway() -> AsyncGateway:
+    """
+    Return the httpx client and admission limiter of the running event loop.
+
+    Both are bound to the loop they are used on, so each loop (one per
+    ASGI worker process) gets its own, created on its first Chapa call.
+    """
+    loop = asyncio.get_running_loop()
+    gateway = _async_gateways.get(loop)
+    if gateway is None:
+        with _client_lock:
+            gateway = _async_gateways.get(loop)
+            if gateway is None:
+                gateway = _async_gateways[loop] = AsyncGateway()
+    return gateway
+
+
+def reset_gateway_client() -> None:
+    """Drop the pooled session, breaker and limiters so they are rebuilt from settings."""
+    global _session, _breaker, _limiter
+    with _client_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _breaker = None
+        _limiter = None
+        # Async clients can only be closed on their own loop; dropping them
+        # lets their connections close as they are collected
+        _async_gateways.clear()
+
+
+def gateway_stats() -> Dict:
+    """
+    Circuit breaker state, admission limiter and connection pool usage, for metrics export.
+
+    Pool entries are keyed by host and report open connections, idle
+    connections ready for reuse and requests sent over the pool.
+    ``async_admission`` sums the limiters of every event loop's async client.
+    """
+    pools = {}
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                    "maxsize": settings.CHAPA_POOL_MAXSIZE,
+                }
+    async_limiters = [gateway.limiter.stats() for gateway in list(_async_gateways.values())]
+    return {
+        "circuit_breaker": get_circuit_breaker().stats(),
+        "admission": get_admission_limiter().stats(),
+        "async_admission": {
+            "limit": settings.CHAPA_ASYNC_MAX_IN_FLIGHT,
+            "in_flight": sum(stats["in_flight"] for stats in async_limiters),
+            "peak_in_flight": max((stats["peak_in_flight"] for stats in async_limiters), default=0),
+            "rejected_calls": sum(stats["rejected_calls"] for stats in async_limiters),
+        },
+        "pools": pools,
+    }
+
+
+def _auth_headers() -> Dict:
+    # Without a key there is nothing to send, and httpx rejects a bare "Bearer "
+    if not settings.CHAPA_SECRET_KEY:
+        return {}
+    return {"Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}"}
+
+
+def _gateway_request(
+    method: str, url: str, operation: str, retries: int = 0, **kwargs
+) -> requests.Response:
+    """
+    Send a request to Chapa through the pooled session and circuit breaker.
+
+    Connection errors, timeouts and 5xx responses count as gateway failures.
+    Up to ``retries`` extra attempts are made with full-jitter exponential
+    backoff; only pass retries for idempotent calls. Each attempt needs a
+    slot from the admission limiter (GatewayBusy when none frees up) and a
+    closed circuit (GatewayUnavailable). Every attempt is recorded in the
+    Chapa metrics under ``operation``.
+    """
+    breaker = get_circuit_breaker()
+    limiter = get_admission_limiter()
+    timeout = (settings.CHAPA_CONNECT_TIMEOUT, settings.CHAPA_READ_TIMEOUT)
+    headers = _auth_headers()
+
+    for attempt in range(retries + 1):
+        started = None
+        try:
+            with limiter.admit():
+                if not breaker.allow():
+                    raise GatewayUnavailable(
+                        "Payment gateway unavailable (circuit open)",
+                        retry_after=breaker.retry_after(),
+                    )
+                started = time.perf_counter()
+                response = get_session().request(
+                    method, url, headers=headers, timeout=timeout, **kwargs
+                )
+        except GatewayUnavailable as e:
+            record_gateway_call(operation, "busy" if isinstance(e, GatewayBusy) else "circuit_open")
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            timed_out = isinstance(e, requests.exceptions.Timeout)
+            record_gateway_call(
+                operation, "timeout" if timed_out else "connection_error", started
+            )
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+        except BaseException:
+            # Anything else (a truncated body, a bug) says nothing certain
+            # about Chapa, but the half-open trial slot must still be freed
+            if started is not None:
+                breaker.abandon()
+            raise
+        else:
+            record_gateway_call(operation, f"{response.status_code // 100}xx", started)
+            if response.status_code < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response
+        delay = random.uniform(0, settings.CHAPA_RETRY_BACKOFF * (2 ** attempt))
+        logger.warning(
+            f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 1} of {retries})"
+        )
+        time.sleep(delay)
+
+
+async def _agateway_request(
+    method: str, url: str, operation: str, retries: int = 0, **kwargs
+) -> "httpx.Response":
+    """
+    _gateway_request() on the running event loop's httpx client.
+
+    Same breaker, retries and metrics; waiting for an admission slot, for
+    Chapa and between retries suspends the caller instead of a thread.
+    """
+    breaker = get_circuit_breaker()
+    gateway = get_async_gateway()
+    headers = _auth_headers()
+
+    for attempt in range(retries + 1):
+        started = None
+        try:
+            async with gateway.limiter.admit():
+                if not breaker.allow():
+                    raise GatewayUnavailable(
+                        "Payment gateway unavailable (circuit open)",
+                        retry_after=breaker.retry_after(),
+                    )
+                started = time.perf_counter()
+                response = await gateway.client.request(method, url, headers=headers, **kwargs)
+        except GatewayUnavailable as e:
+            record_gateway_call(operation, "busy" if isinstance(e, GatewayBusy) else "circuit_open")
+            raise
+        except httpx.TransportError as e:
+            timed_out = isinstance(e, httpx.TimeoutException)
+            record_gateway_call(
+                operation, "timeout" if timed_out else "connection_error", started
+            )
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+        except BaseException:
+            # As in _gateway_request; here that includes CancelledError, when
+            # the client of an ASGI request disconnects mid-call
+            if started is not None:
+                breaker.abandon()
+            raise
+        else:
+            record_gateway_call(operation, f"{response.status_code // 100}xx", started)
+            if response.status_code < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response
+        delay = random.uniform(0, settings.CHAPA_RETRY_BACKOFF * (2 ** attempt))
+        logger.warning(
+            f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 1} of {retries})"
+        )
+        await asyncio.sleep(delay)
+
+
+def _call_failed(action: str, tx_ref: str, e: Exception) -> Dict:
+    """Result of a Chapa call that raised; ``action`` names it in the log."""
+    if isinstance(e, REQUEST_ERRORS):
+        error_msg = f"Request error: {str(e)}"
+    else:
+        error_msg = f"Unexpected error: {str(e)}"
+    logger.error(f"Payment {action} error for tx_ref {tx_ref}: {error_msg}")
+    result = {
+        "success": False,
+        "error": error_msg,
+    }
+    if isinstance(e, GatewayUnavailable):
+        # Turned away before reaching Chapa; the caller may retry later
+        result["retry_after"] = e.retry_after
+    return result
+
+
+def _initiation_payload(
+    amount: float,
+    email: str,
+    first_name: str,
+    last_name: str,
+    tx_ref: str,
+    callback_url: str,
+    currency: str,
+) -> Dict:
+    return {
+        "amount": str(amount),
+        "currency": currency,
+        "email": email,
+        "first_name": first_name,
+        "last_name": last_name,
+        "tx_ref": tx_ref,
+        "callback_url": callback_url,
+        "return_url": callback_url,
+    }
+
+
+def _initiation_result(tx_ref: str, data: Dict) -> Dict:
+    """Result of an initialize call from Chapa's JSON response."""
+    if data.get("status") == "success":
+        logger.info(f"Payment initiated successfully for tx_ref: {tx_ref}")
+        return {
+            "success": True,
+            "data": data.get("data", {}),
+            "checkout_url": data.get("data", {}).get("checkout_url"),
+        }
+    else:
+        error_msg = data.get("message", "Payment initiation failed")
+        logger.error(f"Payment initiation failed for tx_ref {tx_ref}: {error_msg}")
+        return {
+            "success": False,
+            "error": error_msg,
+        }
+
+
+def _verification_result(tx_ref: str, data: Dict) -> Dict:
+    """Result of a verify call from Chapa's JSON response."""
+    if data.get("status") == "success":
+        payment_data = data.get("data", {})
+        payment_status = payment_data.get("status", "").lower()
+
+        logger.info(
+            f"Payment verification successful for tx_ref: {tx_ref}, status: {payment_status}"
+        )
+        return {
+            "success": True,
+            "data": payment_data,
+            "status": payment_status,
+        }
+    else:
+        error_msg = data.get("message", "Payment verification failed")
+        logger.error(f"Payment verification failed for tx_ref {tx_ref}: {error_msg}")
+        return {
+            "success": False,
+            "error": error_msg,
+        }
+
+
 def initiate_chapa_payment(
     amount: float,
     email: str,
@@ -34,56 +605,47 @@ def initiate_chapa_payment(
         Dictionary containing payment response from Chapa API
     """
     url = f"{settings.CHAPA_API_URL}/transaction/initialize"
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-        "Content-Type": "application/json",
-    }
-    
-    payload = {
-        "amount": str(amount),
-        "currency": currency,
-        "email": email,
-        "first_name": first_name,
-        "last_name": last_name,
-        "tx_ref": tx_ref,
-        "callback_url": callback_url,
-        "return_url": callback_url,
-    }
+    payload = _initiation_payload(
+        amount, email, first_name, last_name, tx_ref, callback_url, currency
+    )
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = _gateway_request("POST", url, "initialize", json=payload)
         response.raise_for_status()
-        data = response.json()
-        
-        if data.get("status") == "success":
-            logger.info(f"Payment initiated successfully for tx_ref: {tx_ref}")
-            return {
-                "success": True,
-                "data": data.get("data", {}),
-                "checkout_url": data.get("data", {}).get("checkout_url"),
-            }
-        else:
-            error_msg = data.get("message", "Payment initiation failed")
-            logger.error(f"Payment initiation failed for tx_ref {tx_ref}: {error_msg}")
-            return {
-                "success": False,
-                "error": error_msg,
-            }
-            
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Request error: {str(e)}"
-        logger.error(f"Payment initiation error for tx_ref {tx_ref}: {error_msg}")
-        return {
-            "success": False,
-            "error": error_msg,
-        }
+        return _initiation_result(tx_ref, response.json())
     except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        logger.error(f"Payment initiation error for tx_ref {tx_ref}: {error_msg}")
-        return {
-            "success": False,
-            "error": error_msg,
-        }
+        return _call_failed("initiation", tx_ref, e)
+
+
+async def ainitiate_chapa_payment(
+    amount: float,
+    email: str,
+    first_name: str,
+    last_name: str,
+    tx_ref: str,
+    callback_url: str,
+    currency: str = "ETB",
+) -> Dict:
+    """
+    initiate_chapa_payment() for async views.
+
+    Without httpx installed, the blocking call runs on a worker thread.
+    """
+    if httpx is None:
+        return await sync_to_async(initiate_chapa_payment, thread_sensitive=False)(
+            amount, email, first_name, last_name, tx_ref, callback_url, currency
+        )
+    url = f"{settings.CHAPA_API_URL}/transaction/initialize"
+    payload = _initiation_payload(
+        amount, email, first_name, last_name, tx_ref, callback_url, currency
+    )
+
+    try:
+        response = await _agateway_request("POST", url, "initialize", json=payload)
+        response.raise_for_status()
+        return _initiation_result(tx_ref, response.json())
+    except Exception as e:
+        return _call_failed("initiation", tx_ref, e)
 
 
 def verify_chapa_payment(tx_ref: str) -> Dict:
@@ -97,44 +659,213 @@ def verify_chapa_payment(tx_ref: str) -> Dict:
         Dictionary containing payment verification response from Chapa API
     """
     url = f"{settings.CHAPA_API_URL}/transaction/verify/{tx_ref}"
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-    }
-    
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = _gateway_request("GET", url, "verify", retries=settings.CHAPA_VERIFY_RETRIES)
         response.raise_for_status()
-        data = response.json()
-        
-        if data.get("status") == "success":
-            payment_data = data.get("data", {})
-            payment_status = payment_data.get("status", "").lower()
-            
-            logger.info(f"Payment verification successful for tx_ref: {tx_ref}, status: {payment_status}")
-            return {
-                "success": True,
-                "data": payment_data,
-                "status": payment_status,
-            }
-        else:
-            error_msg = data.get("message", "Payment verification failed")
-            logger.error(f"Payment verification failed for tx_ref {tx_ref}: {error_msg}")
-            return {
-                "success": False,
-                "error": error_msg,
-            }
-            
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Request error: {str(e)}"
-        logger.error(f"Payment verification error for tx_ref {tx_ref}: {error_msg}")
-        return {
-            "success": False,
-            "error": error_msg,
-        }
+        return _verification_result(tx_ref, response.json())
     except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        logger.error(f"Payment verification error for tx_ref {tx_ref}: {error_msg}")
-        return {
-            "success": False,
-            "error": error_msg,
-        }
+        return _call_failed("verification", tx_ref, e)
+
+
+async def averify_chapa_payment(tx_ref: str) -> Dict:
+    """
+    verify_chapa_payment() for async views.
+
+    Without httpx installed, the blocking call runs on a worker thread.
+    """
+    if httpx is None:
+        return await sync_to_async(verify_chapa_payment, thread_sensitive=False)(tx_ref)
+    url = f"{settings.CHAPA_API_URL}/transaction/verify/{tx_ref}"
+    try:
+        response = await _agateway_request(
+            "GET", url, "verify", retries=settings.CHAPA_VERIFY_RETRIES
+        )
+        response.raise_for_status()
+        return _verification_result(tx_ref, response.json())
+    except Exception as e:
+        return _call_failed("verification", tx_ref, e)
+
+
+def _customer(booking) -> Dict:
+    """Chapa customer fields of a booking's guest."""
+    # Chapa expects the customer name split into first and last name
+    guest_name_parts = booking.guest_name.split(maxsplit=1)
+    first_name = guest_name_parts[0] if guest_name_parts else booking.guest_name
+    last_name = guest_name_parts[1] if len(guest_name_parts) > 1 else ""
+
+    return {
+        "amount": float(booking.total_price),
+        "email": booking.guest_email,
+        "first_name": first_name,
+        "last_name": last_name,
+    }
+
+
+def initiate_booking_payment(payment, callback_url: str) -> Dict:
+    """
+    Initiate a Chapa payment for a Payment using its booking's guest details.
+
+    Args:
+        payment: Payment instance (its booking is read for customer details)
+        callback_url: Callback URL for payment verification
+
+    Returns:
+        Dictionary containing payment response from Chapa API
+    """
+    return initiate_chapa_payment(
+        **_customer(payment.booking),
+        tx_ref=payment.booking_reference,
+        callback_url=callback_url,
+    )
+
+
+async def ainitiate_booking_payment(payment, callback_url: str) -> Dict:
+    """
+    initiate_booking_payment() for async views.
+
+    ``payment.booking`` must already be loaded: lazy loads aren't allowed
+    on the event loop.
+    """
+    return await ainitiate_chapa_payment(
+        **_customer(payment.booking),
+        tx_ref=payment.booking_reference,
+        callback_url=callback_url,
+    )
+
+
+# Chapa payment statuses that end a payment unsuccessfully; anything other
+# than these and "success" (e.g. "pending") may still change
+FAILED_STATUSES = ("failed", "cancelled")
+
+
+def is_final(result: Dict) -> bool:
+    """Whether a verification result reports a payment that can no longer change."""
+    return bool(result.get("success")) and result.get("status") in ("success", *FAILED_STATUSES)
+
+
+def _verify_cache_keys(tx_ref: str):
+    return f"chapa:verify:{tx_ref}", f"chapa:verify-lock:{tx_ref}"
+
+
+def _shared_result_keys(tx_ref: str, holder: Optional[str]):
+    """
+    Where a lock holder's answer may be found, final result first.
+
+    Non-final answers are kept per lock token, so waiters only ever read
+    the answer of the call they waited on.
+    """
+    result_key, _ = _verify_cache_keys(tx_ref)
+    if holder is None:
+        return [result_key]
+    return [result_key, f"chapa:verify-pending:{tx_ref}:{holder}"]
+
+
+def _first_shared_result(keys, found: Dict) -> Optional[Dict]:
+    return next((found[key] for key in keys if key in found), None)
+
+
+def _verification_in_progress() -> Dict:
+    return {
+        "success": False,
+        "error": "Payment verification already in progress",
+    }
+
+
+def verify_chapa_payment_cached(tx_ref: str) -> Dict:
+    """
+    Verify a payment, collapsing repeated and concurrent calls per tx_ref.
+
+    Final verification results (see is_final) are cached for
+    CHAPA_VERIFY_CACHE_TTL seconds; a pending payment is asked about again
+    by each new caller, so paying is seen as soon as Chapa reports it. On a
+    cache miss one caller takes a per-tx_ref lock in the cache and calls
+    Chapa; concurrent callers wait for that result, final or not, instead
+    of issuing their own upstream request. Non-final results are kept for
+    those waiters for CHAPA_VERIFY_PENDING_TTL seconds.
+
+    Args:
+        tx_ref: Transaction reference from Chapa
+
+    Returns:
+        Dictionary containing payment verification response from Chapa API
+    """
+    result_key, lock_key = _verify_cache_keys(tx_ref)
+    lock_timeout = settings.CHAPA_VERIFY_LOCK_TIMEOUT
+
+    cached = cache.get(result_key)
+    if cached is not None:
+        return cached
+
+    token = uuid.uuid4().hex
+    holder = None
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock_key, token, timeout=lock_timeout):
+        holder = cache.get(lock_key) or holder
+        if time.monotonic() >= deadline:
+            return _verification_in_progress()
+        time.sleep(0.05)
+        keys = _shared_result_keys(tx_ref, holder)
+        shared = _first_shared_result(keys, cache.get_many(keys))
+        if shared is not None:
+            return shared
+
+    try:
+        # The previous lock holder may have answered just before releasing
+        keys = _shared_result_keys(tx_ref, holder)
+        shared = _first_shared_result(keys, cache.get_many(keys))
+        if shared is not None:
+            return shared
+        result = verify_chapa_payment(tx_ref)
+        if is_final(result):
+            cache.set(result_key, result, timeout=settings.CHAPA_VERIFY_CACHE_TTL)
+        else:
+            pending_key = _shared_result_keys(tx_ref, token)[1]
+            cache.set(pending_key, result, timeout=settings.CHAPA_VERIFY_PENDING_TTL)
+        return result
+    finally:
+        # The lock may have expired and been taken by another caller meanwhile
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+async def averify_chapa_payment_cached(tx_ref: str) -> Dict:
+    """
+    verify_chapa_payment_cached() for async views, sharing its cache keys,
+    so sync and async callers collapse onto the same upstream call.
+    Waiting for another caller's result suspends instead of sleeping.
+    """
+    result_key, lock_key = _verify_cache_keys(tx_ref)
+    lock_timeout = settings.CHAPA_VERIFY_LOCK_TIMEOUT
+
+    cached = await cache.aget(result_key)
+    if cached is not None:
+        return cached
+
+    token = uuid.uuid4().hex
+    holder = None
+    deadline = time.monotonic() + lock_timeout
+    while not await cache.aadd(lock_key, token, timeout=lock_timeout):
+        holder = await cache.aget(lock_key) or holder
+        if time.monotonic() >= deadline:
+            return _verification_in_progress()
+        await asyncio.sleep(0.05)
+        keys = _shared_result_keys(tx_ref, holder)
+        shared = _first_shared_result(keys, await cache.aget_many(keys))
+        if shared is not None:
+            return shared
+
+    try:
+        keys = _shared_result_keys(tx_ref, holder)
+        shared = _first_shared_result(keys, await cache.aget_many(keys))
+        if shared is not None:
+            return shared
+        result = await averify_chapa_payment(tx_ref)
+        if is_final(result):
+            await cache.aset(result_key, result, timeout=settings.CHAPA_VERIFY_CACHE_TTL)
+        else:
+            pending_key = _shared_result_keys(tx_ref, token)[1]
+            await cache.aset(pending_key, result, timeout=settings.CHAPA_VERIFY_PENDING_TTL)
+        return result
+    finally:
+        if await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
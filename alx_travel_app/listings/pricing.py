@@ -0,0 +1,247 @@
+"""
+Nightly pricing of listings from their PricingRule rows.
+
+Season and weekend rules are compiled into a rate calendar (ListingRate)
+covering PRICING_CALENDAR_DAYS from today. It holds only the nights whose
+rate differs from price_per_night, so pricing nights inside the window is
+a single range aggregate (count and sum of stored rates, every other night
+at price_per_night) with no rule evaluation. Nights outside the window,
+such as past dates, are priced from the rules directly. Length-of-stay
+rules are compiled onto the listing (stay_tiers) and discount the
+nightly subtotal of a whole stay. Listings without rules have no window
+and are quoted without queries.
+
+Rule and price changes recompile the listing's calendar through model
+signals; the roll_rate_calendars task moves every window forward daily.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, QuerySet, Sum
+
+from .models import Listing, ListingRate, PricingRule
+
+CENT = Decimal("0.01")
+
+# Friday and Saturday nights (date.weekday() of the night)
+WEEKEND_NIGHTS = {4, 5}
+
+# Longest stay the quote endpoint prices in one request
+MAX_QUOTE_NIGHTS = 366
+
+
+def night_multiplier(rules: Iterable[PricingRule], night: date) -> Decimal:
+    """Product of the multipliers of the season and weekend rules covering ``night``."""
+    multiplier = Decimal("1")
+    for rule in rules:
+        if rule.kind == PricingRule.Kind.SEASON:
+            if rule.start_date <= night < rule.end_date:
+                multiplier *= rule.multiplier
+        elif rule.kind == PricingRule.Kind.WEEKEND:
+            if night.weekday() in WEEKEND_NIGHTS:
+                multiplier *= rule.multiplier
+    return multiplier
+
+
+def nightly_rate(price: Decimal, rules: Iterable[PricingRule], night: date) -> Decimal:
+    return (price * night_multiplier(rules, night)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def stay_tiers(rules: Iterable[PricingRule]) -> List[List]:
+    """Length-of-stay rules as [min_nights, "multiplier"] pairs, longest first."""
+    tiers = [
+        [rule.min_nights, f"{rule.multiplier:f}"]
+        for rule in rules
+        if rule.kind == PricingRule.Kind.LENGTH_OF_STAY
+    ]
+    return sorted(tiers, key=lambda tier: tier[0], reverse=True)
+
+
+def stay_multiplier(tiers: Sequence[Sequence], nights: int) -> Decimal:
+    """Multiplier of the first tier (see stay_tiers) that a stay of ``nights`` reaches."""
+    for min_nights, multiplier in tiers:
+        if nights >= min_nights:
+            return Decimal(multiplier)
+    return Decimal("1")
+
+
+def calendar_window(today: Optional[date] = None) -> Tuple[date, date]:
+    start = today or date.today()
+    return start, start + timedelta(days=settings.PRICING_CALENDAR_DAYS)
+
+
+def compile_rates(
+    listing: Listing, rules: Sequence[PricingRule], start: date, end: date
+) -> List[ListingRate]:
+    """Unsaved calendar rows for the nights in [start, end) not priced at price_per_night."""
+    rows = []
+    price = listing.price_per_night
+    nightly = [rule for rule in rules if rule.kind != PricingRule.Kind.LENGTH_OF_STAY]
+    if not nightly:
+        return rows
+    for n in range((end - start).days):
+        night = start + timedelta(days=n)
+        rate = nightly_rate(price, nightly, night)
+        if rate != price:
+            rows.append(ListingRate(listing_id=listing.pk, date=night, rate=rate))
+    return rows
+
+
+def _compile_listings(
+    listings: List[Listing], start: date, end: date, batch_size: int = 1000
+) -> int:
+    rules = defaultdict(list)
+    for rule in PricingRule.objects.filter(listing__in=listings):
+        rules[rule.listing_id].append(rule)
+    rows = [
+        row
+        for listing in listings
+        for row in compile_rates(listing, rules[listing.pk], start, end)
+    ]
+    for listing in listings:
+        priced = bool(rules[listing.pk])
+        listing.rates_from, listing.rates_until = (start, end) if priced else (None, None)
+        listing.stay_tiers = stay_tiers(rules[listing.pk])
+    with transaction.atomic():
+        ListingRate.objects.filter(listing__in=listings).delete()
+        ListingRate.objects.bulk_create(rows, batch_size=batch_size)
+        Listing.objects.bulk_update(
+            listings, ["rates_from", "rates_until", "stay_tiers"], batch_size=batch_size
+        )
+    return len(rows)
+
+
+def compile_rate_calendar(listing: Listing, today: Optional[date] = None) -> int:
+    """
+    Recompile one listing's rate calendar from its rules and current price.
+
+    Sets rates_from, rates_until and stay_tiers on ``listing`` too.
+    Returns the number of rows written.
+    """
+    return _compile_listings([listing], *calendar_window(today))
+
+
+def rebuild_rate_calendars(
+    listings: Optional[QuerySet] = None,
+    chunk_size: int = 100,
+    today: Optional[date] = None,
+) -> int:
+    """
+    Recompile the calendars of ``listings`` (by default every listing with
+    a window), ``chunk_size`` listings per transaction, over the window
+    starting ``today``. Returns the number of rows written.
+    """
+    if listings is None:
+        listings = Listing.objects.filter(rates_until__isnull=False)
+    listings = listings.order_by("pk").only(
+        "pk", "price_per_night", "rates_from", "rates_until", "stay_tiers"
+    )
+    start, end = calendar_window(today)
+
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(listings.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return written
+        last_pk = chunk[-1].pk
+        written += _compile_listings(chunk, start, end)
+
+
+def _price(listing: Listing, start: date, end: date, load_rules, window_total) -> Dict:
+    nights = max((end - start).days, 0)
+    price = listing.price_per_night
+    subtotal = price * nights
+    multiplier = Decimal("1")
+    if listing.rates_until is not None:
+        window_start, window_end = max(start, listing.rates_from), min(end, listing.rates_until)
+        subtotal = Decimal("0")
+        in_window = 0
+        if window_start < window_end:
+            in_window = (window_end - window_start).days
+            stored_nights, stored_total = window_total(window_start, window_end)
+            subtotal += stored_total + price * (in_window - stored_nights)
+        if in_window < nights:
+            nightly = [
+                rule for rule in load_rules() if rule.kind != PricingRule.Kind.LENGTH_OF_STAY
+            ]
+            for n in range(nights):
+                night = start + timedelta(days=n)
+                if not window_start <= night < window_end:
+                    subtotal += nightly_rate(price, nightly, night)
+        multiplier = stay_multiplier(listing.stay_tiers, nights)
+    return {
+        "listing": listing.pk,
+        "start_date": start,
+        "end_date": end,
+        "nights": nights,
+        "subtotal": subtotal.quantize(CENT),
+        "length_of_stay_multiplier": multiplier,
+        "total_price": (subtotal * multiplier).quantize(CENT, rounding=ROUND_HALF_UP),
+    }
+
+
+def quote(listing: Listing, start: date, end: date) -> Dict:
+    """
+    Price the nights from ``start`` up to ``end`` (the check-out day) at ``listing``.
+
+    Returns Decimal ``subtotal`` (sum of nightly rates),
+    ``length_of_stay_multiplier`` and ``total_price``. Costs one range
+    aggregate over the calendar for listings with pricing rules, plus a
+    rules query when the stay has nights outside the calendar window;
+    nothing for listings without rules.
+    """
+    def window_total(window_start, window_end):
+        totals = ListingRate.objects.filter(
+            listing=listing, date__gte=window_start, date__lt=window_end
+        ).aggregate(nights=Count("id"), total=Sum("rate"))
+        return totals["nights"], totals["total"] or Decimal("0")
+
+    return _price(listing, start, end, lambda: list(listing.pricing_rules.all()), window_total)
+
+
+def quote_many(stays: List[Tuple[Listing, date, date]]) -> List[Dict]:
+    """
+    quote() for many (listing, start, end) stays with at most two queries
+    in all: one for the calendar rows the stays overlap and one for the
+    rules, when a stay has nights outside its listing's window.
+    """
+    priced = {listing.pk: listing for listing, _, _ in stays if listing.rates_until is not None}
+    rules = None
+    rates = defaultdict(dict)
+
+    def load_rules(listing_id):
+        nonlocal rules
+        if rules is None:
+            rules = defaultdict(list)
+            for rule in PricingRule.objects.filter(listing__in=list(priced)):
+                rules[rule.listing_id].append(rule)
+        return rules[listing_id]
+
+    if priced:
+        rows = ListingRate.objects.filter(
+            listing__in=list(priced),
+            date__gte=min(start for _, start, _ in stays),
+            date__lt=max(end for _, _, end in stays),
+        ).values_list("listing_id", "date", "rate")
+        for listing_id, night, rate in rows:
+            rates[listing_id][night] = rate
+
+    quotes = []
+    for listing, start, end in stays:
+        listing_rates = rates[listing.pk]
+
+        def window_total(window_start, window_end, listing_rates=listing_rates):
+            stored = [
+                rate for night, rate in listing_rates.items() if window_start <= night < window_end
+            ]
+            return len(stored), sum(stored, Decimal("0"))
+
+        quotes.append(_price(
+            listing, start, end, lambda listing_id=listing.pk: load_rules(listing_id), window_total
+        ))
+    return quotes
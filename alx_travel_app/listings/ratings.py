@@ -0,0 +1,101 @@
+"""
+Maintenance of the denormalised review aggregates stored on Listing.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, QuerySet, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .http_cache import invalidate_listing_responses
+from .models import Listing, Review
+
+RATING_FIELDS = ["review_count", "rating_sum", "avg_rating"] + [
+    f"rating_count_{stars}" for stars in range(1, 6)
+]
+
+AVG_RATING = Case(
+    When(review_count=0, then=Value(Decimal("0"))),
+    default=Round(Cast(F("rating_sum"), FloatField()) / F("review_count"), 2),
+    output_field=DecimalField(max_digits=3, decimal_places=2),
+)
+
+
+def apply_review_delta(listing_id: int, rating: int, sign: int) -> None:
+    """
+    Add (sign=1) or remove (sign=-1) one review of ``rating`` stars.
+
+    Counters move with F-expressions so concurrent review writes never lose
+    updates. The average is recomputed by a second UPDATE because MySQL
+    evaluates SET assignments left to right while other backends don't.
+    """
+    with transaction.atomic():
+        # updated_at moves too: the aggregates are part of the listing's representation (and ETag)
+        Listing.objects.filter(pk=listing_id).update(
+            updated_at=timezone.now(),
+            review_count=F("review_count") + sign,
+            rating_sum=F("rating_sum") + sign * rating,
+            **{f"rating_count_{rating}": F(f"rating_count_{rating}") + sign},
+        )
+        Listing.objects.filter(pk=listing_id).update(avg_rating=AVG_RATING)
+    invalidate_listing_responses()
+
+
+def recompute_ratings(listings: Optional[QuerySet] = None, chunk_size: int = 1000) -> int:
+    """
+    Rebuild the aggregates from the Review table, ``chunk_size`` listings at a time.
+
+    ``listings`` narrows the rebuild (all listings by default). Each chunk
+    costs one GROUP BY over its reviews and one bulk_update of the listings
+    whose aggregates actually changed. Returns the number of listings
+    written.
+    """
+    listings = (listings if listings is not None else Listing.objects.all()).order_by("pk")
+
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(listings.filter(pk__gt=last_pk).only("pk", *RATING_FIELDS)[:chunk_size])
+        if not chunk:
+            return written
+        last_pk = chunk[-1].pk
+
+        counts = defaultdict(dict)
+        grouped = (
+            Review.objects.filter(listing__in=chunk)
+            .order_by()
+            .values_list("listing_id", "rating")
+            .annotate(n=Count("id"))
+        )
+        for listing_id, rating, n in grouped:
+            counts[listing_id][rating] = n
+
+        changed = []
+        for listing in chunk:
+            before = [getattr(listing, field) for field in RATING_FIELDS]
+            per_star = counts.get(listing.pk, {})
+            listing.review_count = sum(per_star.values())
+            listing.rating_sum = sum(stars * n for stars, n in per_star.items())
+            # Half-up, as SQL ROUND in AVG_RATING does (round() is half-even)
+            listing.avg_rating = (
+                (Decimal(listing.rating_sum) / listing.review_count).quantize(
+                    Decimal("0.01"), rounding=ROUND_HALF_UP
+                )
+                if listing.review_count
+                else Decimal("0")
+            )
+            for stars in range(1, 6):
+                setattr(listing, f"rating_count_{stars}", per_star.get(stars, 0))
+            if [getattr(listing, field) for field in RATING_FIELDS] != before:
+                changed.append(listing)
+        # bulk_update builds a CASE per field over the whole batch, so skip rows already in step
+        if changed:
+            now = timezone.now()
+            for listing in changed:
+                listing.updated_at = now
+            Listing.objects.bulk_update(changed, RATING_FIELDS + ["updated_at"])
+            invalidate_listing_responses()
+        written += len(changed)
@@ -0,0 +1,149 @@
+"""
+Reconciliation of payments stuck in PENDING against the Chapa API.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .http_cache import invalidate_listing_responses
+from .models import Booking, Payment
+from .payment_utils import FAILED_STATUSES, verify_chapa_payment
+from .stats import queue_booking_stats_refresh
+
+logger = logging.getLogger(__name__)
+
+
+def _classify(references, results):
+    """Split verification results into per-reference outcomes and counts."""
+    counts = {"completed": 0, "failed": 0, "still_pending": 0, "errors": 0}
+    outcomes = {}
+    for reference, result in zip(references, results):
+        if not result.get("success"):
+            counts["errors"] += 1
+        elif result.get("status") == "success":
+            transaction_id = result.get("data", {}).get("id", reference)
+            outcomes[reference] = (Payment.Status.COMPLETED, transaction_id)
+            counts["completed"] += 1
+        elif result.get("status") in FAILED_STATUSES:
+            outcomes[reference] = (Payment.Status.FAILED, None)
+            counts["failed"] += 1
+        else:
+            counts["still_pending"] += 1
+    return outcomes, counts
+
+
+def _apply(outcomes) -> List[int]:
+    """
+    Persist one chunk of outcomes with bulk updates.
+
+    Rows are re-read under select_for_update so that payments resolved by
+    verify_payment while we were talking to Chapa are left untouched.
+    Payments that completed after their booking's hold expired go through
+    Payment.mark_completed one by one, which confirms the booking again
+    if its nights are free and logs it for a refund otherwise.
+    Returns the ids of bookings that were confirmed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(booking_reference__in=outcomes.keys(), status=Payment.Status.PENDING)
+        )
+        paid_ids = [
+            p.booking_id for p in payments
+            if outcomes[p.booking_reference][0] == Payment.Status.COMPLETED
+        ]
+        expired_ids = set(
+            Booking.objects.filter(pk__in=paid_ids, status=Booking.Status.CANCELLED)
+            .values_list("pk", flat=True)
+        )
+        late = [p for p in payments if p.booking_id in expired_ids]
+        payments = [p for p in payments if p.booking_id not in expired_ids]
+        for payment in payments:
+            payment.status, transaction_id = outcomes[payment.booking_reference]
+            if transaction_id:
+                payment.transaction_id = transaction_id
+            payment.updated_at = now
+        Payment.objects.bulk_update(payments, ["status", "transaction_id", "updated_at"])
+
+        confirmed_ids = [p.booking_id for p in payments if p.status == Payment.Status.COMPLETED]
+        # Confirming keeps the booking active, so its night claims stay valid
+        Booking.objects.filter(pk__in=confirmed_ids, status=Booking.Status.PENDING).update(
+            status=Booking.Status.CONFIRMED, confirmation_email_due=True
+        )
+        queue_booking_stats_refresh(confirmed_ids)
+
+        for payment in late:
+            _, transaction_id = outcomes[payment.booking_reference]
+            if payment.mark_completed(transaction_id):
+                confirmed_ids.append(payment.booking_id)
+    if confirmed_ids:
+        # Queryset updates send no signals; listing bookings responses embed the status
+        invalidate_listing_responses()
+    return confirmed_ids
+
+
+def reconcile_pending_payments(
+    older_than: timedelta = timedelta(minutes=30),
+    concurrency: int = 8,
+    chunk_size: int = 200,
+    limit: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict:
+    """
+    Verify stale PENDING payments against Chapa and apply the outcome.
+
+    Payments are read in primary-key order, ``chunk_size`` at a time; each
+    chunk is verified on a pool of ``concurrency`` threads sharing the
+    pooled Chapa session, then written back with bulk_update. Newly
+    confirmed bookings are flagged for their confirmation email and one
+    send_due_confirmation_emails task is queued per chunk.
+
+    Returns a dict of counts: scanned, completed, failed, still_pending
+    and errors. With ``dry_run`` the counts are reported but nothing is
+    written.
+    """
+    from .tasks import send_due_confirmation_emails
+
+    cutoff = timezone.now() - older_than
+    stale = Payment.objects.filter(
+        status=Payment.Status.PENDING, created_at__lt=cutoff
+    ).order_by("pk")
+
+    totals = {"scanned": 0, "completed": 0, "failed": 0, "still_pending": 0, "errors": 0}
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while limit is None or totals["scanned"] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - totals["scanned"])
+            chunk = list(stale.filter(pk__gt=last_pk).values_list("pk", "booking_reference")[:size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            references = [reference for _, reference in chunk]
+
+            results = list(pool.map(verify_chapa_payment, references))
+            outcomes, counts = _classify(references, results)
+            totals["scanned"] += len(references)
+            for key, value in counts.items():
+                totals[key] += value
+            if dry_run or not outcomes:
+                continue
+
+            confirmed_ids = _apply(outcomes)
+            if not confirmed_ids:
+                continue
+            try:
+                # One task and one mail connection for the whole chunk; if
+                # this is lost, the periodic sweep sends the flagged emails
+                send_due_confirmation_emails.delay()
+            except Exception as e:
+                logger.error(
+                    f"Failed to queue confirmation emails for bookings {confirmed_ids}: {e}"
+                )
+
+    logger.info(f"Payment reconciliation finished: {totals}")
+    return totals
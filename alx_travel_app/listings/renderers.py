@@ -0,0 +1,93 @@
+"""
+Response renderers for the listings API.
+"""
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes through orjson, several times faster.
+
+    Values orjson doesn't encode the way DRF does (datetimes, dataclasses,
+    Decimals, lazy strings, ...) are passed to DRF's own JSONEncoder.
+    Indented output, non-default UNICODE_JSON/COMPACT_JSON, and anything
+    orjson refuses (e.g. integers beyond 64 bits) go through the stock
+    renderer, as does everything when orjson isn't installed.
+
+    Two known differences from the stock renderer: floats below 1e-4 or
+    from 1e16 up are written without Python's exponent padding (``1e16``
+    rather than ``1e+16``), and NaN/Infinity render as null instead of
+    raising. No listings payload carries such values.
+    """
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None else 0
+    )
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping of the JavaScript line terminators as JSONRenderer
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON: one line per item of a list, or a single line
+    for anything else (e.g. an error body).
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        items = data if isinstance(data, list) else [data]
+        return "".join(
+            json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for item in items
+        ).encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV of a list of flat dicts (or a single dict), with a header row.
+
+    ``renderer_context`` may give the column order as ``fields`` (default:
+    the keys of the first row) and turn the header off with
+    ``header=False``, so a long list can be rendered in pieces.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        rows = data if isinstance(data, list) else [data]
+        fields = renderer_context.get("fields") or (list(rows[0]) if rows else [])
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        if renderer_context.get("header", True):
+            writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
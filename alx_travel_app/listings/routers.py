@@ -0,0 +1,68 @@
+"""
+Database routing between the primary and an optional read replica.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+
+# Per-request routing state: None outside replica_reads(), else {"pinned": bool}
+_replica_state: ContextVar[Optional[dict]] = ContextVar("listings_replica_state", default=None)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let reads inside this block go to the replica.
+
+    Once anything in the block writes, the rest of it reads from the
+    primary too (sticky-after-write), so a request never misses its own
+    writes to replication lag. Blocks are scoped to the current thread or
+    task via a context variable.
+    """
+    token = _replica_state.set({"pinned": False})
+    try:
+        yield
+    finally:
+        _replica_state.reset(token)
+
+
+def replica_configured() -> bool:
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def reading_from_replica() -> bool:
+    """Whether reads here go to the replica (see ReplicaRouter.db_for_read)."""
+    state = _replica_state.get()
+    if state is None or state["pinned"] or not replica_configured():
+        return False
+    # Reads inside a transaction must see that transaction's own state
+    return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    """
+    Send reads inside replica_reads() to the replica; everything else,
+    and all writes, to the primary.
+
+    Code outside a replica_reads() block (bookings, payments, Celery
+    tasks) is unaffected and always reads from the primary. Without a
+    ``replica`` database configured the router always answers the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return REPLICA_DB_ALIAS if reading_from_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            state["pinned"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
@@ -0,0 +1,194 @@
+"""
+Full-text search over listings.
+
+Listings are tokenised into an inverted index stored in the ListingTerm
+table (one posting per term and listing) and ranked with BM25. The index is
+kept in step with Listing saves by listings.signals; deletes cascade.
+"""
+import math
+import re
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Avg, Case, Count, F, FloatField, OuterRef, QuerySet, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Listing, ListingTerm
+
+INDEXED_FIELDS = ("title", "location", "description")
+
+# Title matches count this many times, so they outrank description matches
+TITLE_WEIGHT = 2
+
+# Standard BM25 parameters: term-frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+
+# Terms in more than this share of listings only count when nothing rarer matches
+COMMON_TERM_RATIO = 0.5
+
+CORPUS_STATS_CACHE_KEY = "listings:search:corpus-stats"
+CORPUS_STATS_TTL = 60
+
+MAX_TERM_LENGTH = ListingTerm._meta.get_field("term").max_length
+
+TOKEN_RE = re.compile(r"\w+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or the to with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens of ``text`` without stop words."""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def listing_terms(listing: Listing) -> Counter:
+    """Term frequencies of one listing, with title tokens weighted."""
+    terms = Counter()
+    for token in tokenize(listing.title):
+        terms[token] += TITLE_WEIGHT
+    terms.update(tokenize(listing.location))
+    terms.update(tokenize(listing.description))
+    return terms
+
+
+def index_listings(
+    listings: Iterable[Listing], batch_size: int = 1000, replace: bool = True
+) -> int:
+    """
+    (Re)write the postings and indexed length of ``listings``.
+
+    Pass ``replace=False`` for listings known to have no postings yet
+    (just created) to skip deleting the old ones. Returns the number of
+    postings written.
+    """
+    listings = list(listings)
+    postings = []
+    for listing in listings:
+        terms = listing_terms(listing)
+        listing.search_length = sum(terms.values())
+        postings.extend(
+            ListingTerm(listing_id=listing.pk, term=term, frequency=frequency)
+            for term, frequency in terms.items()
+        )
+    with transaction.atomic():
+        if replace:
+            ListingTerm.objects.filter(listing__in=[listing.pk for listing in listings]).delete()
+        ListingTerm.objects.bulk_create(postings, batch_size=batch_size)
+        if len(listings) == 1:
+            listing = listings[0]
+            Listing.objects.filter(pk=listing.pk).update(search_length=listing.search_length)
+        else:
+            # Summed from the postings just written: bulk_update's per-row CASE
+            # dominates rebuild time on large chunks
+            lengths = (
+                ListingTerm.objects.filter(listing=OuterRef("pk"))
+                .order_by()
+                .values("listing")
+                .annotate(length=Sum("frequency"))
+                .values("length")
+            )
+            Listing.objects.filter(pk__in=[listing.pk for listing in listings]).update(
+                search_length=Coalesce(Subquery(lengths), 0)
+            )
+    return len(postings)
+
+
+def indexed_text(listing: Listing):
+    """The loaded values of the indexed fields; deferred fields read as None."""
+    return tuple(listing.__dict__.get(field) for field in INDEXED_FIELDS)
+
+
+def rebuild_search_index(listings: Optional[QuerySet] = None, chunk_size: int = 1000) -> int:
+    """
+    Re-index ``listings`` (all listings by default), ``chunk_size`` at a time.
+
+    Returns the number of listings indexed.
+    """
+    listings = (listings if listings is not None else Listing.objects.all()).order_by("pk")
+
+    indexed = 0
+    last_pk = 0
+    while True:
+        chunk = list(listings.filter(pk__gt=last_pk).only("pk", *INDEXED_FIELDS)[:chunk_size])
+        if not chunk:
+            return indexed
+        last_pk = chunk[-1].pk
+        index_listings(chunk, batch_size=chunk_size)
+        indexed += len(chunk)
+
+
+def corpus_stats():
+    """
+    Number of listings and their average indexed length.
+
+    Cached for CORPUS_STATS_TTL seconds: BM25 only needs these roughly, and
+    they drift slowly compared with how often searches run.
+    """
+    stats = cache.get(CORPUS_STATS_CACHE_KEY)
+    if stats is None:
+        corpus = Listing.objects.aggregate(n=Count("id"), avg_length=Avg("search_length"))
+        stats = (corpus["n"], corpus["avg_length"] or 1.0)
+        cache.set(CORPUS_STATS_CACHE_KEY, stats, CORPUS_STATS_TTL)
+    return stats
+
+
+def search_listings(query: str) -> QuerySet:
+    """
+    Rank listings against ``query`` with BM25.
+
+    Returns a values queryset of ``{"listing_id", "score"}`` rows, best
+    match first, that can be paginated like any other queryset. A listing
+    matches if it contains any of the query terms, except that terms found
+    in more than COMMON_TERM_RATIO of all listings are ignored when the
+    query also has rarer ones: their idf is close to zero, so they barely
+    move the ranking but would make nearly every listing a match. Besides
+    the ranking query this costs one small query for the document
+    frequency of each term, plus the corpus statistics when not cached.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return ListingTerm.objects.none().values("listing_id")
+
+    frequencies = dict(
+        ListingTerm.objects.filter(term__in=terms)
+        .order_by()
+        .values_list("term")
+        .annotate(n=Count("id"))
+    )
+    if not frequencies:
+        return ListingTerm.objects.none().values("listing_id")
+
+    total, avg_length = corpus_stats()
+    total = max(total, *frequencies.values())
+    selective = {term: df for term, df in frequencies.items() if df <= total * COMMON_TERM_RATIO}
+    if selective:
+        frequencies = selective
+
+    idf = Case(
+        *[
+            When(term=term, then=Value(math.log(1 + (total - df + 0.5) / (df + 0.5))))
+            for term, df in frequencies.items()
+        ],
+        output_field=FloatField(),
+    )
+    tf = Cast(F("frequency"), FloatField())
+    length = Cast(F("listing__search_length"), FloatField())
+    score = Sum(idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length)))
+
+    return (
+        ListingTerm.objects.filter(term__in=frequencies.keys())
+        .values("listing_id")
+        .annotate(score=score)
+        .order_by("-score", "listing_id")
+    )
@@ -1,8 +1,21 @@
+import decimal
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Listing, Booking
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import ISO_8601, api_settings
+from .models import Listing, Booking, BookingConflict, Payment
+from .pricing import quote
+
+BOOKING_CONFLICT_MESSAGE = "Listing is already booked for the selected dates"
 
 
 class ListingSerializer(serializers.ModelSerializer):
+    # Read from denormalised columns on Listing, so no per-row queries
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
     class Meta:
         model = Listing
         fields = [
@@ -10,15 +23,54 @@ class ListingSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "location",
+            "latitude",
+            "longitude",
             "price_per_night",
             "max_guests",
+            "avg_rating",
+            "review_count",
+            "rating_histogram",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "avg_rating", "review_count", "created_at", "updated_at"]
+
+    def validate(self, attrs):
+        latitude = attrs.get("latitude", getattr(self.instance, "latitude", None))
+        longitude = attrs.get("longitude", getattr(self.instance, "longitude", None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("latitude and longitude must be set together")
+        return attrs
+
+
+class ListingField(PrimaryKeyRelatedField):
+    """
+    Listing by primary key.
+
+    Looks the listing up in ``context["listings"]`` (an ``in_bulk`` dict)
+    when the caller has prefetched them, so validating many bookings
+    doesn't cost a query each.
+    """
+
+    def to_internal_value(self, data):
+        listings = self.context.get("listings")
+        if listings is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return listings[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
 
 
 class BookingSerializer(serializers.ModelSerializer):
+    listing = ListingField(queryset=Listing.objects.all())
+    # Derived from status and created_at (see listings.holds)
+    hold_expires_at = serializers.DateTimeField(read_only=True)
+
     class Meta:
         model = Booking
         fields = [
@@ -31,17 +83,212 @@ class BookingSerializer(serializers.ModelSerializer):
             "total_price",
             "status",
             "created_at",
+            "hold_expires_at",
         ]
-        read_only_fields = ["id", "created_at"]
+        # Priced server-side from the listing's rate calendar in validate()
+        read_only_fields = ["id", "total_price", "created_at"]
 
     def validate(self, attrs):
         start_date = attrs.get("start_date")
         end_date = attrs.get("end_date")
-        total_price = attrs.get("total_price")
         if start_date and end_date and end_date < start_date:
             raise serializers.ValidationError("end_date must be on or after start_date")
-        if total_price is not None and total_price < 0:
-            raise serializers.ValidationError("total_price cannot be negative")
+
+        # Friendly early rejection; BookingNight's unique constraint is what
+        # actually guarantees no double booking under concurrent requests.
+        # Bulk creation checks and prices a whole batch at once instead.
+        if self.context.get("bulk"):
+            return attrs
+        listing = attrs.get("listing", getattr(self.instance, "listing", None))
+        start_date = start_date or getattr(self.instance, "start_date", None)
+        end_date = end_date or getattr(self.instance, "end_date", None)
+        # Edits that keep the stay keep the price it was booked at
+        if listing and start_date and end_date and (
+            self.instance is None or {"listing", "start_date", "end_date"} & attrs.keys()
+        ):
+            attrs["total_price"] = quote(listing, start_date, end_date)["total_price"]
+        booking_status = attrs.get(
+            "status", getattr(self.instance, "status", Booking.Status.PENDING)
+        )
+        if listing and start_date and end_date and booking_status != Booking.Status.CANCELLED:
+            conflicts = Booking.objects.active().overlapping(start_date, end_date).filter(
+                listing=listing
+            )
+            if self.instance is not None:
+                conflicts = conflicts.exclude(pk=self.instance.pk)
+            if conflicts.exists():
+                raise serializers.ValidationError(BOOKING_CONFLICT_MESSAGE)
         return attrs
 
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except BookingConflict as exc:
+            raise serializers.ValidationError(BOOKING_CONFLICT_MESSAGE) from exc
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except BookingConflict as exc:
+            raise serializers.ValidationError(BOOKING_CONFLICT_MESSAGE) from exc
+
+
+class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = [
+            "booking",
+            "booking_reference",
+            "amount",
+            "status",
+            "checkout_url",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+def _decimal_converter(field: serializers.DecimalField) -> Callable:
+    exponent = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f"{value.quantize(exponent, rounding=rounding, context=context):f}"
+    return convert
+
+
+def _datetime_converter(field: serializers.DateTimeField) -> Callable:
+    tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+
+    def convert(value):
+        if tz is None or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return convert
+
+
+def _converter(field: serializers.Field) -> Optional[Callable]:
+    """
+    A plain function producing ``field.to_representation(value)`` for a
+    non-null column value, or None where the column value already is the
+    representation. Anything unusual falls back to the field itself.
+    """
+    verbatim = (serializers.CharField, serializers.ChoiceField, serializers.ReadOnlyField)
+    if isinstance(field, verbatim):
+        return None
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if isinstance(field, serializers.DecimalField):
+        plain = (
+            getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+            and not field.localize
+            and not field.normalize_output
+            and field.decimal_places is not None
+        )
+        return _decimal_converter(field) if plain else field.to_representation
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        if output_format and output_format.lower() == ISO_8601:
+            return _datetime_converter(field)
+    elif isinstance(field, serializers.DateField):
+        output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+        if output_format and output_format.lower() == ISO_8601:
+            return lambda value: value.isoformat()
+    return field.to_representation
+
+
+class ValuesReadSerializer:
+    """
+    Fast read path for a ModelSerializer over ``.values()`` rows.
+
+    The serializer's fields are inspected once and compiled into a list of
+    (output key, column, converter); each row then costs one dict lookup
+    and at most one plain function call per field, instead of DRF's
+    per-field get_attribute/to_representation machinery. The output is
+    the same as ``serializer_class(instances, many=True).data``.
+
+    Fields that aren't model columns must be given in ``computed`` as
+    ``name -> (columns, function(row))``.
+    """
+
+    def __init__(
+        self,
+        serializer_class,
+        computed: Optional[Dict[str, Tuple[Sequence[str], Callable]]] = None,
+    ):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+        self._plan = None
+
+    def _compile(self):
+        model = self.serializer_class.Meta.model
+        columns = []
+        plan = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed:
+                needed, function = self.computed[name]
+                columns.extend(needed)
+                plan.append((name, None, function))
+                continue
+            column = model._meta.get_field(field.source).attname
+            columns.append(column)
+            plan.append((name, column, _converter(field)))
+        return list(dict.fromkeys(columns)), plan
+
+    @property
+    def columns(self) -> List[str]:
+        """Columns to pass to ``QuerySet.values()``."""
+        if self._plan is None:
+            self._plan = self._compile()
+        return self._plan[0]
+
+    def serialize(self, rows) -> List[dict]:
+        if self._plan is None:
+            self._plan = self._compile()
+        plan = self._plan[1]
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                if column is None:
+                    item[name] = convert(row)
+                    continue
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+listing_rows = ValuesReadSerializer(
+    ListingSerializer,
+    computed={
+        "rating_histogram": (
+            [f"rating_count_{stars}" for stars in range(1, 6)],
+            lambda row: {str(stars): row[f"rating_count_{stars}"] for stars in range(1, 6)},
+        ),
+    },
+)
+_hold_expires_at = _converter(BookingSerializer().fields["hold_expires_at"])
+
+
+def _booking_hold_expires_at(row):
+    # Booking.hold_expires_at without building a model instance per row
+    if row["status"] != Booking.Status.PENDING or not settings.BOOKING_HOLD_MINUTES:
+        return None
+    return _hold_expires_at(row["created_at"] + timedelta(minutes=settings.BOOKING_HOLD_MINUTES))
+
 
+booking_rows = ValuesReadSerializer(
+    BookingSerializer,
+    computed={"hold_expires_at": (["status", "created_at"], _booking_hold_expires_at)},
+)
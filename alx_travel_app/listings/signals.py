@@ -0,0 +1,131 @@
+"""
+Signal receivers for the listings app.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .http_cache import invalidate_listing_responses
+from .models import Booking, Listing, PricingRule, Review
+from .pricing import compile_rate_calendar
+from .ratings import apply_review_delta
+from .search import INDEXED_FIELDS, index_listings, indexed_text
+from .stats import queue_stats_refresh
+
+# Booking fields the daily stats rollup is computed from
+STATS_FIELDS = ("listing_id", "start_date", "end_date", "status", "total_price")
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Kept so that post_save can tell whether an edit moved the aggregates. Read
+    # from __dict__ so deferred fields are not loaded one query at a time
+    loaded = instance.__dict__
+    instance._saved_rating = (
+        (loaded.get("listing_id"), loaded.get("rating")) if instance.pk else None
+    )
+
+
+@receiver(pre_save, sender=Review)
+@receiver(pre_delete, sender=Review)
+def load_deferred_review_rating(sender, instance, **kwargs):
+    # Fields deferred at load time are only looked up for the rows being written
+    saved = getattr(instance, "_saved_rating", None)
+    if saved is not None and None in saved:
+        instance._saved_rating = (
+            Review.objects.filter(pk=instance.pk).values_list("listing_id", "rating").first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_listing_ratings_on_save(sender, instance, created, **kwargs):
+    current = (instance.listing_id, instance.rating)
+    previous = None if created else instance._saved_rating
+    if previous != current:
+        if previous is not None:
+            apply_review_delta(*previous, sign=-1)
+        apply_review_delta(*current, sign=1)
+    instance._saved_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def update_listing_ratings_on_delete(sender, instance, **kwargs):
+    saved = getattr(instance, "_saved_rating", None) or (instance.listing_id, instance.rating)
+    apply_review_delta(*saved, sign=-1)
+
+
+@receiver(post_init, sender=Listing)
+def remember_indexed_text(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields are not loaded one query at a time
+    instance._indexed_text = indexed_text(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Listing)
+def update_search_index(sender, instance, created, update_fields=None, **kwargs):
+    # Postings are removed by the cascade on delete; only text edits need re-indexing
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    current = indexed_text(instance)
+    previous = None if created else instance._indexed_text
+    if previous is None or None in previous or previous != current:
+        index_listings([instance], replace=not created)
+    instance._indexed_text = current
+
+
+@receiver(post_init, sender=Listing)
+def remember_listing_price(sender, instance, **kwargs):
+    instance._saved_price = instance.__dict__.get("price_per_night") if instance.pk else None
+
+
+@receiver(post_save, sender=Listing)
+def recompile_rates_on_price_change(sender, instance, created, update_fields=None, **kwargs):
+    # Calendar rows hold absolute rates, derived from price_per_night
+    if created or (update_fields is not None and "price_per_night" not in update_fields):
+        return
+    if instance._saved_price != instance.price_per_night and instance.pricing_rules.exists():
+        compile_rate_calendar(instance)
+    instance._saved_price = instance.price_per_night
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def recompile_rates_on_rule_change(sender, instance, **kwargs):
+    # Also runs while a deleted listing cascades to its rules; the listing row is still there then
+    listing = Listing.objects.filter(pk=instance.listing_id).only("pk", "price_per_night").first()
+    if listing is not None:
+        compile_rate_calendar(listing)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_cached_listing_responses(sender, **kwargs):
+    invalidate_listing_responses()
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_stats_fields(sender, instance, **kwargs):
+    instance._stats_fields = (
+        tuple(instance.__dict__.get(field) for field in STATS_FIELDS) if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Booking)
+def refresh_stats_on_booking_save(sender, instance, created, update_fields=None, **kwargs):
+    watched = {"listing", "listing_id", *STATS_FIELDS}
+    if update_fields is not None and not watched & set(update_fields):
+        return
+    current = tuple(getattr(instance, field) for field in STATS_FIELDS)
+    previous = None if created else instance._stats_fields
+    if previous == current:
+        return
+    # previous may hold None for fields deferred at load time; refresh what we know
+    if previous is not None and None not in previous[:3]:
+        queue_stats_refresh(*previous[:3])
+    queue_stats_refresh(*current[:3])
+    instance._stats_fields = current
+
+
+@receiver(post_delete, sender=Booking)
+def refresh_stats_on_booking_delete(sender, instance, **kwargs):
+    queue_stats_refresh(instance.listing_id, instance.start_date, instance.end_date)
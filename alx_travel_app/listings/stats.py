@@ -0,0 +1,237 @@
+"""
+Daily occupancy and revenue rollups per listing (ListingDailyStats).
+
+Rows are derived from bookings only, so any span of them can be
+recomputed from scratch. Booking writes record the affected (listing,
+dates) span as a ListingStatsRefresh row in their own transaction; the
+refresh_listing_stats Celery task, queued once the write commits and
+run by Celery beat as a sweep, recomputes and deletes them. Writes that
+bypass the model signals (bulk inserts, queryset updates) queue their
+spans explicitly. rebuild_listing_stats recomputes everything, for
+backfills.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_DOWN, Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet, Sum
+
+from .models import Booking, Listing, ListingDailyStats, ListingStatsRefresh
+
+CENT = Decimal("0.01")
+
+STATUS_FIELDS = {
+    Booking.Status.PENDING: "pending_nights",
+    Booking.Status.CONFIRMED: "confirmed_nights",
+    Booking.Status.CANCELLED: "cancelled_nights",
+}
+
+# Longest range the stats endpoint serves in one response
+MAX_STATS_DAYS = 366
+
+COUNT_FIELDS = ["nights_booked", "pending_nights", "confirmed_nights", "cancelled_nights"]
+
+BOOKING_FIELDS = ("listing_id", "start_date", "end_date", "total_price", "status")
+
+
+def daily_rows(
+    bookings: Iterable[dict], start: Optional[date] = None, end: Optional[date] = None
+) -> List[ListingDailyStats]:
+    """
+    Roll booking values (BOOKING_FIELDS) up into unsaved daily rows.
+
+    Only nights in [start, end) are kept when bounds are given. A
+    confirmed booking's total_price is spread over its nights in whole
+    cents, the last night taking the remainder, so the days add up to
+    the total exactly.
+    """
+    rows: Dict[Tuple[int, date], ListingDailyStats] = {}
+    for booking in bookings:
+        nights = (booking["end_date"] - booking["start_date"]).days
+        if nights <= 0:
+            continue
+        total = booking["total_price"]
+        share = (total / nights).quantize(CENT, rounding=ROUND_DOWN)
+        status_field = STATUS_FIELDS[booking["status"]]
+        for n in range(nights):
+            night = booking["start_date"] + timedelta(days=n)
+            if (start is not None and night < start) or (end is not None and night >= end):
+                continue
+            key = (booking["listing_id"], night)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = ListingDailyStats(
+                    listing_id=key[0], date=night, revenue=Decimal("0")
+                )
+            setattr(row, status_field, getattr(row, status_field) + 1)
+            if booking["status"] != Booking.Status.CANCELLED:
+                row.nights_booked += 1
+            if booking["status"] == Booking.Status.CONFIRMED:
+                row.revenue += share if n < nights - 1 else total - share * (nights - 1)
+    return list(rows.values())
+
+
+def refresh_stats(listing_id: int, start: date, end: date) -> int:
+    """
+    Recompute one listing's rows for the nights in [start, end).
+
+    Costs one read of the overlapping bookings, one delete and one
+    insert. Returns the number of rows written.
+    """
+    bookings = Booking.objects.filter(listing_id=listing_id, start_date__lt=end, end_date__gt=start)
+    rows = daily_rows(bookings.values(*BOOKING_FIELDS), start, end)
+    with transaction.atomic():
+        ListingDailyStats.objects.filter(
+            listing_id=listing_id, date__gte=start, date__lt=end
+        ).delete()
+        ListingDailyStats.objects.bulk_create(rows)
+    return len(rows)
+
+
+def merge_spans(spans: Iterable[Tuple[int, date, date]]) -> List[Tuple[int, date, date]]:
+    """Merge overlapping or touching [start, end) spans of the same listing."""
+    by_listing = defaultdict(list)
+    for listing_id, start, end in spans:
+        by_listing[listing_id].append((start, end))
+    merged = []
+    for listing_id, listing_spans in sorted(by_listing.items()):
+        listing_spans.sort()
+        current_start, current_end = listing_spans[0]
+        for start, end in listing_spans[1:]:
+            if start > current_end:
+                merged.append((listing_id, current_start, current_end))
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        merged.append((listing_id, current_start, current_end))
+    return merged
+
+
+def rebuild_listing_stats(listings: Optional[QuerySet] = None, chunk_size: int = 1000) -> int:
+    """
+    Rebuild the rollups of ``listings`` (all by default), ``chunk_size`` listings at a time.
+
+    Each chunk reads its bookings once and replaces its rows in one
+    transaction. Returns the number of rows written.
+    """
+    listings = (listings if listings is not None else Listing.objects.all()).order_by("pk")
+
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(listings.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk_size])
+        if not chunk:
+            return written
+        last_pk = chunk[-1]
+        bookings = Booking.objects.filter(listing_id__in=chunk).order_by().values(*BOOKING_FIELDS)
+        rows = daily_rows(bookings.iterator(chunk_size=chunk_size))
+        with transaction.atomic():
+            ListingDailyStats.objects.filter(listing_id__in=chunk).delete()
+            ListingDailyStats.objects.bulk_create(rows, batch_size=chunk_size)
+        written += len(rows)
+
+
+def _money(value) -> str:
+    return f"{(value or Decimal('0')).quantize(CENT):f}"
+
+
+def listing_stats(listing_id: int, start: date, end: date) -> Dict:
+    """
+    Totals and per-day rows for one listing from ``start`` to ``end`` inclusive.
+
+    Occupancy is booked nights over days in the range; revenue is
+    rendered as a string like other amounts in the API. Two indexed range
+    reads of the rollup table; bookings are not touched.
+    """
+    rows = ListingDailyStats.objects.filter(listing_id=listing_id, date__gte=start, date__lte=end)
+    totals = rows.aggregate(revenue=Sum("revenue"), **{field: Sum(field) for field in COUNT_FIELDS})
+    days = (end - start).days + 1
+    daily = list(rows.order_by("date").values("date", "revenue", *COUNT_FIELDS))
+    for day in daily:
+        day["revenue"] = _money(day["revenue"])
+    return {
+        "listing": listing_id,
+        "from": start,
+        "to": end,
+        "days": days,
+        "occupancy": round((totals["nights_booked"] or 0) / days, 4),
+        "revenue": _money(totals["revenue"]),
+        **{field: totals[field] or 0 for field in COUNT_FIELDS},
+        "daily": daily,
+    }
+
+
+# Set while a refresh_listing_stats task is waiting for its window
+REFRESH_SCHEDULED_CACHE_KEY = "listing-stats:refresh-scheduled"
+
+
+def _schedule_refresh() -> None:
+    from .tasks import refresh_listing_stats
+
+    window = settings.LISTING_STATS_REFRESH_WINDOW_MS / 1000
+    # One task per window picks up every span recorded before it runs
+    if cache.add(REFRESH_SCHEDULED_CACHE_KEY, 1, timeout=window):
+        refresh_listing_stats.apply_async(countdown=window)
+
+
+def queue_stats_refreshes(spans: Iterable[Tuple[int, date, date]]) -> None:
+    """
+    Queue refreshes of (listing_id, start, end) spans, nights in [start, end).
+
+    The spans are recorded in the current transaction, so they commit or
+    roll back with the booking change; once it commits a
+    refresh_listing_stats task is queued LISTING_STATS_REFRESH_WINDOW_MS
+    later, unless one is already waiting. If that task is lost, the
+    periodic sweep refreshes the spans.
+    """
+    rows = [
+        ListingStatsRefresh(listing_id=listing_id, start_date=start, end_date=end)
+        for listing_id, start, end in spans
+        if start < end
+    ]
+    if not rows:
+        return
+    ListingStatsRefresh.objects.bulk_create(rows)
+    transaction.on_commit(_schedule_refresh)
+
+
+def queue_stats_refresh(listing_id: int, start: date, end: date) -> None:
+    """Queue a refresh of one listing's rollups for the nights in [start, end)."""
+    queue_stats_refreshes([(listing_id, start, end)])
+
+
+def queue_booking_stats_refresh(booking_ids: Iterable[int]) -> None:
+    """Queue refreshes for bookings changed without model signals."""
+    queue_stats_refreshes(
+        Booking.objects.filter(pk__in=list(booking_ids)).values_list(
+            "listing_id", "start_date", "end_date"
+        )
+    )
+
+
+def refresh_queued_stats(batch_size: int = 500) -> Tuple[int, int]:
+    """
+    Recompute the spans recorded by queue_stats_refreshes.
+
+    Spans are locked ``batch_size`` at a time, skipping rows another run
+    holds, merged per listing, refreshed and deleted in one transaction;
+    a failure leaves the batch queued for the next run. Returns the
+    number of spans handled and of rollup rows written.
+    """
+    handled = written = 0
+    while True:
+        with transaction.atomic():
+            queued = list(
+                ListingStatsRefresh.objects.select_for_update(skip_locked=True)
+                .order_by("pk")[:batch_size]
+            )
+            if not queued:
+                return handled, written
+            spans = [(span.listing_id, span.start_date, span.end_date) for span in queued]
+            written += sum(refresh_stats(*span) for span in merge_spans(spans))
+            ListingStatsRefresh.objects.filter(pk__in=[span.pk for span in queued]).delete()
+        handled += len(queued)
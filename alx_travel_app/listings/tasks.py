@@ -2,34 +2,41 @@
 Celery tasks for listings app.
 """
 import logging
+from datetime import timedelta
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from .models import Booking
+from django.db import transaction
+from .models import Booking, Payment
+from .payment_utils import initiate_booking_payment
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
-def send_booking_confirmation_email(self, booking_id: int):
+def build_confirmation_email(booking: Booking, connection=None) -> EmailMessage:
     """
-    Send booking confirmation email to the guest.
+    Render the confirmation email for a booking.
+
+    The booking should be loaded with select_related('listing'); otherwise
+    rendering costs an extra query.
     
     Args:
-        booking_id: The ID of the booking
+        booking: The booking to confirm
+        connection: Optional mail connection the message will be sent over
+
+    Returns:
+        EmailMessage: The unsent message
     """
-    try:
-        booking = Booking.objects.get(id=booking_id)
-        
-        subject = f'Booking Confirmation - {booking.listing.title}'
-        message = f'''
+    listing = booking.listing
+    subject = f'Booking Confirmation - {listing.title}'
+    message = f'''
 Dear {booking.guest_name},
 
 Thank you for your booking!
 
 Booking Details:
-- Listing: {booking.listing.title}
-- Location: {booking.listing.location}
+- Listing: {listing.title}
+- Location: {listing.location}
 - Check-in: {booking.start_date}
 - Check-out: {booking.end_date}
 - Total Amount: ${booking.total_price}
@@ -40,16 +47,26 @@ Your booking has been confirmed. We look forward to hosting you!
 Best regards,
 ALX Travel App Team
 '''
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [booking.guest_email]
-        
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=from_email,
-            recipient_list=recipient_list,
-            fail_silently=False,
-        )
+    return EmailMessage(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[booking.guest_email],
+        connection=connection,
+    )
+
+
+@shared_task(bind=True, max_retries=3)
+def send_booking_confirmation_email(self, booking_id: int):
+    """
+    Send booking confirmation email to the guest.
+
+    Args:
+        booking_id: The ID of the booking
+    """
+    try:
+        booking = Booking.objects.select_related('listing').get(id=booking_id)
+        build_confirmation_email(booking).send(fail_silently=False)
         
         logger.info(f'Booking confirmation email sent to {booking.guest_email} for booking #{booking_id}')
         
@@ -60,3 +77,158 @@ ALX Travel App Team
         logger.error(f'Failed to send booking confirmation email: {exc}')
         # Retry the task with exponential backoff
         raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def send_due_confirmation_emails(self):
+    """
+    Send the confirmation emails of bookings flagged confirmation_email_due.
+
+    Queued shortly after each confirmation (email_batching) and run by
+    Celery beat as a sweep, so confirmations close together go out in one
+    batch and none is lost with the process that confirmed it. Flagged
+    bookings are locked CONFIRMATION_EMAIL_BATCH_SIZE at a time, skipping
+    rows another run holds; each batch is sent over one mail connection
+    and its flags are cleared in the same transaction. A failed send
+    leaves the batch flagged and retries.
+
+    Returns:
+        int: Number of messages sent
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            bookings = list(
+                Booking.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('listing')
+                .filter(confirmation_email_due=True)
+                .order_by('pk')[:settings.CONFIRMATION_EMAIL_BATCH_SIZE]
+            )
+            if not bookings:
+                break
+            try:
+                connection = get_connection(fail_silently=False)
+                messages = [build_confirmation_email(booking, connection) for booking in bookings]
+                sent = connection.send_messages(messages) or 0
+            except Exception as exc:
+                logger.error(f'Failed to send {len(bookings)} booking confirmation emails: {exc}')
+                raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+            sent_ids = [booking.pk for booking in bookings]
+            Booking.objects.filter(pk__in=sent_ids).update(confirmation_email_due=False)
+        total += sent
+
+    if total:
+        logger.info(f'Sent {total} due booking confirmation emails')
+    return total
+
+
+@shared_task(bind=True, max_retries=3)
+def initiate_payment_task(self, payment_id: int, callback_url: str):
+    """
+    Initiate a Chapa checkout session for a Payment off the request thread.
+
+    Fills in Payment.checkout_url on success; after the last retry the
+    payment is marked FAILED so pollers stop waiting.
+
+    Args:
+        payment_id: The ID of the payment
+        callback_url: Callback URL for payment verification
+    """
+    try:
+        payment = Payment.objects.select_related('booking').get(id=payment_id)
+    except Payment.DoesNotExist:
+        logger.error(f'Payment #{payment_id} not found')
+        raise
+
+    if payment.status != Payment.Status.PENDING or payment.checkout_url:
+        logger.info(f'Payment #{payment_id} already initiated, skipping')
+        return
+
+    payment_result = initiate_booking_payment(payment, callback_url)
+
+    if payment_result.get("success"):
+        payment.checkout_url = payment_result.get("checkout_url")
+        payment.save(update_fields=["checkout_url", "updated_at"])
+        logger.info(
+            f'Payment initiated for booking {payment.booking_id}, '
+            f'checkout URL: {payment.checkout_url}'
+        )
+        return
+
+    error_msg = payment_result.get("error", "Failed to initiate payment")
+    if self.request.retries < self.max_retries:
+        logger.warning(
+            f'Payment initiation failed for payment #{payment_id}, retrying: {error_msg}'
+        )
+        raise self.retry(countdown=2 ** self.request.retries)
+
+    logger.error(f'Payment initiation failed for payment #{payment_id}: {error_msg}')
+    payment.status = Payment.Status.FAILED
+    payment.save(update_fields=["status", "updated_at"])
+
+
+@shared_task
+def refresh_listing_stats():
+    """
+    Recompute the daily stats rollups of the spans booking writes queued.
+
+    Queued shortly after each booking change (listings.stats) and run by
+    Celery beat as a sweep, so no span is lost with the process that
+    queued it; overlapping spans of a listing are refreshed together.
+
+    Returns:
+        Number of rollup rows written
+    """
+    from .stats import refresh_queued_stats
+
+    spans, written = refresh_queued_stats(settings.LISTING_STATS_REFRESH_BATCH_SIZE)
+    if spans:
+        logger.info(f'Refreshed listing stats for {spans} spans, {written} rows written')
+    return written
+
+
+@shared_task
+def roll_rate_calendars():
+    """
+    Periodic task: move every priced listing's rate calendar window to start today.
+
+    Scheduled daily by Celery beat (see CELERY_BEAT_SCHEDULE in settings).
+
+    Returns:
+        Number of calendar rows written
+    """
+    from .pricing import rebuild_rate_calendars
+
+    written = rebuild_rate_calendars()
+    logger.info(f'Rate calendars rolled forward, {written} rows written')
+    return written
+
+
+@shared_task
+def expire_booking_holds():
+    """
+    Periodic task: cancel unpaid PENDING bookings whose hold has expired.
+
+    Scheduled by Celery beat (see CELERY_BEAT_SCHEDULE in settings).
+
+    Returns:
+        Counts of bookings scanned and expired, and batches written
+    """
+    from .holds import expire_holds
+
+    return expire_holds(batch_size=settings.BOOKING_HOLD_BATCH_SIZE)
+
+
+@shared_task
+def reconcile_payments():
+    """
+    Periodic task: resolve payments left PENDING past the configured threshold.
+
+    Scheduled by Celery beat (see CELERY_BEAT_SCHEDULE in settings).
+    """
+    from .reconciliation import reconcile_pending_payments
+
+    return reconcile_pending_payments(
+        older_than=timedelta(minutes=settings.PAYMENT_RECONCILE_AFTER_MINUTES),
+        concurrency=settings.PAYMENT_RECONCILE_CONCURRENCY,
+    )
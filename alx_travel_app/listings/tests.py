@@ -0,0 +1,1915 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from itertools import combinations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import addModuleCleanup, mock, skipUnless
+
+import requests
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core import mail
+from django.db import DatabaseError, connection, transaction
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import (
+    benchmarks, bulk_bookings, filtering, geo, http_cache, metrics, payment_utils,
+    pricing, ratings, routers, stats, tasks,
+)
+from .models import (
+    Listing, Booking, BookingConflict, BookingNight, ListingDailyStats, ListingRate,
+    ListingStatsRefresh, ListingTerm, Payment, PricingRule, Review,
+)
+from .renderers import ORJSONRenderer, orjson
+from .serializers import BookingSerializer, ListingSerializer, booking_rows, listing_rows
+from .throttling import PaymentTargetThrottle
+
+
+def setUpModule():
+    # Booking and payment writes queue these tasks once they commit; keep
+    # them off the real broker. Tests that check what was queued patch
+    # these again themselves.
+    for task in (tasks.refresh_listing_stats, tasks.send_due_confirmation_emails):
+        patcher = mock.patch.object(task, "apply_async")
+        patcher.start()
+        addModuleCleanup(patcher.stop)
+
+
+def make_listing(**overrides):
+    fields = {
+        "title": "Test Listing",
+        "description": "Nice place",
+        "location": "Test City",
+        "price_per_night": Decimal("100.00"),
+        "max_guests": 2,
+    }
+    fields.update(overrides)
+    return Listing.objects.create(**fields)
+
+
+def make_booking(listing, start, end, **overrides):
+    fields = {
+        "listing": listing,
+        "guest_name": "John Doe",
+        "guest_email": "john@example.com",
+        "start_date": start,
+        "end_date": end,
+        "total_price": listing.price_per_night * (end - start).days,
+    }
+    fields.update(overrides)
+    return Booking.objects.create(**fields)
+
+
+class FakeChapaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, payload, code=200):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def fail_if_requested(self):
+        time.sleep(self.server.delay)
+        if self.server.fail_next > 0:
+            self.server.fail_next -= 1
+            self.send_json({"status": "failed", "message": "Service Unavailable"}, code=503)
+            return True
+        return False
+
+    def do_POST(self):
+        if self.fail_if_requested():
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.initialized.append(payload["tx_ref"])
+        checkout_url = f"https://checkout.test/{payload['tx_ref']}"
+        self.send_json({"status": "success", "data": {"checkout_url": checkout_url}})
+
+    def do_GET(self):
+        if self.fail_if_requested():
+            return
+        tx_ref = self.path.rstrip("/").rsplit("/", 1)[-1]
+        self.server.verified.append(tx_ref)
+        payment_status = self.server.verify_statuses.get(tx_ref, "success")
+        data = {"id": f"chapa-{tx_ref}", "status": payment_status}
+        self.send_json({"status": "success", "data": data})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeChapaHTTPServer(ThreadingHTTPServer):
+    # Room for many connections opened at once by the async client
+    request_queue_size = 128
+
+
+class FakeChapaServer:
+    """Local stand-in for the Chapa API, served on a random port."""
+
+    def __init__(self):
+        self.httpd = FakeChapaHTTPServer(("127.0.0.1", 0), FakeChapaHandler)
+        self.httpd.initialized = []
+        self.httpd.verified = []
+        self.httpd.fail_next = 0
+        self.httpd.delay = 0
+        self.httpd.verify_statuses = {}
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def fail_next(self, count):
+        """Answer the next ``count`` requests with a 503."""
+        self.httpd.fail_next = count
+
+    @property
+    def initialized(self):
+        return self.httpd.initialized
+
+    @property
+    def verified(self):
+        return self.httpd.verified
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeChapaTestCase(TestCase):
+    def setUp(self):
+        self.chapa = FakeChapaServer()
+        self.chapa.start()
+        self.addCleanup(self.chapa.stop)
+        settings_override = self.settings(CHAPA_API_URL=self.chapa.url, CHAPA_RETRY_BACKOFF=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Rebuild the pooled client and breaker from the overridden settings
+        payment_utils.reset_gateway_client()
+        self.addCleanup(payment_utils.reset_gateway_client)
+        cache.clear()
+
+
+class AvailabilitySearchTest(TestCase):
+    def setUp(self):
+        self.url = reverse("listing-available")
+        self.free = make_listing(title="Free", max_guests=4)
+        self.taken = make_listing(title="Taken", max_guests=4)
+        self.small = make_listing(title="Small", max_guests=1)
+        make_booking(self.taken, date(2025, 3, 10), date(2025, 3, 15))
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row["title"] for row in response.json()["results"]}
+
+    def test_excludes_overlapping_and_undersized_listings(self):
+        response = self.client.get(
+            self.url, {"start": "2025-03-12", "end": "2025-03-14", "guests": 2}
+        )
+        self.assertEqual(self.titles(response), {"Free"})
+
+    def test_checkout_day_is_bookable(self):
+        response = self.client.get(self.url, {"start": "2025-03-15", "end": "2025-03-17"})
+        self.assertEqual(self.titles(response), {"Free", "Taken", "Small"})
+
+    def test_cancelled_bookings_do_not_block(self):
+        Booking.objects.filter(listing=self.taken).update(status=Booking.Status.CANCELLED)
+        response = self.client.get(
+            self.url, {"start": "2025-03-12", "end": "2025-03-14", "guests": 2}
+        )
+        self.assertEqual(self.titles(response), {"Free", "Taken"})
+
+    def test_search_query_count_is_constant(self):
+        # One COUNT for pagination plus one page fetch, independent of booking volume.
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {"start": "2025-03-12", "end": "2025-03-14"})
+
+    def test_rejects_invalid_ranges(self):
+        for params in (
+            {"start": "2025-03-12"},
+            {"start": "2025-03-12", "end": "2025-03-12"},
+            {"start": "2025-02-30", "end": "2025-03-12"},
+            {"start": "2025-03-12", "end": "2025-03-14", "guests": "0"},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class DoubleBookingGuardTest(TestCase):
+    def setUp(self):
+        self.listing = make_listing()
+        self.booking = make_booking(self.listing, date(2025, 5, 1), date(2025, 5, 4))
+
+    def booking_data(self, start, end):
+        return {
+            "listing": self.listing.id,
+            "guest_name": "Jane",
+            "guest_email": "jane@example.com",
+            "start_date": start,
+            "end_date": end,
+            "total_price": "200.00",
+        }
+
+    def test_claims_one_row_per_night(self):
+        claims = BookingNight.objects.filter(booking=self.booking)
+        nights = list(claims.values_list("night", flat=True))
+        self.assertEqual(sorted(nights), [date(2025, 5, 1), date(2025, 5, 2), date(2025, 5, 3)])
+
+    def test_serializer_rejects_overlap(self):
+        serializer = BookingSerializer(data=self.booking_data(date(2025, 5, 3), date(2025, 5, 5)))
+        self.assertFalse(serializer.is_valid())
+
+    def test_unique_claim_blocks_overlap_that_skips_validation(self):
+        with self.assertRaises(BookingConflict):
+            make_booking(self.listing, date(2025, 5, 2), date(2025, 5, 6))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_cancelling_releases_nights(self):
+        self.booking.status = Booking.Status.CANCELLED
+        self.booking.save()
+        self.assertFalse(BookingNight.objects.exists())
+        serializer = BookingSerializer(data=self.booking_data(date(2025, 5, 1), date(2025, 5, 4)))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+    def test_backfill_claims_bookings_made_before_claims(self):
+        # Bookings from before night claims existed have none
+        BookingNight.objects.all().delete()
+        fields = {"guest_name": "Old", "guest_email": "old@example.com", "total_price": "1.00"}
+        overlapping, cancelled = Booking.objects.bulk_create([
+            Booking(listing=self.listing, start_date=date(2025, 5, 3), end_date=date(2025, 5, 5),
+                    **fields),
+            Booking(listing=self.listing, start_date=date(2025, 5, 6), end_date=date(2025, 5, 8),
+                    status=Booking.Status.CANCELLED, **fields),
+        ])
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("claim_booking_nights", stdout=out, stderr=err)
+        self.assertIn("Night claims created for 1 bookings", out.getvalue())
+        self.assertIn(str(overlapping.pk), err.getvalue())
+        self.assertEqual(
+            set(BookingNight.objects.values_list("booking_id", flat=True)), {self.booking.pk}
+        )
+        with self.assertRaises(BookingConflict):
+            make_booking(self.listing, date(2025, 5, 2), date(2025, 5, 3))
+
+        call_command("claim_booking_nights", stdout=out, stderr=io.StringIO())
+        self.assertEqual(BookingNight.objects.count(), 3)
+
+
+@mock.patch.object(
+    tasks.initiate_payment_task, "delay", lambda *args: tasks.initiate_payment_task.apply(args=args)
+)
+class PaymentInitiationTest(FakeChapaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.listing = make_listing()
+        self.data = {
+            "listing": self.listing.id,
+            "guest_name": "John Doe",
+            "guest_email": "john@example.com",
+            "start_date": "2025-07-01",
+            "end_date": "2025-07-03",
+            "total_price": "200.00",
+        }
+
+    def test_sync_initiation_stores_checkout_url(self):
+        response = self.client.post(
+            reverse("booking-list"), self.data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        payment = Payment.objects.get()
+        self.assertEqual(self.chapa.initialized, [payment.booking_reference])
+        self.assertEqual(payment.checkout_url, f"https://checkout.test/{payment.booking_reference}")
+
+    @override_settings(CHAPA_BREAKER_FAILURE_THRESHOLD=1, CHAPA_BREAKER_RESET_TIMEOUT=60)
+    def test_open_circuit_returns_503_and_keeps_payment_pending(self):
+        payment_utils.reset_gateway_client()
+        payment_utils.get_circuit_breaker().record_failure()
+        response = self.client.post(
+            reverse("booking-list"), self.data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 503, response.content)
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertEqual(self.chapa.initialized, [])
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, Payment.Status.PENDING)
+        body = response.json()["payment"]
+        self.assertEqual(body["booking_reference"], payment.booking_reference)
+
+        # Once the gateway is back, initiation is retried for the same booking
+        payment_utils.reset_gateway_client()
+        response = self.client.post(body["initiate_url"])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.chapa.initialized, [payment.booking_reference])
+
+    def test_async_initiation_returns_pollable_session(self):
+        with self.settings(CHAPA_ASYNC_INITIATION=True):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(
+                    reverse("booking-list"), self.data, content_type="application/json"
+                )
+            self.assertEqual(response.status_code, 202, response.content)
+            self.assertEqual(self.chapa.initialized, [])
+
+            session_url = response["Location"]
+            pending = self.client.get(session_url)
+            self.assertIsNone(pending.json()["checkout_url"])
+            self.assertEqual(pending["Retry-After"], "1")
+
+            for callback in callbacks:
+                callback()
+            ready = self.client.get(session_url)
+
+        reference = response.json()["payment"]["booking_reference"]
+        self.assertEqual(self.chapa.initialized, [reference])
+        self.assertEqual(ready.json()["checkout_url"], f"https://checkout.test/{reference}")
+        self.assertFalse(ready.has_header("Retry-After"))
+
+
+class BulkBookingTest(FakeChapaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.listing = make_listing()
+        self.url = reverse("booking-bulk")
+
+    def item(self, start, nights=2, **overrides):
+        item = {
+            "listing": self.listing.id,
+            "guest_name": "Agency Guest",
+            "guest_email": "agency@example.com",
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=nights)).isoformat(),
+            "total_price": "200.00",
+        }
+        item.update(overrides)
+        return item
+
+    def post(self, items):
+        return self.client.post(self.url, items, content_type="application/json")
+
+    def test_per_item_results(self):
+        make_booking(self.listing, date(2025, 8, 1), date(2025, 8, 3))
+        response = self.post([
+            self.item(date(2025, 7, 1)),
+            self.item(date(2025, 8, 2)),  # taken by the existing booking
+            self.item(date(2025, 7, 2)),  # overlaps the first item
+            self.item(date(2025, 7, 10), end_date="2025-07-01"),
+            self.item(date(2025, 7, 20), listing=999999),
+            self.item(date(2025, 7, 10)),
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual((body["created"], body["rejected"]), (2, 4))
+        self.assertEqual(
+            [result["status"] for result in body["results"]],
+            ["created", "rejected", "rejected", "rejected", "rejected", "created"],
+        )
+        self.assertIn("listing", body["results"][4]["errors"])
+
+        created = [result for result in body["results"] if result["status"] == "created"]
+        references = [result["payment"]["booking_reference"] for result in created]
+        self.assertEqual(sorted(self.chapa.initialized), sorted(references))
+        for result in created:
+            payment = Payment.objects.get(booking_id=result["booking"]["id"])
+            self.assertEqual(
+                payment.checkout_url, f"https://checkout.test/{payment.booking_reference}"
+            )
+            self.assertEqual(result["payment"]["checkout_url"], payment.checkout_url)
+        self.assertEqual(BookingNight.objects.count(), 6)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def queries_for(count, month):
+            items = [self.item(date(2026, month, 1) + timedelta(days=3 * i)) for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post(items).status_code, 201)
+            return len(queries)
+
+        self.assertEqual(queries_for(2, 1), queries_for(8, 3))
+
+    def test_chapa_sessions_are_initiated_concurrently(self):
+        self.chapa.httpd.delay = 0.3
+        started = time.monotonic()
+        response = self.post(
+            [self.item(date(2026, 5, 1) + timedelta(days=3 * i)) for i in range(4)]
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_falls_back_to_one_by_one_on_a_concurrent_claim(self):
+        bookings, errors = bulk_bookings.validate_bookings(
+            [self.item(date(2025, 9, 1)), self.item(date(2025, 9, 10))]
+        )
+        self.assertEqual(errors, {})
+        make_booking(self.listing, date(2025, 9, 1), date(2025, 9, 3))  # lands after validation
+
+        payments, conflicts = bulk_bookings.insert_bookings(bookings)
+        self.assertEqual(list(payments), [1])
+        self.assertEqual(list(conflicts), [0])
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_rejects_empty_and_oversized_requests(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        with self.settings(BULK_BOOKING_MAX_ITEMS=1):
+            self.assertEqual(self.post([self.item(date(2025, 7, 1))] * 2).status_code, 400)
+        response = self.post([self.item(date(2025, 7, 1), end_date="2025-06-01")])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["results"][0]["status"], "rejected")
+
+
+class ChapaClientTest(FakeChapaTestCase):
+    def test_connections_are_reused(self):
+        for n in range(3):
+            self.assertTrue(payment_utils.verify_chapa_payment(f"BK-{n}")["success"])
+        pools = payment_utils.gateway_stats()["pools"]
+        pool = pools[f"http://127.0.0.1:{self.chapa.httpd.server_port}"]
+        self.assertEqual(pool["requests"], 3)
+        self.assertEqual(pool["connections_opened"], 1)
+
+    def test_verify_retries_transient_gateway_errors(self):
+        self.chapa.fail_next(2)
+        result = payment_utils.verify_chapa_payment("BK-1")
+        self.assertTrue(result["success"], result)
+
+    def test_initiation_is_not_retried(self):
+        self.chapa.fail_next(1)
+        result = payment_utils.initiate_chapa_payment(
+            100, "a@example.com", "A", "B", "BK-1", "http://cb/"
+        )
+        self.assertFalse(result["success"])
+        self.assertEqual(self.chapa.initialized, [])
+
+    def test_breaker_opens_and_fails_fast(self):
+        with self.settings(CHAPA_BREAKER_FAILURE_THRESHOLD=2, CHAPA_VERIFY_RETRIES=0):
+            payment_utils.reset_gateway_client()
+            self.chapa.fail_next(2)
+            payment_utils.verify_chapa_payment("BK-1")
+            payment_utils.verify_chapa_payment("BK-2")
+
+            result = payment_utils.verify_chapa_payment("BK-3")
+        self.assertFalse(result["success"])
+        self.assertIn("circuit open", result["error"])
+        self.assertEqual(self.chapa.verified, [])
+        stats = payment_utils.gateway_stats()["circuit_breaker"]
+        self.assertEqual(stats["state"], payment_utils.CircuitBreaker.OPEN)
+        self.assertEqual(stats["rejected_calls"], 1)
+
+
+class MetricsTest(FakeChapaTestCase):
+    def series_sum(self, histogram, *labels):
+        return dict(histogram.snapshot()).get(labels, [0])[-1]
+
+    def test_requests_are_timed_with_their_queries(self):
+        make_listing()
+        before = metrics.request_duration.count("listing-list", "GET", 200)
+        queries_before = self.series_sum(metrics.request_queries, "listing-list")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("listing-list"))
+        self.assertEqual(metrics.request_duration.count("listing-list", "GET", 200), before + 1)
+        self.assertEqual(
+            self.series_sum(metrics.request_queries, "listing-list"), queries_before + len(queries)
+        )
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{route="listing-list",method="GET",status="200",le="+Inf"}',
+            body,
+        )
+        self.assertIn("# TYPE http_request_db_queries histogram", body)
+        self.assertIn('chapa_circuit_state{state="closed"} 1', body)
+
+    def test_chapa_calls_are_timed_and_errors_counted(self):
+        verified = metrics.chapa_duration.count("verify", "2xx")
+        failed = metrics.chapa_errors.value("initialize", "5xx")
+        payment_utils.verify_chapa_payment("BK-1")
+        self.chapa.fail_next(1)
+        payment_utils.initiate_chapa_payment(100, "a@example.com", "A", "B", "BK-2", "http://cb/")
+        self.assertEqual(metrics.chapa_duration.count("verify", "2xx"), verified + 1)
+        self.assertEqual(metrics.chapa_errors.value("initialize", "5xx"), failed + 1)
+
+    def test_task_durations_and_retries(self):
+        booking = make_booking(make_listing(), date(2025, 8, 1), date(2025, 8, 3))
+        name = tasks.send_booking_confirmation_email.name
+        succeeded = metrics.task_duration.count(name, "SUCCESS")
+        tasks.send_booking_confirmation_email.apply(args=[booking.id])
+        self.assertEqual(metrics.task_duration.count(name, "SUCCESS"), succeeded + 1)
+
+        retries = metrics.task_retries.value(name)
+        with mock.patch.object(tasks, "build_confirmation_email", side_effect=OSError("smtp down")):
+            tasks.send_booking_confirmation_email.apply(args=[booking.id])
+        self.assertEqual(metrics.task_retries.value(name), retries + 3)
+        self.assertIn(f'celery_task_retries_total{{task="{name}"}}', metrics.render())
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token_protects_endpoint(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+
+class CircuitBreakerTest(FakeChapaTestCase):
+    def test_half_open_allows_single_trial(self):
+        breaker = payment_utils.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, payment_utils.CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    @override_settings(CHAPA_BREAKER_FAILURE_THRESHOLD=1, CHAPA_BREAKER_RESET_TIMEOUT=0)
+    def test_unexpected_error_in_trial_call_frees_the_slot(self):
+        payment_utils.reset_gateway_client()
+        payment_utils.get_circuit_breaker().record_failure()
+        truncated = requests.exceptions.ChunkedEncodingError("Connection broken")
+        with mock.patch.object(payment_utils.get_session(), "request", side_effect=truncated):
+            self.assertFalse(payment_utils.verify_chapa_payment("BK-1")["success"])
+        # The next call is let through as the trial, and closes the circuit
+        self.assertTrue(payment_utils.verify_chapa_payment("BK-1")["success"])
+        breaker = payment_utils.get_circuit_breaker()
+        self.assertEqual(breaker.state, payment_utils.CircuitBreaker.CLOSED)
+
+    @skipUnless(payment_utils.httpx is not None, "httpx is not installed")
+    @override_settings(CHAPA_BREAKER_FAILURE_THRESHOLD=1, CHAPA_BREAKER_RESET_TIMEOUT=0)
+    async def test_cancelled_async_trial_call_frees_the_slot(self):
+        payment_utils.reset_gateway_client()
+        payment_utils.get_circuit_breaker().record_failure()
+        client = payment_utils.get_async_gateway().client
+        # What a client disconnect does to the ASGI request's task mid-call
+        with mock.patch.object(client, "request", side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                await payment_utils.averify_chapa_payment("BK-1")
+        self.assertTrue((await payment_utils.averify_chapa_payment("BK-1"))["success"])
+        breaker = payment_utils.get_circuit_breaker()
+        self.assertEqual(breaker.state, payment_utils.CircuitBreaker.CLOSED)
+
+
+class PaymentAdmissionTest(FakeChapaTestCase):
+    def setUp(self):
+        super().setUp()
+        booking = make_booking(make_listing(), date(2025, 8, 1), date(2025, 8, 3))
+        self.payment = Payment.objects.create(
+            booking=booking, booking_reference="BK-1-TEST", amount=booking.total_price
+        )
+        rates = mock.patch.dict(
+            api_settings.DEFAULT_THROTTLE_RATES, {"payments": "100/min", "payment-target": "2/min"}
+        )
+        rates.start()
+        self.addCleanup(rates.stop)
+
+    def test_token_bucket_bursts_then_refills(self):
+        throttle = PaymentTargetThrottle()
+        throttle.num_requests, throttle.duration = 3, 60
+        taken = [throttle.take_token("bucket", 1000.0) for _ in range(4)]
+        self.assertEqual(taken[:3], [None, None, None])
+        self.assertAlmostEqual(taken[3], 20.0)
+        # One token every 20s, and a rejected request doesn't consume one
+        self.assertIsNotNone(throttle.take_token("bucket", 1019.0))
+        self.assertIsNone(throttle.take_token("bucket", 1020.0))
+        self.assertIsNotNone(throttle.take_token("bucket", 1020.0))
+        # Idle for longer than the period: full again, but no more than the burst
+        refilled = [throttle.take_token("bucket", 2000.0) for _ in range(4)]
+        self.assertEqual(refilled[:3], [None, None, None])
+        self.assertIsNotNone(throttle.take_token("bucket", 2000.0))
+
+    def test_idle_bucket_holds_no_more_than_the_burst(self):
+        throttle = PaymentTargetThrottle()
+        throttle.num_requests, throttle.duration = 10, 60
+        self.assertIsNone(throttle.take_token("idle", 1000.0))
+        burst = [throttle.take_token("idle", 1059.0) for _ in range(18)]
+        self.assertEqual(sum(wait is None for wait in burst), 10)
+        # Half a period later only the refilled half is available
+        later = [throttle.take_token("idle", 1089.0) for _ in range(10)]
+        self.assertEqual(sum(wait is None for wait in later), 5)
+
+    def test_verify_is_throttled_per_tx_ref(self):
+        url = reverse("verify-payment")
+        responses = [self.client.get(url, {"tx_ref": "BK-1-TEST"}) for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertEqual(responses[2]["Retry-After"], "30")
+        # Another payment has its own bucket
+        self.assertEqual(self.client.get(url, {"tx_ref": "BK-OTHER"}).status_code, 404)
+
+    def test_saturated_gateway_returns_503_without_failing_payment(self):
+        self.chapa.httpd.delay = 0.3
+        with self.settings(CHAPA_MAX_IN_FLIGHT=1, CHAPA_ADMISSION_WAIT=0, CHAPA_BUSY_RETRY_AFTER=2):
+            payment_utils.reset_gateway_client()
+            busy = threading.Thread(target=payment_utils.verify_chapa_payment, args=("BK-9",))
+            busy.start()
+            time.sleep(0.1)
+            response = self.client.post(reverse("initiate-payment", args=[self.payment.booking_id]))
+            busy.join()
+        self.assertEqual(response.status_code, 503, response.content)
+        self.assertEqual(response["Retry-After"], "2")
+        self.assertEqual(self.chapa.initialized, [])
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.Status.PENDING)
+        admission = payment_utils.gateway_stats()["admission"]
+        self.assertEqual(
+            (admission["rejected_calls"], admission["peak_in_flight"], admission["in_flight"]),
+            (1, 1, 0),
+        )
+
+
+class VerifyPaymentIdempotencyTest(FakeChapaTestCase):
+    def setUp(self):
+        super().setUp()
+        booking = make_booking(make_listing(), date(2025, 8, 1), date(2025, 8, 3))
+        self.payment = Payment.objects.create(
+            booking=booking, booking_reference="BK-1-TEST", amount=booking.total_price
+        )
+        self.url = reverse("verify-payment")
+        email_patch = mock.patch.object(tasks.send_due_confirmation_emails, "apply_async")
+        self.send_email = email_patch.start()
+        self.addCleanup(email_patch.stop)
+
+    def test_repeated_callbacks_verify_and_email_once(self):
+        for _ in range(3):
+            response = self.client.get(self.url, {"tx_ref": "BK-1-TEST"})
+            self.assertEqual(response.json()["payment_status"], Payment.Status.COMPLETED)
+        self.assertEqual(self.chapa.verified, ["BK-1-TEST"])
+        self.send_email.assert_called_once()
+        self.payment.booking.refresh_from_db()
+        self.assertEqual(self.payment.booking.status, Booking.Status.CONFIRMED)
+        self.assertTrue(self.payment.booking.confirmation_email_due)
+
+    @override_settings(CHAPA_VERIFY_CACHE_TTL=60)
+    def test_pending_result_is_not_cached(self):
+        self.chapa.httpd.verify_statuses["BK-1-TEST"] = "pending"
+        response = self.client.get(self.url, {"tx_ref": "BK-1-TEST"})
+        self.assertEqual(response.json()["status"], "pending")
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.Status.PENDING)
+
+        # The customer pays within the TTL
+        del self.chapa.httpd.verify_statuses["BK-1-TEST"]
+        response = self.client.get(self.url, {"tx_ref": "BK-1-TEST"})
+        self.assertEqual(response.json()["payment_status"], Payment.Status.COMPLETED)
+        self.assertEqual(self.chapa.verified, ["BK-1-TEST", "BK-1-TEST"])
+        self.send_email.assert_called_once()
+
+    def test_completed_payment_short_circuits(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        response = self.client.post(
+            self.url, {"tx_ref": "BK-1-TEST"}, content_type="application/json"
+        )
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(self.chapa.verified, [])
+        self.send_email.assert_not_called()
+
+    def test_concurrent_verifications_share_one_upstream_call(self):
+        self.chapa.httpd.delay = 0.2
+        results = []
+
+        def verify():
+            results.append(payment_utils.verify_chapa_payment_cached("BK-9"))
+
+        threads = [threading.Thread(target=verify) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.chapa.verified, ["BK-9"])
+        self.assertTrue(all(result["success"] for result in results))
+
+    def test_concurrent_pending_verifications_share_one_upstream_call(self):
+        self.chapa.httpd.delay = 0.2
+        self.chapa.httpd.verify_statuses["BK-9"] = "pending"
+        results = []
+
+        def verify():
+            results.append(payment_utils.verify_chapa_payment_cached("BK-9"))
+
+        threads = [threading.Thread(target=verify) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.chapa.verified, ["BK-9"])
+        self.assertEqual([result["status"] for result in results], ["pending"] * 4)
+        # A later caller asks Chapa again
+        payment_utils.verify_chapa_payment_cached("BK-9")
+        self.assertEqual(self.chapa.verified, ["BK-9", "BK-9"])
+
+    def test_expired_lock_taken_by_another_caller_is_kept(self):
+        _, lock_key = payment_utils._verify_cache_keys("BK-9")
+        verify = payment_utils.verify_chapa_payment
+
+        def slow_verify(tx_ref):
+            # This caller's lock expires and someone else takes it
+            cache.set(lock_key, "other")
+            return verify(tx_ref)
+
+        with mock.patch.object(payment_utils, "verify_chapa_payment", slow_verify):
+            payment_utils.verify_chapa_payment_cached("BK-9")
+        self.assertEqual(cache.get(lock_key), "other")
+
+
+@override_settings(ROOT_URLCONF="listings.async_urls")
+class AsyncViewsTest(FakeChapaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.listing = make_listing(title="Async Flat", location="Addis Ababa")
+        booking = make_booking(self.listing, date(2025, 8, 1), date(2025, 8, 3))
+        self.payment = Payment.objects.create(
+            booking=booking, booking_reference="BK-1-TEST", amount=booking.total_price
+        )
+        email_patch = mock.patch.object(tasks.send_due_confirmation_emails, "apply_async")
+        self.send_email = email_patch.start()
+        self.addCleanup(email_patch.stop)
+
+    async def test_verify_payment_completes_once(self):
+        url = reverse("verify-payment")
+        for _ in range(2):
+            response = await self.async_client.get(url, {"tx_ref": "BK-1-TEST"})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()["payment_status"], Payment.Status.COMPLETED)
+        self.assertEqual(self.chapa.verified, ["BK-1-TEST"])
+        self.send_email.assert_called_once()
+        booking = await Booking.objects.aget(pk=self.payment.booking_id)
+        self.assertEqual(booking.status, Booking.Status.CONFIRMED)
+        self.assertTrue(booking.confirmation_email_due)
+
+        response = await self.async_client.post(url, {}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(url, {"tx_ref": "BK-OTHER"})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_initiate_payment_stores_checkout_url(self):
+        booking = await Booking.objects.aget(pk=self.payment.booking_id)
+        response = await self.async_client.post(reverse("initiate-payment", args=[booking.id]))
+        self.assertEqual(response.status_code, 200, response.content)
+        await self.payment.arefresh_from_db()
+        self.assertEqual(self.chapa.initialized, ["BK-1-TEST"])
+        self.assertEqual(
+            response.json()["payment"]["checkout_url"], "https://checkout.test/BK-1-TEST"
+        )
+        self.assertEqual(self.payment.checkout_url, "https://checkout.test/BK-1-TEST")
+
+        response = await self.async_client.post(
+            reverse("initiate-payment", args=[booking.id + 100])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_payment_throttles_apply(self):
+        rates = {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "payment-target": "2/min"}
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            codes = [
+                (await self.async_client.get(
+                    reverse("verify-payment"), {"tx_ref": "BK-1-TEST"}
+                )).status_code
+                for _ in range(3)
+            ]
+        self.assertEqual(codes, [200, 200, 429])
+
+    async def test_gateway_calls_overlap_on_one_loop(self):
+        self.chapa.httpd.delay = 0.3
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(payment_utils.averify_chapa_payment(f"BK-{n}") for n in range(20))
+        )
+        elapsed = time.perf_counter() - started
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertLess(elapsed, 20 * 0.3 / 4)
+        self.assertEqual(payment_utils.gateway_stats()["async_admission"]["peak_in_flight"], 20)
+
+    async def test_concurrent_pending_verifications_share_one_upstream_call(self):
+        self.chapa.httpd.delay = 0.2
+        self.chapa.httpd.verify_statuses["BK-9"] = "pending"
+        results = await asyncio.gather(
+            *(payment_utils.averify_chapa_payment_cached("BK-9") for _ in range(4))
+        )
+        self.assertEqual(self.chapa.verified, ["BK-9"])
+        self.assertEqual([result["status"] for result in results], ["pending"] * 4)
+
+    async def test_falls_back_to_threads_without_httpx(self):
+        with mock.patch.object(payment_utils, "httpx", None):
+            result = await payment_utils.averify_chapa_payment("BK-7")
+        self.assertTrue(result["success"])
+        self.assertEqual(self.chapa.verified, ["BK-7"])
+
+    async def test_listing_reads_match_sync_views(self):
+        await Listing.objects.acreate(
+            title="Second", description="d", location="Addis Ababa",
+            price_per_night=Decimal("80.00"), max_guests=2,
+        )
+        paths = [
+            reverse("listing-list"),
+            reverse("listing-list") + "?location=Addis+Ababa&ordering=price",
+            reverse("listing-list") + "?pagination=cursor",
+            reverse("listing-list") + "?page=9",
+            reverse("listing-list") + "?ordering=title",
+            reverse("listing-detail", args=[self.listing.id]),
+            reverse("listing-detail", args=[self.listing.id + 100]),
+        ]
+        for path in paths:
+            await cache.aclear()
+            with self.settings(ROOT_URLCONF="alx_travel_app.urls"):
+                expected = await sync_to_async(self.client.get)(path)
+            await cache.aclear()
+            response = await self.async_client.get(path)
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(response.json(), expected.json(), path)
+            self.assertEqual(response.get("ETag"), expected.get("ETag"), path)
+
+        etag = (await self.async_client.get(paths[0]))["ETag"]
+        not_modified = await self.async_client.get(paths[0], headers={"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_content_negotiation_matches_sync_views(self):
+        verify = reverse("verify-payment") + "?tx_ref=BK-OTHER"
+        detail = reverse("listing-detail", args=[self.listing.id])
+        cases = [
+            (reverse("listing-list"), "text/html"),
+            (reverse("listing-list"), "application/xml"),
+            (detail + "?format=json", "text/html"),
+            (detail, "application/json; indent=2"),
+            (verify, "text/html"),
+            (verify, "application/xml"),
+        ]
+        for path, accept in cases:
+            await cache.aclear()
+            with self.settings(ROOT_URLCONF="alx_travel_app.urls"):
+                expected = await sync_to_async(self.client.get)(path, headers={"Accept": accept})
+            await cache.aclear()
+            response = await self.async_client.get(path, headers={"Accept": accept})
+            self.assertEqual(response.status_code, expected.status_code, (path, accept))
+            self.assertEqual(response["Content-Type"], expected["Content-Type"], (path, accept))
+            # @api_view builds Allow from a set, so its order varies
+            allowed = set(expected["Allow"].split(", "))
+            self.assertEqual(set(response["Allow"].split(", ")), allowed, path)
+            self.assertIn("Accept", response["Vary"], (path, accept))
+            if expected["Content-Type"].startswith("application/json"):
+                self.assertEqual(response.content, expected.content, (path, accept))
+
+        with self.settings(ROOT_URLCONF="alx_travel_app.urls"):
+            expected = await sync_to_async(self.client.options)(reverse("verify-payment"))
+        response = await self.async_client.options(reverse("verify-payment"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["renders"], expected.json()["renders"])
+
+    async def test_requests_are_timed_with_their_queries(self):
+        def series(histogram):
+            return dict(histogram.snapshot()).get(("listing-list",), [0])[-1]
+
+        db_time, queries = series(metrics.request_db_duration), series(metrics.request_queries)
+        before = metrics.request_duration.count("listing-list", "GET", 200)
+        response = await self.async_client.get(reverse("listing-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.request_duration.count("listing-list", "GET", 200), before + 1)
+        # The count and page queries run on a sync_to_async thread's connection
+        self.assertEqual(series(metrics.request_queries), queries + 2)
+        self.assertGreater(series(metrics.request_db_duration), db_time)
+
+    async def test_listing_writes_go_to_the_viewset(self):
+        body = {
+            "title": "New", "description": "d", "location": "Adama",
+            "price_per_night": "50.00", "max_guests": 2,
+        }
+        response = await self.async_client.post(
+            reverse("listing-list"), body, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        response = await self.async_client.delete(
+            reverse("listing-detail", args=[response.json()["id"]])
+        )
+        self.assertEqual(response.status_code, 204)
+
+
+@mock.patch.object(tasks.send_due_confirmation_emails, "delay")
+class ReconcilePaymentsTest(FakeChapaTestCase):
+    def make_payment(self, reference, start, age):
+        booking = make_booking(make_listing(), start, start + timedelta(days=2))
+        payment = Payment.objects.create(
+            booking=booking, booking_reference=reference, amount=booking.total_price
+        )
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - age)
+        return payment
+
+    def test_resolves_stale_pending_payments(self, send_email):
+        paid = self.make_payment("BK-PAID", date(2025, 9, 1), timedelta(hours=2))
+        self.make_payment("BK-DECLINED", date(2025, 9, 5), timedelta(hours=2))
+        self.make_payment("BK-WAITING", date(2025, 9, 9), timedelta(hours=2))
+        self.make_payment("BK-FRESH", date(2025, 9, 13), timedelta(minutes=1))
+        self.chapa.httpd.verify_statuses.update({"BK-DECLINED": "failed", "BK-WAITING": "pending"})
+
+        call_command(
+            "reconcile_payments",
+            older_than=30, chunk_size=2, concurrency=2, stdout=io.StringIO(),
+        )
+
+        statuses = dict(Payment.objects.values_list("booking_reference", "status"))
+        self.assertEqual(statuses, {
+            "BK-PAID": Payment.Status.COMPLETED,
+            "BK-DECLINED": Payment.Status.FAILED,
+            "BK-WAITING": Payment.Status.PENDING,
+            "BK-FRESH": Payment.Status.PENDING,
+        })
+        self.assertNotIn("BK-FRESH", self.chapa.verified)
+        paid.booking.refresh_from_db()
+        self.assertEqual(paid.booking.status, Booking.Status.CONFIRMED)
+        self.assertTrue(paid.booking.confirmation_email_due)
+        send_email.assert_called_once_with()
+
+    def test_late_payments_reconfirm_or_are_logged_for_refund(self, send_email):
+        free = self.make_payment("BK-FREE", date(2025, 9, 1), timedelta(hours=2))
+        taken = self.make_payment("BK-TAKEN", date(2025, 9, 1), timedelta(hours=2))
+        for payment in (free, taken):
+            # The hold expired while the guest was still paying
+            payment.booking.status = Booking.Status.CANCELLED
+            payment.booking.save(update_fields=["status"])
+        make_booking(taken.booking.listing, date(2025, 9, 2), date(2025, 9, 4))
+
+        with self.assertLogs("listings.models", "ERROR") as logs:
+            call_command("reconcile_payments", older_than=30, stdout=io.StringIO())
+
+        self.assertIn("BK-TAKEN", logs.output[0])
+        statuses = dict(Payment.objects.values_list("booking_reference", "status"))
+        self.assertEqual(statuses["BK-FREE"], Payment.Status.COMPLETED)
+        self.assertEqual(statuses["BK-TAKEN"], Payment.Status.COMPLETED)
+        free.booking.refresh_from_db()
+        taken.booking.refresh_from_db()
+        self.assertEqual(free.booking.status, Booking.Status.CONFIRMED)
+        self.assertTrue(free.booking.confirmation_email_due)
+        self.assertEqual(taken.booking.status, Booking.Status.CANCELLED)
+        self.assertFalse(taken.booking.confirmation_email_due)
+        send_email.assert_called_once_with()
+
+
+@override_settings(BOOKING_HOLD_MINUTES=60)
+class BookingHoldTest(TestCase):
+    def make_held(
+        self, start, age,
+        booking_status=Booking.Status.PENDING, payment_status=Payment.Status.PENDING,
+    ):
+        booking = make_booking(
+            self.listing, start, start + timedelta(days=2), status=booking_status
+        )
+        Payment.objects.create(
+            booking=booking, booking_reference=f"BK-{booking.pk}",
+            amount=booking.total_price, status=payment_status,
+        )
+        Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - age)
+        return booking
+
+    def setUp(self):
+        self.listing = make_listing()
+
+    def test_expires_stale_unpaid_bookings_in_batches(self):
+        expired = [self.make_held(date(2025, 9, 1 + 3 * n), timedelta(hours=2)) for n in range(3)]
+        fresh = self.make_held(date(2025, 9, 10), timedelta(minutes=5))
+        confirmed = self.make_held(
+            date(2025, 9, 13), timedelta(hours=2), booking_status=Booking.Status.CONFIRMED
+        )
+        # Payment completed, booking not yet confirmed: left for mark_completed
+        paying = self.make_held(
+            date(2025, 9, 16), timedelta(hours=2), payment_status=Payment.Status.COMPLETED
+        )
+
+        out = io.StringIO()
+        call_command("expire_booking_holds", batch_size=2, stdout=out)
+
+        self.assertIn("scanned: 4, expired: 3, batches: 2", out.getvalue())
+        statuses = dict(Booking.objects.values_list("pk", "status"))
+        self.assertEqual({statuses[b.pk] for b in expired}, {Booking.Status.CANCELLED})
+        self.assertEqual(statuses[fresh.pk], Booking.Status.PENDING)
+        self.assertEqual(statuses[confirmed.pk], Booking.Status.CONFIRMED)
+        self.assertEqual(statuses[paying.pk], Booking.Status.PENDING)
+        payments = Payment.objects.filter(booking__in=expired)
+        self.assertEqual(
+            set(payments.values_list("status", flat=True)), {Payment.Status.FAILED}
+        )
+        self.assertFalse(BookingNight.objects.filter(booking__in=expired).exists())
+        # The released nights can be booked again
+        make_booking(self.listing, date(2025, 9, 1), date(2025, 9, 3))
+
+    def test_hold_expiry_is_reported_on_pending_bookings(self):
+        booking = self.make_held(date(2025, 9, 1), timedelta(minutes=5))
+        booking.refresh_from_db()
+        data = self.client.get(reverse("booking-detail", args=[booking.pk])).json()
+        self.assertEqual(
+            data["hold_expires_at"], BookingSerializer(booking).data["hold_expires_at"]
+        )
+        self.assertEqual(booking.hold_expires_at, booking.created_at + timedelta(minutes=60))
+        listed = self.client.get(reverse("booking-list")).json()
+        self.assertEqual(listed["results"][0]["hold_expires_at"], data["hold_expires_at"])
+        with override_settings(BOOKING_HOLD_MINUTES=0):
+            self.assertIsNone(booking.hold_expires_at)
+            self.assertEqual(
+                tasks.expire_booking_holds(), {"scanned": 0, "expired": 0, "batches": 0}
+            )
+
+    def test_payment_after_expiry(self):
+        booking = self.make_held(date(2025, 9, 1), timedelta(hours=2))
+        tasks.expire_booking_holds()
+        response = self.client.post(reverse("initiate-payment", args=[booking.pk]))
+        self.assertEqual(response.status_code, 400)
+
+        # Nights still free: the late payment confirms the booking again
+        self.assertTrue(Payment.objects.get(booking=booking).mark_completed("tx-1"))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, Booking.Status.CONFIRMED)
+        self.assertTrue(booking.confirmation_email_due)
+
+        # Nights booked by someone else: the payment stands but the booking stays cancelled
+        rebooked = self.make_held(date(2025, 9, 5), timedelta(hours=2))
+        tasks.expire_booking_holds()
+        make_booking(self.listing, date(2025, 9, 5), date(2025, 9, 7))
+        payment = Payment.objects.get(booking=rebooked)
+        with self.assertLogs("listings.models", "ERROR"):
+            self.assertFalse(payment.mark_completed("tx-2"))
+        payment.refresh_from_db()
+        rebooked.refresh_from_db()
+        self.assertEqual(payment.status, Payment.Status.COMPLETED)
+        self.assertEqual(rebooked.status, Booking.Status.CANCELLED)
+        self.assertFalse(rebooked.confirmation_email_due)
+
+
+class ConfirmationEmailTest(TestCase):
+    def setUp(self):
+        listing = make_listing(title="Lake House")
+        self.bookings = [
+            make_booking(
+                listing, date(2025, 10, 1 + 3 * n), date(2025, 10, 3 + 3 * n),
+                guest_email=f"g{n}@example.com",
+            )
+            for n in range(3)
+        ]
+
+    def test_single_email_loads_listing_with_booking(self):
+        with self.assertNumQueries(1):
+            tasks.send_booking_confirmation_email(self.bookings[0].id)
+        self.assertEqual(mail.outbox[0].subject, "Booking Confirmation - Lake House")
+
+    def test_due_emails_go_out_in_batches_and_once(self):
+        ids = [booking.id for booking in self.bookings]
+        Booking.objects.filter(pk__in=ids).update(confirmation_email_due=True)
+        connections = mock.patch.object(tasks, "get_connection", wraps=tasks.get_connection)
+        with override_settings(CONFIRMATION_EMAIL_BATCH_SIZE=2):
+            with connections as get_connection:
+                self.assertEqual(tasks.send_due_confirmation_emails(), 3)
+        self.assertEqual(get_connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(Booking.objects.filter(confirmation_email_due=True).exists())
+        self.assertEqual(tasks.send_due_confirmation_emails(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_send_keeps_emails_due(self):
+        Booking.objects.filter(pk=self.bookings[0].id).update(confirmation_email_due=True)
+        with mock.patch.object(tasks, "get_connection", side_effect=ConnectionRefusedError):
+            with self.assertLogs("listings.tasks", "ERROR"):
+                with self.assertRaises(ConnectionRefusedError):
+                    tasks.send_due_confirmation_emails()
+        self.assertTrue(Booking.objects.get(pk=self.bookings[0].id).confirmation_email_due)
+
+
+class SeedCommandTest(TestCase):
+    def test_seed_creates_data(self):
+        call_command(
+            "seed", listings=2, bookings_per_listing=1, reviews_per_listing=1,
+            flush=True, stdout=io.StringIO(),
+        )
+        self.assertEqual(Listing.objects.count(), 2)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(Review.objects.count(), 2)
+
+    def test_bulk_seed_matches_regular_seed(self):
+        bookings = Booking.objects.order_by("guest_name")
+        call_command(
+            "seed", listings=3, bookings_per_listing=2, reviews_per_listing=1, stdout=io.StringIO()
+        )
+        regular = list(bookings.values_list("guest_name", "start_date", "total_price"))
+
+        out = io.StringIO()
+        call_command(
+            "seed", listings=3, bookings_per_listing=2, reviews_per_listing=1,
+            flush=True, bulk=True, batch_size=2, chunk_commits=True, stdout=out,
+        )
+        bulk = list(bookings.values_list("guest_name", "start_date", "total_price"))
+        self.assertEqual(bulk, regular)
+        self.assertEqual(Review.objects.count(), 3)
+        # Bulk-inserted bookings still claim their nights
+        self.assertEqual(BookingNight.objects.count(), 6 * 2)
+        self.assertIn("rows/sec", out.getvalue())
+
+    def test_bulk_seed_appends_after_existing_rows(self):
+        call_command("seed", listings=2, bulk=True, stdout=io.StringIO())
+        call_command("seed", listings=2, bulk=True, stdout=io.StringIO())
+        self.assertEqual(Listing.objects.count(), 4)
+        self.assertEqual(Booking.objects.count(), 8)
+
+
+class RatingAggregatesTest(TestCase):
+    def setUp(self):
+        self.listing = make_listing()
+
+    def add_review(self, rating):
+        return Review.objects.create(listing=self.listing, reviewer_name="R", rating=rating)
+
+    def test_aggregates_follow_review_writes(self):
+        self.add_review(5)
+        low = self.add_review(2)
+        self.add_review(4)
+        low.rating = 3
+        low.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.review_count, 3)
+        self.assertEqual(self.listing.avg_rating, Decimal("4.00"))
+        self.assertEqual(self.listing.rating_histogram, {"1": 0, "2": 0, "3": 1, "4": 1, "5": 1})
+
+        low.delete()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.review_count, 2)
+        self.assertEqual(self.listing.avg_rating, Decimal("4.50"))
+
+    def test_list_serializes_ratings_without_extra_queries(self):
+        self.add_review(4)
+        make_listing(title="Other")
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("listing-list"))
+        rows = {row["title"]: row for row in response.json()["results"]}
+        self.assertEqual(rows["Test Listing"]["avg_rating"], "4.00")
+        self.assertEqual(rows["Test Listing"]["rating_histogram"]["4"], 1)
+        self.assertEqual(rows["Other"]["review_count"], 0)
+
+    def test_recompute_repairs_drift(self):
+        self.add_review(1)
+        self.add_review(2)
+        Listing.objects.update(review_count=0, rating_sum=0, avg_rating=0, rating_count_1=0)
+        call_command("recompute_ratings", stdout=io.StringIO())
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.review_count, self.listing.avg_rating), (2, Decimal("1.50")))
+        self.assertEqual(self.listing.rating_count_1, 1)
+
+    def test_deferred_reviews_load_lazily_and_still_move_aggregates(self):
+        self.add_review(5)
+        self.add_review(3)
+        with self.assertNumQueries(1):
+            reviews = list(Review.objects.only("pk", "reviewer_name").order_by("pk"))
+        reviews[1].rating = 1
+        reviews[1].save()
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.rating_sum, self.listing.rating_count_3), (6, 0))
+        Review.objects.defer("rating").get(pk=reviews[0].pk).delete()
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.review_count, self.listing.avg_rating), (1, Decimal("1.00")))
+
+    def test_recompute_rounds_like_the_incremental_path(self):
+        for rating in [1] * 7 + [2]:
+            self.add_review(rating)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.avg_rating, Decimal("1.13"))  # 1.125 rounded half-up
+        self.assertEqual(ratings.recompute_ratings(), 0)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.avg_rating, Decimal("1.13"))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        stamp = timezone.now()
+        for n in range(25):
+            make_listing(title=f"L{n:02d}")
+        # Several rows share a created_at so the id tie-breaker is exercised
+        Listing.objects.filter(title__in=["L10", "L11", "L12"]).update(created_at=stamp)
+
+    def test_walks_every_row_once_without_counting(self):
+        url = reverse("listing-list") + "?pagination=cursor"
+        seen = []
+        while url:
+            with self.assertNumQueries(1):
+                body = self.client.get(url).json()
+            self.assertNotIn("count", body)
+            seen.extend(row["id"] for row in body["results"])
+            url = body["next"]
+        expected = list(Listing.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_number_pagination_remains_default(self):
+        body = self.client.get(reverse("booking-list")).json()
+        self.assertEqual(body["count"], 0)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse("listing-list"), {"cursor": "bogus"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingFilteringTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cheap = make_listing(
+            title="Cheap", location="Addis Ababa", price_per_night=Decimal("40.00"), max_guests=2
+        )
+        self.mid = make_listing(
+            title="Mid", location="Addis Ababa", price_per_night=Decimal("90.00"), max_guests=4
+        )
+        self.dear = make_listing(
+            title="Dear", location="Addis Ababa", price_per_night=Decimal("200.00"), max_guests=6
+        )
+        self.other = make_listing(
+            title="Other", location="Nairobi", price_per_night=Decimal("90.00"), max_guests=4
+        )
+        Listing.objects.filter(pk=self.mid.pk).update(avg_rating=Decimal("4.50"))
+        Listing.objects.filter(pk=self.cheap.pk).update(avg_rating=Decimal("3.00"))
+        self.url = reverse("listing-list")
+
+    def ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_filters_combine(self):
+        self.assertEqual(
+            self.ids(location="Addis Ababa", ordering="price"),
+            [self.cheap.id, self.mid.id, self.dear.id],
+        )
+        self.assertEqual(
+            self.ids(min_price="50", max_price="100", ordering="price"),
+            [self.mid.id, self.other.id],
+        )
+        self.assertEqual(
+            self.ids(location="Addis Ababa", guests=4, ordering="-price"),
+            [self.dear.id, self.mid.id],
+        )
+        self.assertEqual(
+            self.ids(location="Addis Ababa", min_price=90, max_price=90, guests=3), [self.mid.id]
+        )
+
+    def test_sorts(self):
+        self.assertEqual(self.ids(ordering="-rating")[:2], [self.mid.id, self.cheap.id])
+        self.assertEqual(
+            self.ids(ordering="created"), [self.cheap.id, self.mid.id, self.dear.id, self.other.id]
+        )
+        self.assertEqual(self.ids(), [self.other.id, self.dear.id, self.mid.id, self.cheap.id])
+        # Equal prices fall back to id
+        self.assertEqual(self.ids(ordering="-price")[1:3], [self.other.id, self.mid.id])
+
+    def test_keyset_pages_keep_filters(self):
+        self.assertEqual(
+            self.ids(pagination="cursor", location="Addis Ababa", guests=3),
+            [self.dear.id, self.mid.id],
+        )
+        response = self.client.get(self.url, {"pagination": "cursor", "ordering": "price"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_bad_parameters(self):
+        for params in (
+            {"min_price": "cheap"},
+            {"max_price": "-1"},
+            {"min_price": "NaN"},
+            {"min_price": "100", "max_price": "50"},
+            {"guests": "0"},
+            {"guests": "many"},
+            {"ordering": "title"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_every_combination_is_index_backed(self):
+        filters = {
+            "location": {"location": "Addis Ababa"},
+            "price": {"min_price": "50", "max_price": "150"},
+            "guests": {"guests": "3"},
+        }
+        for n in range(len(filters) + 1):
+            for names in combinations(filters, n):
+                for sort in filtering.SORT_COLUMNS:
+                    for ordering in (sort, f"-{sort}"):
+                        params = {"ordering": ordering}
+                        for name in names:
+                            params.update(filters[name])
+                        queryset = filtering.filter_listings(Listing.objects.all(), params)
+                        plan = queryset.values(*listing_rows.columns)[:20].explain()
+                        table_steps = [
+                            line for line in plan.splitlines() if "listings_listing" in line
+                        ]
+                        self.assertTrue(table_steps, plan)
+                        for step in table_steps:
+                            self.assertIn("USING", step, f"{params}: {plan}")
+
+
+class ApiRegressionBenchmarkTest(TestCase):
+    def test_query_counts_stay_within_committed_baseline(self):
+        path = Path(benchmarks.__file__).with_name("perf_baseline.json")
+        baseline = benchmarks.load_baseline(path)["api-regression"]
+        result = benchmarks.SCENARIOS["api-regression"](rounds=1, dataset_listings=20)
+
+        self.assertEqual(set(result), set(baseline))
+        over_budget = {
+            route: (figures["queries"], baseline[route]["queries"])
+            for route, figures in result.items()
+            if figures["queries"] > baseline[route]["queries"]
+        }
+        self.assertEqual(over_budget, {})
+        # The scenario rolls its dataset back
+        self.assertFalse(Listing.objects.exists())
+
+    def test_compare_to_baseline(self):
+        baseline = {"route": {"queries": 2, "p50_ms": 10.0, "p95_ms": 20.0, "alloc_peak_kb": 50.0}}
+        result = {"route": {"queries": 3, "p50_ms": 14.0, "p95_ms": 90.0, "alloc_peak_kb": 120.0}}
+        self.assertEqual(
+            benchmarks.compare_to_baseline(result, baseline, tolerance=0.5),
+            ["route.queries: 3 > 2", "route.alloc_peak_kb: 120.0 > 50.0 (+50% allowed)"],
+        )
+
+
+class ListingSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.beach = make_listing(
+            title="Beach House", location="Mombasa", description="Steps from the beach."
+        )
+        self.cabin = make_listing(
+            title="Mountain Cabin", location="Nanyuki", description="Quiet, far from any beach."
+        )
+        self.flat = make_listing(
+            title="City Flat", location="Nairobi", description="Central and quiet."
+        )
+        self.url = reverse("listing-search")
+
+    def search(self, q):
+        return self.client.get(self.url, {"q": q}).json()
+
+    def test_ranks_title_matches_first(self):
+        body = self.search("beach")
+        self.assertEqual(body["count"], 2)
+        self.assertEqual([row["id"] for row in body["results"]], [self.beach.id, self.cabin.id])
+        self.assertGreater(body["results"][0]["score"], body["results"][1]["score"])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.flat.description = "Near the beach"
+        self.flat.save()
+        self.assertEqual(self.search("beach")["count"], 3)
+        self.beach.delete()
+        self.assertEqual(self.search("mombasa")["count"], 0)
+        self.assertEqual(self.search("beach")["count"], 2)
+
+    def test_rebuild_matches_incremental_index(self):
+        before = self.search("quiet beach")["results"]
+        ListingTerm.objects.all().delete()
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.search("quiet beach")["results"], before)
+
+    def test_common_terms_only_count_without_rarer_ones(self):
+        body = self.search("quiet mombasa")
+        self.assertEqual([row["id"] for row in body["results"]], [self.beach.id])
+
+    def test_requires_query(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.search("the of")["count"], 0)
+
+
+class NearbyListingsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.centre = make_listing(title="Bole Flat", latitude=9.0300, longitude=38.7400)
+        self.close = make_listing(title="Kazanchis Room", latitude=9.0150, longitude=38.7620)
+        self.far = make_listing(title="Sebeta House", latitude=8.9200, longitude=38.6200)
+        make_listing(title="Nairobi Loft", latitude=-1.2864, longitude=36.8172)
+        make_listing(title="Somewhere")
+        self.url = reverse("listing-nearby")
+
+    def nearby(self, **params):
+        return self.client.get(self.url, {"lat": 9.03, "lng": 38.74, **params})
+
+    def test_sorted_by_distance_within_radius(self):
+        with self.assertNumQueries(2):
+            body = self.nearby(radius_km=10).json()
+        self.assertEqual([row["id"] for row in body["results"]], [self.centre.id, self.close.id])
+        self.assertEqual(body["results"][0]["distance_km"], 0)
+        self.assertAlmostEqual(body["results"][1]["distance_km"], 2.94, places=2)
+
+        body = self.nearby(radius_km=25).json()
+        self.assertEqual(
+            [row["id"] for row in body["results"]], [self.centre.id, self.close.id, self.far.id]
+        )
+
+    def test_candidates_come_from_geohash_cells(self):
+        cells = geo.covering_cells(9.03, 38.74, 10)
+        self.assertTrue(all(len(cell) == len(cells[0]) for cell in cells))
+        self.assertIn(self.centre.geohash[:len(cells[0])], cells)
+        candidates = Listing.objects.filter(geo.in_cells(cells)).order_by()
+        plan = candidates.values_list("pk", "latitude", "longitude").explain()
+        self.assertIn("listing_geohash_idx", plan)
+
+    def test_geohash_follows_coordinates(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.far.latitude, self.far.longitude = 9.0310, 38.7410
+        self.far.save(update_fields=["latitude", "longitude"])
+        self.far.refresh_from_db()
+        self.assertEqual(self.far.geohash, geo.encode(9.0310, 38.7410))
+        self.assertEqual(len(self.nearby(radius_km=1).json()["results"]), 2)
+
+        response = self.client.patch(
+            reverse("listing-detail", args=[self.far.id]), {"latitude": None},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"lat": 9.03}).status_code, 400)
+        self.assertEqual(self.nearby(radius_km="near").status_code, 400)
+        self.assertEqual(self.nearby(radius_km=geo.MAX_RADIUS_KM + 1).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"lat": 91, "lng": 0}).status_code, 400)
+
+
+class ListingHttpCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing()
+        self.detail = reverse("listing-detail", args=[self.listing.id])
+
+    def test_detail_revalidates_with_etag(self):
+        response = self.client.get(self.detail)
+        self.assertEqual(response["Cache-Control"], "public, max-age=0, must-revalidate")
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Review.objects.create(listing=self.listing, reviewer_name="Ann", rating=5)
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_etag_follows_page_contents(self):
+        url = reverse("listing-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        make_listing(title="Another")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(LISTING_RESPONSE_CACHE_TIMEOUT=60)
+    def test_response_cache_is_invalidated_by_writes(self):
+        url = reverse("listing-bookings", args=[self.listing.id])
+        self.assertEqual(self.client.get(url).json(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), [])
+        response = self.client.get(url)
+        self.assertEqual(response["Cache-Control"], "private, max-age=0, must-revalidate")
+
+        make_booking(self.listing, date(2025, 11, 1), date(2025, 11, 3))
+        self.assertEqual(len(self.client.get(url).json()), 1)
+
+        self.client.get(self.detail)
+        Listing.objects.get(pk=self.listing.pk).save()
+        with self.assertNumQueries(1):
+            self.client.get(self.detail)
+
+
+class FastPathSerializationTest(TestCase):
+    def setUp(self):
+        self.listing = make_listing(
+            title="Caf\u00e9 \u2028 loft", price_per_night=Decimal("99.999")
+        )
+        Review.objects.create(listing=self.listing, reviewer_name="Ann", rating=4)
+        make_booking(self.listing, date(2025, 11, 1), date(2025, 11, 3))
+        make_booking(
+            self.listing, date(2025, 12, 1), date(2025, 12, 4), status=Booking.Status.CANCELLED
+        )
+
+    def test_values_rows_match_model_serializer(self):
+        cases = (
+            (Listing, ListingSerializer, listing_rows),
+            (Booking, BookingSerializer, booking_rows),
+        )
+        for model, serializer_class, fast in cases:
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.order_by("pk")
+                expected = serializer_class(queryset, many=True).data
+                self.assertEqual(fast.serialize(queryset.values(*fast.columns)), expected)
+
+    def test_list_endpoints_use_values(self):
+        for url in (reverse("listing-list"), reverse("booking-list") + "?pagination=cursor"):
+            with self.subTest(url=url), self.assertNumQueries(1 if "cursor" in url else 2):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        data = self.client.get(reverse("listing-list")).json()["results"][0]
+        self.assertEqual(data["rating_histogram"]["4"], 1)
+        self.assertEqual(data["price_per_night"], "100.00")
+
+    @skipUnless(orjson is not None, "orjson is not installed")
+    def test_orjson_renderer_is_byte_identical(self):
+        payloads = [
+            BookingSerializer(Booking.objects.all(), many=True).data,
+            {"results": ListingSerializer(Listing.objects.all(), many=True).data, "score": 1.2345},
+            {"at": timezone.now(), "amount": Decimal("1.50"), 1: None, "text": "\u2029<>"},
+        ]
+        for data in payloads:
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        context = {"indent": 4}
+        self.assertEqual(
+            ORJSONRenderer().render(payloads[0], renderer_context=context),
+            JSONRenderer().render(payloads[0], renderer_context=context),
+        )
+
+
+class BookingExportTest(TestCase):
+    def setUp(self):
+        self.listing = make_listing()
+        self.bookings = [
+            make_booking(
+                self.listing,
+                date(2025, 11, 1) + timedelta(days=3 * i),
+                date(2025, 11, 3) + timedelta(days=3 * i),
+            )
+            for i in range(3)
+        ]
+        Payment.objects.create(
+            booking=self.bookings[0], booking_reference="BK-EXPORT-1", amount=Decimal("200.00"),
+            status=Payment.Status.COMPLETED,
+        )
+        self.url = reverse("booking-export")
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_booking_with_its_payment(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row["booking_id"] for row in rows], [b.id for b in self.bookings])
+        self.assertEqual(rows[0]["booking_reference"], "BK-EXPORT-1")
+        self.assertEqual(rows[0]["payment_amount"], "200.00")
+        self.assertEqual(rows[0]["listing_title"], self.listing.title)
+        self.assertIsNone(rows[1]["payment_status"])
+
+    def test_csv_and_since(self):
+        old = timezone.now() - timedelta(days=10)
+        Booking.objects.filter(pk=self.bookings[0].pk).update(created_at=old)
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        lines = self.read(self.client.get(self.url, {"format": "csv", "since": since})).splitlines()
+        self.assertTrue(lines[0].startswith("booking_id,listing_id,listing_title"))
+        ids = [int(line.split(",")[0]) for line in lines[1:]]
+        self.assertEqual(ids, [b.id for b in self.bookings[1:]])
+
+        response = self.client.get(self.url, {"since": "last week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reads_in_chunks(self):
+        from .exports import stream_export
+
+        with self.assertNumQueries(2):
+            chunks = list(stream_export("ndjson", chunk_size=2))
+        self.assertEqual([chunk.count(b"\n") for chunk in chunks], [2, 1])
+        # A full last chunk takes one more (empty) query to detect the end
+        with self.assertNumQueries(4):
+            chunks = list(stream_export("csv", chunk_size=1))
+        self.assertEqual(len(chunks), 4)  # header, then one row per chunk
+
+    def test_command_writes_export(self):
+        out = io.StringIO()
+        call_command("export_bookings", "--format", "csv", "--chunk-size", "2", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+@override_settings(LISTING_STATS_REFRESH_WINDOW_MS=0)
+@mock.patch.object(
+    tasks.refresh_listing_stats,
+    "apply_async",
+    lambda *args, **kwargs: tasks.refresh_listing_stats.apply(),
+)
+class ListingStatsTest(TestCase):
+    def setUp(self):
+        self.listing = make_listing()
+        self.url = reverse("listing-stats", args=[self.listing.id])
+
+    def book(self, start, end, **overrides):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_booking(self.listing, start, end, **overrides)
+
+    def snapshot(self):
+        rows = ListingDailyStats.objects.order_by("date")
+        return list(rows.values("date", "revenue", *stats.COUNT_FIELDS))
+
+    def test_rollups_follow_booking_changes(self):
+        confirmed = self.book(
+            date(2025, 7, 1), date(2025, 7, 4),
+            total_price=Decimal("100.00"), status=Booking.Status.CONFIRMED,
+        )
+        pending = self.book(date(2025, 7, 4), date(2025, 7, 6))
+
+        body = self.client.get(self.url, {"from": "2025-07-01", "to": "2025-07-10"}).json()
+        self.assertEqual(body["days"], 10)
+        self.assertEqual(
+            (body["nights_booked"], body["confirmed_nights"], body["pending_nights"]), (5, 3, 2)
+        )
+        self.assertEqual(body["occupancy"], 0.5)
+        self.assertEqual(body["revenue"], "100.00")
+        self.assertEqual([day["revenue"] for day in body["daily"][:3]], ["33.33", "33.33", "33.34"])
+
+        pending.status = Booking.Status.CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        confirmed.start_date, confirmed.end_date = date(2025, 8, 1), date(2025, 8, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmed.save()
+
+        body = self.client.get(self.url, {"from": "2025-07-01", "to": "2025-07-31"}).json()
+        self.assertEqual(
+            (body["nights_booked"], body["cancelled_nights"], body["revenue"]), (0, 2, "0.00")
+        )
+        body = self.client.get(self.url, {"from": "2025-08-01", "to": "2025-08-31"}).json()
+        self.assertEqual((body["confirmed_nights"], body["revenue"]), (2, "100.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmed.delete()
+        self.assertFalse(ListingDailyStats.objects.filter(date__month=8).exists())
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        self.book(
+            date(2025, 7, 1), date(2025, 7, 8),
+            total_price=Decimal("700.01"), status=Booking.Status.CONFIRMED,
+        )
+        self.book(date(2025, 7, 8), date(2025, 7, 9))
+        self.book(date(2025, 7, 3), date(2025, 7, 5), status=Booking.Status.CANCELLED)
+        incremental = self.snapshot()
+        self.assertEqual(len(incremental), 8)
+
+        ListingDailyStats.objects.all().delete()
+        call_command("rebuild_listing_stats", stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_range_validation(self):
+        self.assertEqual(self.client.get(self.url).json()["days"], 30)
+        for params in (
+            {"from": "July"},
+            {"from": "2025-07-02", "to": "2025-07-01"},
+            {"from": "2024-01-01", "to": "2025-12-31"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.assertEqual(self.client.get(reverse("listing-stats", args=[999999])).status_code, 404)
+
+    def test_queued_spans_survive_a_lost_task(self):
+        with mock.patch.object(tasks.refresh_listing_stats, "apply_async") as queued:
+            self.book(date(2025, 7, 1), date(2025, 7, 3))
+            self.book(date(2025, 7, 3), date(2025, 7, 5))
+        queued.assert_called()
+        self.assertEqual(ListingStatsRefresh.objects.count(), 2)
+        self.assertFalse(ListingDailyStats.objects.exists())
+
+        # The sweep picks them up, adjacent spans merged into one refresh
+        with mock.patch.object(stats, "refresh_stats", wraps=stats.refresh_stats) as refresh:
+            self.assertEqual(tasks.refresh_listing_stats(), 4)
+        refresh.assert_called_once_with(self.listing.id, date(2025, 7, 1), date(2025, 7, 5))
+        self.assertFalse(ListingStatsRefresh.objects.exists())
+
+    def test_failed_refresh_keeps_spans_queued(self):
+        with mock.patch.object(tasks.refresh_listing_stats, "apply_async"):
+            self.book(date(2025, 7, 1), date(2025, 7, 3))
+        with mock.patch.object(stats, "refresh_stats", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                tasks.refresh_listing_stats()
+        self.assertEqual(ListingStatsRefresh.objects.count(), 1)
+
+    def test_rolled_back_write_queues_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                make_booking(self.listing, date(2025, 7, 1), date(2025, 7, 3))
+                raise RuntimeError
+        self.assertFalse(ListingStatsRefresh.objects.exists())
+
+
+class PricingTest(TestCase):
+    def setUp(self):
+        today = date.today()
+        self.monday = today + timedelta(days=14 - today.weekday())
+        self.listing = make_listing()
+        self.rules = [
+            PricingRule.objects.create(
+                listing=self.listing, kind=PricingRule.Kind.SEASON, multiplier=Decimal("1.5"),
+                start_date=self.monday + timedelta(days=7),
+                end_date=self.monday + timedelta(days=14),
+            ),
+            PricingRule.objects.create(
+                listing=self.listing, kind=PricingRule.Kind.WEEKEND, multiplier=Decimal("1.2")
+            ),
+            PricingRule.objects.create(
+                listing=self.listing, kind=PricingRule.Kind.LENGTH_OF_STAY,
+                multiplier=Decimal("0.9"), min_nights=7,
+            ),
+        ]
+
+    def quote(self, start_offset, end_offset, listing=None):
+        listing = listing or Listing.objects.get(pk=self.listing.pk)
+        return pricing.quote(
+            listing,
+            self.monday + timedelta(days=start_offset),
+            self.monday + timedelta(days=end_offset),
+        )
+
+    def test_calendar_holds_only_adjusted_nights(self):
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertEqual((listing.rates_from, listing.stay_tiers), (date.today(), [[7, "0.900"]]))
+        week = ListingRate.objects.filter(
+            listing=listing, date__gte=self.monday, date__lt=self.monday + timedelta(days=14)
+        )
+        self.assertEqual(
+            {(rate.date - self.monday).days: rate.rate for rate in week},
+            {4: Decimal("120.00"), 5: Decimal("120.00"), 7: Decimal("150.00"),
+             8: Decimal("150.00"), 9: Decimal("150.00"), 10: Decimal("150.00"),
+             11: Decimal("180.00"), 12: Decimal("180.00"), 13: Decimal("150.00")},
+        )
+
+    def test_quotes_sum_the_calendar_in_one_query(self):
+        listing = Listing.objects.get(pk=self.listing.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.quote(0, 3, listing)["total_price"], Decimal("300.00"))
+        with self.assertNumQueries(1):
+            week = self.quote(0, 7, listing)
+        self.assertEqual(
+            (week["subtotal"], week["total_price"]), (Decimal("740.00"), Decimal("666.00"))
+        )
+        self.assertEqual(self.quote(5, 9)["total_price"], Decimal("520.00"))
+
+    def test_nights_outside_the_window_are_priced_from_the_rules(self):
+        past_monday = self.monday - timedelta(weeks=(date.today() - date(2025, 1, 1)).days // 7 + 1)
+        listing = Listing.objects.get(pk=self.listing.pk)
+        past_week = pricing.quote(listing, past_monday, past_monday + timedelta(days=7))
+        self.assertEqual(past_week["total_price"], Decimal("666.00"))
+        stays = [
+            (listing, past_monday, past_monday + timedelta(days=3)),
+            (listing, self.monday, self.monday + timedelta(days=14)),
+        ]
+        expected = [pricing.quote(*stay)["total_price"] for stay in stays]
+        with self.assertNumQueries(2):
+            self.assertEqual([q["total_price"] for q in pricing.quote_many(stays)], expected)
+
+    def test_calendar_follows_rule_and_price_changes(self):
+        self.listing.price_per_night = Decimal("200.00")
+        self.listing.save()
+        self.assertEqual(self.quote(0, 3)["total_price"], Decimal("600.00"))
+        self.assertEqual(self.quote(4, 5)["total_price"], Decimal("240.00"))
+        for rule in self.rules:
+            rule.delete()
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertIsNone(listing.rates_until)
+        self.assertFalse(ListingRate.objects.filter(listing=listing).exists())
+        with self.assertNumQueries(0):
+            week = pricing.quote(listing, self.monday, self.monday + timedelta(days=7))
+        self.assertEqual(week["total_price"], Decimal("1400.00"))
+
+    def test_bookings_are_priced_server_side(self):
+        body = {
+            "listing": self.listing.id, "guest_name": "Guest", "guest_email": "guest@example.com",
+            "start_date": self.monday.isoformat(),
+            "end_date": (self.monday + timedelta(days=7)).isoformat(),
+            "total_price": "1.00",
+        }
+        async_initiation = self.settings(CHAPA_ASYNC_INITIATION=True)
+        async_initiation.enable()
+        self.addCleanup(async_initiation.disable)
+        initiation = mock.patch.object(tasks.initiate_payment_task, "delay")
+        initiation.start()
+        self.addCleanup(initiation.stop)
+
+        response = self.client.post(reverse("booking-list"), body, content_type="application/json")
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()["booking"]["total_price"], "666.00")
+        booking_id = response.json()["booking"]["id"]
+
+        # Reprice the listing; an edit that keeps the stay keeps its price
+        self.listing.price_per_night = Decimal("50.00")
+        self.listing.save()
+        url = reverse("booking-detail", args=[booking_id])
+        self.client.patch(url, {"guest_name": "Renamed"}, content_type="application/json")
+        self.assertEqual(Booking.objects.get(pk=booking_id).total_price, Decimal("666.00"))
+        self.client.patch(
+            url, {"end_date": (self.monday + timedelta(days=3)).isoformat()},
+            content_type="application/json",
+        )
+        self.assertEqual(Booking.objects.get(pk=booking_id).total_price, Decimal("150.00"))
+
+        bulk_body = [{**body, "start_date": (self.monday + timedelta(days=7)).isoformat(),
+                      "end_date": (self.monday + timedelta(days=9)).isoformat()}]
+        response = self.client.post(
+            reverse("booking-bulk"), bulk_body, content_type="application/json"
+        )
+        self.assertEqual(response.json()["results"][0]["booking"]["total_price"], "150.00")
+
+    def test_quote_endpoint(self):
+        url = reverse("listing-quote", args=[self.listing.id])
+        start = self.monday
+        response = self.client.get(
+            url, {"start": start.isoformat(), "end": (start + timedelta(days=7)).isoformat()}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(
+            (
+                body["nights"], body["subtotal"],
+                body["length_of_stay_multiplier"], body["total_price"],
+            ),
+            (7, "740.00", "0.900", "666.00"),
+        )
+        for params in (
+            {"start": start.isoformat()},
+            {"start": start.isoformat(), "end": start.isoformat()},
+            {"start": "2025-01-01", "end": "2026-06-01"},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+@mock.patch.object(routers, "replica_configured", return_value=True)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_use_primary_outside_replica_blocks(self, _):
+        self.assertEqual(self.router.db_for_read(Listing), "default")
+
+    def test_reads_stick_to_primary_after_a_write(self, _):
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Listing), "replica")
+            self.assertEqual(self.router.db_for_write(Booking), "default")
+            self.assertEqual(self.router.db_for_read(Listing), "default")
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Listing), "replica")
+
+    def test_unconfigured_replica_falls_back_to_primary(self, configured):
+        configured.return_value = False
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Listing), "default")
+
+    @override_settings(LISTING_RESPONSE_CACHE_TIMEOUT=60, LISTING_REPLICA_LAG_SECONDS=5)
+    def test_replica_reads_are_not_cached_right_after_a_write(self, _):
+        cache.clear()
+        request = RequestFactory().get(reverse("listing-list"))
+        render = mock.Mock(side_effect=lambda: Response({"count": render.call_count}))
+
+        def read():
+            with routers.replica_reads():
+                return http_cache.cached_read(request, "list", lambda: (None, None), render).data
+
+        with mock.patch.object(http_cache, "replica_configured", return_value=True):
+            http_cache.invalidate_listing_responses()
+        self.assertEqual([read(), read()], [{"count": 1}, {"count": 2}])
+        # Once the replica has had time to catch up its responses are cached again
+        cache.delete(http_cache.RECENT_WRITE_CACHE_KEY)
+        self.assertEqual([read(), read()], [{"count": 3}, {"count": 3}])
+
+
+SEPARATE_REPLICA = (
+    "replica" in settings.DATABASES
+    and not settings.DATABASES["replica"].get("TEST", {}).get("MIRROR")
+)
+
+
+@skipUnless(
+    SEPARATE_REPLICA,
+    "needs a separate replica database, e.g. REPLICA_DATABASE_URL=sqlite:////tmp/replica.sqlite3",
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {"default", "replica"} if SEPARATE_REPLICA else {"default"}
+
+    def test_listing_reads_come_from_the_replica(self):
+        listing = make_listing(title="Primary only")
+        make_booking(listing, date(2025, 12, 1), date(2025, 12, 3))
+        self.assertEqual(self.client.get(reverse("listing-list")).json()["count"], 0)
+        response = self.client.get(reverse("listing-detail", args=[listing.id]))
+        self.assertEqual(response.status_code, 404)
+        # Bookings are not routed
+        self.assertEqual(self.client.get(reverse("booking-list")).json()["count"], 1)
+
+        Listing.objects.using("replica").create(
+            title="Replicated", description="", location="X", price_per_night=Decimal("1.00"),
+            max_guests=1,
+        )
+        results = self.client.get(reverse("listing-list")).json()["results"]
+        self.assertEqual(results[0]["title"], "Replicated")
+
+    @override_settings(LISTING_RESPONSE_CACHE_TIMEOUT=60)
+    def test_lagging_replica_reads_are_not_cached(self):
+        cache.clear()
+        self.assertEqual(self.client.get(reverse("listing-list")).json()["count"], 0)
+        # Written to the primary only: the replica lags behind the new cache version
+        listing = make_listing(title="Not replicated yet")
+        self.assertEqual(self.client.get(reverse("listing-list")).json()["count"], 0)
+        Listing.objects.using("replica").bulk_create([listing])
+        self.assertEqual(self.client.get(reverse("listing-list")).json()["count"], 1)
@@ -0,0 +1,121 @@
+"""
+Token-bucket throttles for the payment endpoints.
+
+A bucket of ``burst/period`` (a DRF rate such as ``"10/min"``) holds up to
+``burst`` tokens and refills at ``burst`` tokens per ``period``. Buckets
+live in the default cache as two keys: the time the bucket was last
+rebased and the number of tokens taken since. Taking a token is a
+cache.incr, which is atomic in Redis and memcached, so concurrent
+requests never take the same token; the rebase, which rolls refilled
+tokens into the counter, is a plain set and happens once the bucket is
+full again, or a period after the last one. With the default locmem cache
+the buckets are per process; set CACHE_URL to share them across workers.
+"""
+import math
+
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle with a token bucket instead of a request history.
+
+    A throttled request takes no token, and wait() reports the seconds
+    until the next token, which DRF sends as Retry-After with the 429.
+    """
+    cache = default_cache
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def get_rate(self):
+        # Read at request time rather than import time, so rate changes apply
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.wait_seconds = self.take_token(self.key, self.timer())
+        return self.wait_seconds is None
+
+    def take_token(self, key, now):
+        """
+        Take one token from the bucket at ``key``.
+
+        Returns None when a token was taken, else the seconds until one
+        is available.
+        """
+        burst, period = self.num_requests, self.duration
+        rate = burst / period
+        anchor_key, count_key = f"{key}:anchor", f"{key}:taken"
+        # Keys outlive the bucket refilling completely, after which a fresh bucket is equivalent
+        ttl = math.ceil(2 * period)
+
+        stored = self.cache.get_many([anchor_key, count_key])
+        anchor, taken = stored.get(anchor_key), stored.get(count_key) or 0
+        # A full bucket is rebased too: refill beyond burst must not carry over
+        if anchor is None or now - anchor >= period or taken <= rate * (now - anchor):
+            # Rebase: fold tokens refilled since the anchor into the counter
+            if anchor is None:
+                taken = 0
+            else:
+                taken = max(0, math.ceil(taken - rate * (now - anchor)))
+            self.cache.set_many({anchor_key: now, count_key: taken}, ttl)
+            anchor = now
+
+        try:
+            taken = self.cache.incr(count_key)
+        except ValueError:
+            # Expired or evicted between the rebase and here
+            self.cache.add(count_key, 0, ttl)
+            taken = self.cache.incr(count_key)
+
+        available = burst + rate * (now - anchor)
+        if taken <= available:
+            return None
+        try:
+            self.cache.decr(count_key)
+        except ValueError:
+            pass
+        return (taken - available) / rate
+
+    def wait(self):
+        return getattr(self, "wait_seconds", None)
+
+
+class PaymentRateThrottle(TokenBucketThrottle):
+    """Per client IP across initiate_payment and verify_payment."""
+    scope = "payments"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
+
+
+class PaymentTargetThrottle(TokenBucketThrottle):
+    """
+    Per booking (initiate_payment) or tx_ref (verify_payment), whoever asks.
+
+    Stops a retry loop on one payment from flooding Chapa even when it
+    comes from many addresses. Requests naming neither pass through.
+    """
+    scope = "payment-target"
+
+    def get_cache_key(self, request, view):
+        booking_id = view.kwargs.get("booking_id")
+        if booking_id is not None:
+            ident = f"booking:{booking_id}"
+        else:
+            tx_ref = request.query_params.get("tx_ref") or (
+                request.data.get("tx_ref") if hasattr(request.data, "get") else None
+            )
+            if not tx_ref:
+                return None
+            ident = f"tx_ref:{tx_ref}"
+        return self.cache_format % {"scope": self.scope, "ident": ident}
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ListingViewSet, BookingViewSet, verify_payment, initiate_payment
+from . import async_views
+from .views import ListingViewSet, BookingViewSet, verify_payment, initiate_payment, payment_session
 
 # Create a router and register our viewsets
 router = DefaultRouter()
@@ -12,6 +14,22 @@ urlpatterns = [
     path('', include(router.urls)),
     # Payment endpoints
     path('payments/verify/', verify_payment, name='verify-payment'),
+    path('payments/<str:booking_reference>/', payment_session, name='payment-session'),
     path('bookings/<int:booking_id>/initiate-payment/', initiate_payment, name='initiate-payment'),
 ]
 
+# Async variants (listings.async_views), matched ahead of the sync views under
+# the same names, so reverse() and the metrics route labels don't change
+async_urlpatterns = [
+    path('listings/', async_views.listing_list, name='listing-list'),
+    path('listings/<int:pk>/', async_views.listing_detail, name='listing-detail'),
+    path('payments/verify/', async_views.verify_payment, name='verify-payment'),
+    path(
+        'bookings/<int:booking_id>/initiate-payment/',
+        async_views.initiate_payment,
+        name='initiate-payment',
+    ),
+] + urlpatterns
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns
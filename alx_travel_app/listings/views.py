@@ -1,19 +1,56 @@
 import logging
 import uuid
+from datetime import date, timedelta
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, throttle_classes
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.dateparse import parse_date
 from .models import Listing, Booking, Payment
-from .serializers import ListingSerializer, BookingSerializer
-from .payment_utils import initiate_chapa_payment, verify_chapa_payment
-from .tasks import send_booking_confirmation_email
+from .http_cache import cached_read, object_validators, page_validators
+from .pagination import OptInKeysetPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .routers import replica_reads
+from .search import search_listings
+from .geo import MAX_RADIUS_KM, nearby_listings
+from .pricing import MAX_QUOTE_NIGHTS, quote
+from .stats import MAX_STATS_DAYS, listing_stats
+from .serializers import (
+    ListingSerializer, BookingSerializer, PaymentSerializer, booking_rows, listing_rows,
+)
+from .payment_utils import FAILED_STATUSES, initiate_booking_payment, verify_chapa_payment_cached
+from .bulk_bookings import initiate_payments, insert_bookings, validate_bookings
+from .email_batching import queue_confirmation_email
+from .exports import parse_since, stream_export
+from .filtering import filter_listings
+from .tasks import initiate_payment_task
+from .throttling import PaymentRateThrottle, PaymentTargetThrottle
 
 logger = logging.getLogger(__name__)
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ReplicaReadsMixin:
+    """
+    Serve safe-method requests from the read replica, if one is configured.
+
+    Reads stay sticky to the primary for the rest of the request once it
+    writes anything (see listings.routers).
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ListingViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing listings.
     
@@ -24,9 +61,68 @@ class ListingViewSet(viewsets.ModelViewSet):
     - PUT /api/listings/{id}/ - Update a listing (full update)
     - PATCH /api/listings/{id}/ - Partially update a listing
     - DELETE /api/listings/{id}/ - Delete a listing
+
+    List endpoints accept ?pagination=cursor for keyset pagination.
+    GET /api/listings/ filters on location, min_price/max_price and guests
+    and sorts with ?ordering= (see listings.filtering).
+    GET /api/listings/search/?q= runs a ranked full-text search.
+    GET /api/listings/nearby/?lat=&lng=&radius_km= lists listings by distance.
+    GET /api/listings/{id}/stats/ reports occupancy and revenue.
+    List, retrieve and bookings reads send ETag/Cache-Control headers and
+    may be served from the response cache (see listings.http_cache).
+    All reads go to the read replica when one is configured.
     """
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
+    pagination_class = OptInKeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        List listings, answering If-None-Match/If-Modified-Since with 304.
+
+        Pages are read with .values() and serialized by listing_rows, which
+        skips model instantiation and DRF's per-field machinery. Filter and
+        ordering parameters are applied by listings.filtering.
+        """
+        try:
+            queryset = filter_listings(
+                self.filter_queryset(self.get_queryset()),
+                request.query_params,
+                keyset=self.paginator.wants_keyset(request),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.values(*listing_rows.columns)
+        page = None
+
+        def validators():
+            nonlocal page
+            page = self.paginate_queryset(queryset)
+            envelope = self.get_paginated_response([]).data
+            return page_validators(request, page, sorted(envelope.items()))
+
+        return cached_read(
+            request,
+            "list",
+            validators,
+            lambda: self.get_paginated_response(listing_rows.serialize(page)),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a listing; a matching ETag gets a 304 before serialization.
+        """
+        instance = None
+
+        def validators():
+            nonlocal instance
+            instance = self.get_object()
+            return object_validators(request, instance)
+
+        def render():
+            return Response(self.get_serializer(instance).data)
+
+        return cached_read(request, "retrieve", validators, render)
 
     @action(detail=True, methods=['get'])
     def bookings(self, request, pk=None):
@@ -34,10 +130,211 @@ class ListingViewSet(viewsets.ModelViewSet):
         Get all bookings for a specific listing.
         GET /api/listings/{id}/bookings/
         """
-        listing = self.get_object()
-        bookings = listing.bookings.all()
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        def render():
+            listing = self.get_object()
+            bookings = listing.bookings.all()
+            serializer = BookingSerializer(bookings, many=True)
+            return Response(serializer.data)
+
+        # Guest details: cacheable server-side, but never by shared HTTP caches
+        return cached_read(request, "bookings", lambda: (None, None), render, private=True)
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Occupancy and revenue of a listing over a date range.
+        GET /api/listings/{id}/stats/?from=YYYY-MM-DD&to=YYYY-MM-DD
+
+        Both bounds are inclusive; the range defaults to the 30 days up to
+        today and may span at most MAX_STATS_DAYS. Read from the daily
+        rollups (see listings.stats), so the cost depends on the range,
+        not on how many bookings the listing has.
+        """
+        listing = get_object_or_404(Listing.objects.only('pk'), pk=pk)
+        params = request.query_params
+        try:
+            end = parse_date(params['to']) if 'to' in params else date.today()
+            if 'from' in params:
+                start = parse_date(params['from'])
+            else:
+                start = end and end - timedelta(days=29)
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return Response(
+                {"error": "from and to must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if end < start:
+            return Response(
+                {"error": "to must not be before from"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if (end - start).days >= MAX_STATS_DAYS:
+            return Response(
+                {"error": f"The range may span at most {MAX_STATS_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(listing_stats(listing.pk, start, end))
+
+    @action(detail=True, methods=['get'])
+    def quote(self, request, pk=None):
+        """
+        Price a stay at a listing, as a booking for it would be priced.
+        GET /api/listings/{id}/quote/?start=YYYY-MM-DD&end=YYYY-MM-DD
+
+        end is the check-out day. Nightly rates come from the listing's
+        compiled rate calendar (see listings.pricing); stays may be at
+        most MAX_QUOTE_NIGHTS long.
+        """
+        listing = get_object_or_404(
+            Listing.objects.only(
+                'pk', 'price_per_night', 'rates_from', 'rates_until', 'stay_tiers'
+            ),
+            pk=pk,
+        )
+        try:
+            start = parse_date(request.query_params.get('start', ''))
+            end = parse_date(request.query_params.get('end', ''))
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return Response(
+                {"error": "start and end must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if end <= start:
+            return Response(
+                {"error": "end must be after start"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if (end - start).days > MAX_QUOTE_NIGHTS:
+            return Response(
+                {"error": f"A stay may be at most {MAX_QUOTE_NIGHTS} nights"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        price = quote(listing, start, end)
+        for field in ("subtotal", "length_of_stay_multiplier", "total_price"):
+            price[field] = f"{price[field]:f}"
+        return Response(price)
+
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        """
+        List listings that are free for a stay and fit the party size.
+        GET /api/listings/available/?start=YYYY-MM-DD&end=YYYY-MM-DD&guests=N
+
+        The overlap check runs as a NOT EXISTS subquery against the
+        (listing, start_date, end_date, status) booking index, so a search
+        is a single query regardless of how many bookings exist.
+        """
+        try:
+            start = parse_date(request.query_params.get('start', ''))
+            end = parse_date(request.query_params.get('end', ''))
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return Response(
+                {"error": "start and end must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if end <= start:
+            return Response(
+                {"error": "end must be after start"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            guests = int(request.query_params.get('guests', 1))
+        except (TypeError, ValueError):
+            guests = 0
+        if guests < 1:
+            return Response(
+                {"error": "guests must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        conflicts = Booking.objects.active().overlapping(start, end).filter(listing=OuterRef('pk'))
+        queryset = (
+            self.get_queryset()
+            .filter(max_guests__gte=guests)
+            .exclude(Exists(conflicts))
+            .values(*listing_rows.columns)
+        )
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(listing_rows.serialize(page))
+        return Response(listing_rows.serialize(queryset))
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Listings within a radius of a point, nearest first.
+        GET /api/listings/nearby/?lat=9.03&lng=38.74&radius_km=10
+
+        radius_km defaults to 10 and may be at most MAX_RADIUS_KM. Only
+        listings with coordinates are considered; candidates are pruned by
+        geohash cell before exact distances are computed (see
+        listings.geo). Results carry ``distance_km`` and are page-number
+        paginated.
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius_km = float(request.query_params.get('radius_km', 10))
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "lat and lng are required and lat, lng and radius_km must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response(
+                {"error": "lat must be within [-90, 90] and lng within [-180, 180]"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            return Response(
+                {"error": f"radius_km must be greater than 0 and at most {MAX_RADIUS_KM}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        paginator = PageNumberPagination()
+        rows = nearby_listings(lat, lng, radius_km, self.get_queryset())
+        page = paginator.paginate_queryset(rows, request, view=self)
+        listings = Listing.objects.in_bulk([row["listing_id"] for row in page])
+        nearest = [listings[row["listing_id"]] for row in page if row["listing_id"] in listings]
+        data = self.get_serializer(nearest, many=True).data
+        distances = {row["listing_id"]: row["distance_km"] for row in page}
+        for item in data:
+            item["distance_km"] = distances[item["id"]]
+        return paginator.get_paginated_response(data)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over title, location and description.
+        GET /api/listings/search/?q=beach+house
+
+        Results are ranked by BM25 relevance (best first, each carrying its
+        ``score``) and page-number paginated.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "q is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(search_listings(query), request, view=self)
+        listings = Listing.objects.in_bulk([row["listing_id"] for row in page])
+        ranked = [listings[row["listing_id"]] for row in page if row["listing_id"] in listings]
+        data = self.get_serializer(ranked, many=True).data
+        scores = {row["listing_id"]: round(row["score"], 4) for row in page}
+        for item in data:
+            item["score"] = scores[item["id"]]
+        return paginator.get_paginated_response(data)
 
 
 class BookingViewSet(viewsets.ModelViewSet):
@@ -51,9 +348,14 @@ class BookingViewSet(viewsets.ModelViewSet):
     - PUT /api/bookings/{id}/ - Update a booking (full update)
     - PATCH /api/bookings/{id}/ - Partially update a booking
     - DELETE /api/bookings/{id}/ - Delete a booking
+
+    The list endpoint accepts ?pagination=cursor for keyset pagination.
+    POST /api/bookings/bulk/ creates many bookings at once.
+    GET /api/bookings/export/ streams every booking with its payment.
     """
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    pagination_class = OptInKeysetPagination
 
     def get_queryset(self):
         """
@@ -66,52 +368,179 @@ class BookingViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(listing_id=listing_id)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        List bookings from .values() rows via the booking_rows fast path.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values(*booking_rows.columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(booking_rows.serialize(page))
+        return Response(booking_rows.serialize(queryset))
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create several bookings and initiate their payments.
+        POST /api/bookings/bulk/ with a JSON list of bookings
+
+        Items are validated and checked for double bookings in one pass,
+        and the valid ones are inserted together with their payments in a
+        single transaction; invalid items don't stop the others. Chapa
+        sessions are then initiated concurrently (CHAPA_BULK_CONCURRENCY),
+        or queued like single bookings with CHAPA_ASYNC_INITIATION.
+
+        Returns one result per item, in request order: ``created`` with
+        the booking and payment, or ``rejected`` with its errors. The
+        status is 201 (202 when initiation is queued) if anything was
+        created, else 400.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Expected a non-empty list of bookings"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.BULK_BOOKING_MAX_ITEMS:
+            return Response(
+                {"error": f"At most {settings.BULK_BOOKING_MAX_ITEMS} bookings per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        bookings, errors = validate_bookings(items)
+        payments, conflicts = insert_bookings(bookings)
+        errors.update(conflicts)
+
+        callback_url = request.build_absolute_uri("/api/payments/verify/")
+        created = sorted(payments)
+        if settings.CHAPA_ASYNC_INITIATION:
+            for index in created:
+                _queue_payment_initiation(payments[index], callback_url)
+            payment_data = {index: _payment_session(request, payments[index]) for index in created}
+        else:
+            chapa_results = initiate_payments(
+                [payments[index] for index in created],
+                callback_url,
+                settings.CHAPA_BULK_CONCURRENCY,
+            )
+            payment_data = {}
+            for index, result in zip(created, chapa_results):
+                payment = payments[index]
+                payment_data[index] = {
+                    "status": payment.status,
+                    "booking_reference": payment.booking_reference,
+                    "amount": str(payment.amount),
+                    "checkout_url": payment.checkout_url,
+                }
+                if not result.get("success"):
+                    payment_data[index]["error"] = result.get("error", "Failed to initiate payment")
+                if result.get("retry_after"):
+                    payment_data[index]["retry_after"] = result["retry_after"]
+
+        serialized = BookingSerializer([bookings[i] for i in created], many=True).data
+        booking_data = dict(zip(created, serialized))
+        results = []
+        for index in range(len(items)):
+            if index in payments:
+                results.append({
+                    "index": index,
+                    "status": "created",
+                    "booking": booking_data[index],
+                    "payment": payment_data[index],
+                })
+            else:
+                results.append({"index": index, "status": "rejected", "errors": errors[index]})
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif settings.CHAPA_ASYNC_INITIATION:
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {"created": len(created), "rejected": len(items) - len(created), "results": results},
+            status=response_status,
+        )
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream all bookings and their payments, oldest first.
+        GET /api/bookings/export/?format=ndjson|csv&since=YYYY-MM-DD
+
+        The format may also be negotiated with Accept (application/x-ndjson
+        or text/csv); NDJSON is the default. ``since`` (a date or ISO 8601
+        datetime) limits the export to bookings created from then on. Rows
+        are read and written in chunks (see listings.exports), so memory
+        use does not grow with the number of bookings.
+        """
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        export_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            stream_export(export_format, since or None),
+            content_type=f"{request.accepted_renderer.media_type}; charset=utf-8",
+        )
+        response['Content-Disposition'] = f'attachment; filename="bookings.{export_format}"'
+        return response
+
     def create(self, request, *args, **kwargs):
         """
         Create a booking and initiate payment.
+
+        With CHAPA_ASYNC_INITIATION enabled the booking and payment are
+        committed and 202 is returned immediately; the Chapa call runs in
+        initiate_payment_task and the checkout URL can be polled from
+        GET /api/payments/{booking_reference}/.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create booking
-        booking = serializer.save()
-        
-        # Generate booking reference
-        booking_reference = f"BK-{booking.id}-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Create payment record
-        payment = Payment.objects.create(
-            booking=booking,
-            booking_reference=booking_reference,
-            amount=booking.total_price,
-            status=Payment.Status.PENDING,
-        )
-        
-        # Prepare customer name for Chapa
-        guest_name_parts = booking.guest_name.split(maxsplit=1)
-        first_name = guest_name_parts[0] if guest_name_parts else booking.guest_name
-        last_name = guest_name_parts[1] if len(guest_name_parts) > 1 else ""
+        with transaction.atomic():
+            # Create booking
+            booking = serializer.save()
+
+            # Generate booking reference
+            booking_reference = f"BK-{booking.id}-{uuid.uuid4().hex[:8].upper()}"
+
+            # Create payment record
+            payment = Payment.objects.create(
+                booking=booking,
+                booking_reference=booking_reference,
+                amount=booking.total_price,
+                status=Payment.Status.PENDING,
+            )
         
         # Build callback URL
-        callback_url = request.build_absolute_uri(f"/api/payments/verify/")
+        callback_url = request.build_absolute_uri("/api/payments/verify/")
+
+        if settings.CHAPA_ASYNC_INITIATION:
+            _queue_payment_initiation(payment, callback_url)
+            session = _payment_session(request, payment)
+            return Response(
+                {
+                    "booking": serializer.data,
+                    "payment": session,
+                },
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": session["session_url"]},
+            )
         
         # Initiate payment with Chapa
-        payment_result = initiate_chapa_payment(
-            amount=float(booking.total_price),
-            email=booking.guest_email,
-            first_name=first_name,
-            last_name=last_name,
-            tx_ref=booking_reference,
-            callback_url=callback_url,
-        )
+        payment_result = initiate_booking_payment(payment, callback_url)
         
         if payment_result.get("success"):
-            # Update payment with transaction ID if available
             checkout_url = payment_result.get("checkout_url")
-            transaction_data = payment_result.get("data", {})
             
-            # Store checkout URL or transaction ID if available
+            # Store checkout URL so the payment session can be polled later
             if checkout_url:
+                payment.checkout_url = checkout_url
+                payment.save(update_fields=["checkout_url", "updated_at"])
                 logger.info(f"Payment initiated for booking {booking.id}, checkout URL: {checkout_url}")
             
             headers = self.get_success_headers(serializer.data)
@@ -133,6 +562,22 @@ class BookingViewSet(viewsets.ModelViewSet):
             error_msg = payment_result.get("error", "Failed to initiate payment")
             logger.error(f"Payment initiation failed for booking {booking.id}: {error_msg}")
             
+            if payment_result.get("retry_after"):
+                # Never reached Chapa: the booking stands and its payment stays
+                # PENDING, for the client to initiate once the gateway recovers
+                response = _gateway_unavailable_response(error_msg, payment_result["retry_after"])
+                response.data.update({
+                    "booking": serializer.data,
+                    "payment": {
+                        "status": payment.status,
+                        "booking_reference": payment.booking_reference,
+                        "initiate_url": request.build_absolute_uri(
+                            reverse('initiate-payment', args=[booking.id])
+                        ),
+                    },
+                })
+                return response
+
             # Update payment status to failed
             payment.status = Payment.Status.FAILED
             payment.save()
@@ -149,13 +594,68 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
 
 
+def _queue_payment_initiation(payment, callback_url):
+    """Hand the Chapa initiation call to Celery once the payment row is committed."""
+    def enqueue():
+        try:
+            initiate_payment_task.delay(payment.id, callback_url)
+            logger.info(f"Payment initiation queued for booking {payment.booking_id}")
+        except Exception as e:
+            logger.error(
+                f"Failed to queue payment initiation for booking {payment.booking_id}: {e}"
+            )
+
+    transaction.on_commit(enqueue)
+
+
+def _payment_session(request, payment):
+    """Summary of a payment plus the URL clients poll for its checkout link."""
+    return {
+        "status": payment.status,
+        "booking_reference": payment.booking_reference,
+        "amount": str(payment.amount),
+        "checkout_url": payment.checkout_url,
+        "session_url": request.build_absolute_uri(
+            reverse('payment-session', args=[payment.booking_reference])
+        ),
+    }
+
+
+def _payment_verified_response(payment):
+    return Response(
+        {
+            "status": "success",
+            "payment_status": payment.status,
+            "booking_id": payment.booking_id,
+            "message": "Payment verified successfully",
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+def _gateway_unavailable_response(error_msg, retry_after):
+    """503 for a call turned away before reaching Chapa (busy or circuit open)."""
+    return Response(
+        {
+            "status": "error",
+            "error": error_msg,
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
 @api_view(['GET', 'POST'])
+@throttle_classes([PaymentRateThrottle, PaymentTargetThrottle])
 def verify_payment(request):
     """
     Verify payment status with Chapa API.
     
     GET /api/payments/verify/?tx_ref=<transaction_reference>
     POST /api/payments/verify/ (for webhook callbacks)
+
+    Throttled per client IP and per tx_ref (429 with Retry-After); 503
+    with Retry-After when the gateway is saturated or its circuit is open.
     """
     tx_ref = request.GET.get('tx_ref') or request.data.get('tx_ref')
     
@@ -175,48 +675,52 @@ def verify_payment(request):
             status=status.HTTP_404_NOT_FOUND,
         )
     
-    # Verify payment with Chapa
-    verification_result = verify_chapa_payment(tx_ref)
+    # Completed is terminal: repeated webhooks and page refreshes need no upstream call
+    if payment.status == Payment.Status.COMPLETED:
+        return _payment_verified_response(payment)
+
+    # Verify payment with Chapa (deduplicated per tx_ref)
+    verification_result = verify_chapa_payment_cached(tx_ref)
     
     if verification_result.get("success"):
         payment_status = verification_result.get("status", "").lower()
         
         # Update payment status based on Chapa response
         if payment_status == "success":
-            payment.status = Payment.Status.COMPLETED
-            payment.transaction_id = verification_result.get("data", {}).get("id", tx_ref)
-            payment.save()
+            transaction_id = verification_result.get("data", {}).get("id", tx_ref)
             
-            # Update booking status to confirmed
-            booking = payment.booking
-            booking.status = Booking.Status.CONFIRMED
-            booking.save()
+            # Only the caller that performs the transition queues the email
+            if payment.mark_completed(transaction_id):
+                try:
+                    queue_confirmation_email(payment.booking_id)
+                    logger.info(
+                        f"Booking confirmation email queued for booking {payment.booking_id}"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to queue confirmation email: {e}")
+            else:
+                payment.refresh_from_db(fields=["status", "transaction_id"])
             
-            # Send confirmation email asynchronously
-            try:
-                send_booking_confirmation_email.delay(booking.id)
-                logger.info(f"Booking confirmation email queued for booking {booking.id}")
-            except Exception as e:
-                logger.error(f"Failed to queue confirmation email: {e}")
+            return _payment_verified_response(payment)
+        elif payment_status in FAILED_STATUSES:
+            payment.mark_failed()
+            payment.refresh_from_db(fields=["status"])
             
             return Response(
                 {
-                    "status": "success",
+                    "status": "failed",
                     "payment_status": payment.status,
-                    "booking_id": booking.id,
-                    "message": "Payment verified successfully",
+                    "message": "Payment verification failed",
                 },
                 status=status.HTTP_200_OK,
             )
         else:
-            payment.status = Payment.Status.FAILED
-            payment.save()
-            
+            # Not paid yet; the payment stays PENDING for a later callback or poll
             return Response(
                 {
-                    "status": "failed",
+                    "status": "pending",
                     "payment_status": payment.status,
-                    "message": "Payment verification failed",
+                    "message": "Payment not completed yet",
                 },
                 status=status.HTTP_200_OK,
             )
@@ -224,6 +728,9 @@ def verify_payment(request):
         error_msg = verification_result.get("error", "Payment verification failed")
         logger.error(f"Payment verification error for tx_ref {tx_ref}: {error_msg}")
         
+        if verification_result.get("retry_after"):
+            return _gateway_unavailable_response(error_msg, verification_result["retry_after"])
+
         return Response(
             {
                 "status": "error",
@@ -234,14 +741,26 @@ def verify_payment(request):
 
 
 @api_view(['POST'])
+@throttle_classes([PaymentRateThrottle, PaymentTargetThrottle])
 def initiate_payment(request, booking_id):
     """
     Initiate payment for an existing booking.
     
     POST /api/bookings/{booking_id}/initiate-payment/
+
+    Throttled per client IP and per booking (429 with Retry-After); 503
+    with Retry-After when the gateway is saturated or its circuit is open,
+    leaving the payment as it was.
     """
     booking = get_object_or_404(Booking, id=booking_id)
     
+    # Includes bookings whose hold expired unpaid; their nights may be gone
+    if booking.status == Booking.Status.CANCELLED:
+        return Response(
+            {"error": "Booking is cancelled"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
     # Check if payment already exists
     payment, created = Payment.objects.get_or_create(
         booking=booking,
@@ -258,28 +777,35 @@ def initiate_payment(request, booking_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
     
-    # Prepare customer name for Chapa
-    guest_name_parts = booking.guest_name.split(maxsplit=1)
-    first_name = guest_name_parts[0] if guest_name_parts else booking.guest_name
-    last_name = guest_name_parts[1] if len(guest_name_parts) > 1 else ""
-    
     # Build callback URL
-    callback_url = request.build_absolute_uri(f"/api/payments/verify/")
+    callback_url = request.build_absolute_uri("/api/payments/verify/")
+
+    if settings.CHAPA_ASYNC_INITIATION:
+        payment.status = Payment.Status.PENDING
+        payment.checkout_url = None
+        payment.save(update_fields=["status", "checkout_url", "updated_at"])
+        _queue_payment_initiation(payment, callback_url)
+        session = _payment_session(request, payment)
+        return Response(
+            {
+                "status": "accepted",
+                "payment": session,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": session["session_url"]},
+        )
     
     # Initiate payment with Chapa
-    payment_result = initiate_chapa_payment(
-        amount=float(booking.total_price),
-        email=booking.guest_email,
-        first_name=first_name,
-        last_name=last_name,
-        tx_ref=payment.booking_reference,
-        callback_url=callback_url,
-    )
+    payment_result = initiate_booking_payment(payment, callback_url)
     
     if payment_result.get("success"):
         checkout_url = payment_result.get("checkout_url")
         logger.info(f"Payment initiated for booking {booking.id}, checkout URL: {checkout_url}")
         
+        payment.status = Payment.Status.PENDING
+        payment.checkout_url = checkout_url
+        payment.save(update_fields=["status", "checkout_url", "updated_at"])
+
         return Response(
             {
                 "status": "success",
@@ -295,6 +821,10 @@ def initiate_payment(request, booking_id):
         error_msg = payment_result.get("error", "Failed to initiate payment")
         logger.error(f"Payment initiation failed for booking {booking.id}: {error_msg}")
         
+        if payment_result.get("retry_after"):
+            # Never reached Chapa: nothing failed, the client should just retry
+            return _gateway_unavailable_response(error_msg, payment_result["retry_after"])
+
         payment.status = Payment.Status.FAILED
         payment.save()
         
@@ -306,3 +836,21 @@ def initiate_payment(request, booking_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+
+@api_view(['GET'])
+def payment_session(request, booking_reference):
+    """
+    Poll a payment's checkout session.
+
+    GET /api/payments/{booking_reference}/
+
+    While initiation is still running the payment is PENDING with no
+    checkout_url, and a Retry-After header suggests when to poll again.
+    """
+    payment = get_object_or_404(Payment, booking_reference=booking_reference)
+
+    headers = {}
+    if payment.status == Payment.Status.PENDING and not payment.checkout_url:
+        headers["Retry-After"] = "1"
+
+    return Response(PaymentSerializer(payment).data, headers=headers)